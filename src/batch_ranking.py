@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import glob
+import numpy as np
+import os
+import pandas as pd
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from data_loading import survey_PCMs
+from decision_making import AHP, TOPSIS_statistics, merge_TOPSIS_statistics, TOPSIS_statistics_parameters
+from decision_making import TOPSIS_closeness, top_k
+from result_sink import ResultSink
+
+dataset_extensions = (".csv", ".txt", ".parquet")
+
+# =============================================================================
+# Regional Datasets
+# =============================================================================
+def discover_datasets(directory):
+    """
+    Find performance datasets (one per region) in a directory.
+    """
+    return sorted(file_path for file_path in glob.glob(os.path.join(directory, "*")) if file_path.endswith(dataset_extensions))
+
+
+def load_region(file_path, criteria, constraints):
+    """
+    Load the selected criteria and community names of a regional dataset and
+    keep the locations that satisfy all constraints (criterion, lower bound,
+    upper bound; missing bounds are not applied).
+    Returns the decision matrix (a data frame) and community names.
+    """
+    columns = list(dict.fromkeys(list(criteria) + ["community_name"] + [constraint[0] for constraint in constraints]))
+    if file_path.endswith(".parquet"):
+        data = pd.read_parquet(file_path, columns=columns)
+    else:
+        data = pd.read_csv(file_path, usecols=lambda column: column in columns)
+    kept = np.ones(len(data), dtype=bool)
+    for criterion, lower, upper in constraints:
+        if not pd.isna(lower):
+            kept &= (data[criterion] >= lower).to_numpy()
+        if not pd.isna(upper):
+            kept &= (data[criterion] <= upper).to_numpy()
+    data = data[kept]
+    return data[criteria].astype(float), data["community_name"]
+
+
+def load_constraints(file_path):
+    """
+    Load constraints in the format of the constraints file (criteria,
+    restrict_values_lower_than, restrict_values_greater_than).
+    """
+    constraints = pd.read_csv(file_path)
+    return list(zip(constraints["criteria"], constraints["restrict_values_lower_than"], constraints["restrict_values_greater_than"]))
+
+# =============================================================================
+# Region Workers
+# =============================================================================
+def limit_memory(memory_limit):
+    """
+    Limit the address space of a worker process (in bytes), so that a region
+    that does not fit fails with MemoryError instead of exhausting the node.
+    Limits are not supported on Windows.
+    """
+    if memory_limit is not None and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def region_statistics(task):
+    """
+    Column statistics of the decision matrix of a region (first pass).
+    """
+    file_path, criteria, constraints = task
+    selected_data, _ = load_region(file_path, criteria, constraints)
+    return TOPSIS_statistics([selected_data.to_numpy()], len(criteria)), len(selected_data)
+
+
+def rank_region(task):
+    """
+    Score locations of a region with TOPSIS parameters of all regions together
+    (second pass), and return the k best locations of the region.
+    """
+    file_path, criteria, constraints, weights, parameters, k = task
+    selected_data, communities = load_region(file_path, criteria, constraints)
+    scores = TOPSIS_closeness(selected_data.to_numpy(), weights, *parameters)
+    positions, scores = top_k(scores, len(scores) if k is None else k)
+    result = selected_data.iloc[positions].copy()
+    result["Ranking"] = scores
+    result["community_name"] = communities.iloc[positions].to_numpy()
+    result["region_rank"] = np.arange(1, len(positions) + 1)
+    return result
+
+
+def map_regions(function, tasks, workers, memory_limit):
+    """
+    Apply function to tasks of regions in a pool of processes with limited
+    memory. A worker that exceeds its limit in native code may be terminated,
+    which breaks the pool, so regions of a broken pool are retried one by one
+    in separate pools to find the failing region.
+    Returns results and errors of regions, both keyed by region.
+    """
+    results, errors = {}, {}
+    broken = run_pool(function, tasks, workers, memory_limit, results, errors, len(tasks))
+    for region in broken:
+        if run_pool(function, {region: tasks[region]}, 1, memory_limit, results, errors, len(tasks)):
+            errors[region] = "worker process was terminated (memory limit exceeded)"
+    print()
+    return results, errors
+
+
+def run_pool(function, tasks, workers, memory_limit, results, errors, total):
+    broken = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=limit_memory, initargs=(memory_limit,)) as executor:
+        futures = {executor.submit(function, task): region for region, task in tasks.items()}
+        for future in as_completed(futures):
+            region = futures[future]
+            try:
+                results[region] = future.result()
+            except BrokenProcessPool:
+                broken.append(region)
+            except MemoryError:
+                errors[region] = "memory limit exceeded"
+            except Exception as e:
+                errors[region] = str(e) or type(e).__name__
+            print(f"\r{len(results) + len(errors)}/{total} regions processed", end="", flush=True)
+    return broken
+
+# =============================================================================
+# Multi-Region Batch Ranking
+# =============================================================================
+def batch_ranking(file_paths, criteria, types, weights, constraints=(), k=10, workers=None, memory_limit=None):
+    """
+    Rank locations of many regional datasets together, processing regions
+    concurrently. TOPSIS parameters are merged from column statistics of all
+    regions (first pass), so that scores of all regions are comparable, and
+    the same as if all regions were ranked as one dataset. Each region is then
+    scored with the merged parameters and keeps its k best locations (second
+    pass), which are merged into a cross-region leaderboard. Criteria that
+    are constant in all regions are removed, and weights of the other criteria
+    are renormalized.
+    Returns the leaderboard, the ranked criteria and their weights, and the
+    errors of regions that failed.
+    """
+    regions = {os.path.splitext(os.path.basename(file_path))[0]: file_path for file_path in file_paths}
+    constraints = list(constraints)
+    statistics, errors = map_regions(region_statistics, {region: (file_path, criteria, constraints) for region, file_path in regions.items()},
+                                     workers, memory_limit)
+    statistics = {region: result for region, result in statistics.items() if result[1] > 0}
+    if not statistics:
+        return None, criteria, weights, errors
+    merged_statistics = merge_TOPSIS_statistics([result[0] for result in statistics.values()])
+    # Criteria that are constant in all regions (e.g. restricted to one value) do not discriminate locations
+    kept = np.flatnonzero(merged_statistics[1] > merged_statistics[2])
+    if len(kept) < len(criteria):
+        print(f"Constant criteria removed from the ranking: {', '.join(criteria[i] for i in range(len(criteria)) if i not in kept)}")
+        if not len(kept):
+            return None, criteria, weights, errors
+        criteria, types = [criteria[i] for i in kept], [types[i] for i in kept]
+        weights = np.asarray(weights, dtype=float)[kept] / np.sum(np.asarray(weights, dtype=float)[kept])
+        merged_statistics = tuple(statistic[kept] for statistic in merged_statistics)
+    parameters = TOPSIS_statistics_parameters(merged_statistics, weights, types)
+
+    tasks = {region: (regions[region], criteria, constraints, weights, parameters, k) for region in statistics}
+    rankings, rank_errors = map_regions(rank_region, tasks, workers, memory_limit)
+    errors.update(rank_errors)
+    if not rankings:
+        return None, criteria, weights, errors
+
+    leaderboard = pd.concat([ranking.assign(region=region) for region, ranking in rankings.items()])
+    leaderboard = leaderboard.rename_axis("site_index").sort_values(["Ranking", "region"], ascending=[False, True], kind="stable")
+    leaderboard["rank"] = np.arange(1, len(leaderboard) + 1)
+    return leaderboard, criteria, weights, errors
+
+
+def run_batch(directory, criteria_path, constraints_path=None, survey_path=None, k=10, workers=None,
+              memory_limit=None, output_format="parquet", output_directory="results"):
+    """
+    Batch mode: rank all regional datasets of a directory with the criteria
+    file, optional constraints file and optional survey file (equal weights
+    otherwise), and save the cross-region leaderboard.
+    """
+    start_time = time.perf_counter()
+    file_paths = discover_datasets(directory)
+    if not file_paths:
+        print(f"\nNo datasets found in {directory}.")
+        return None
+    selection = pd.read_csv(criteria_path)
+    criteria, types = list(selection["criteria"]), list(selection["type"])
+    constraints = load_constraints(constraints_path) if constraints_path is not None else []
+    if survey_path is not None:
+        PCMs, _ = survey_PCMs(pd.read_csv(survey_path), criteria)
+        if PCMs is None:
+            print("\nNo complete survey responses were found for the selected criteria.")
+            return None
+        weights = AHP(list(PCMs))
+    else:
+        weights = np.zeros(len(criteria)) + (1. / len(criteria))
+    print(f"\nRanking {len(file_paths)} regional datasets with {len(criteria)} criteria...")
+
+    leaderboard, criteria, weights, errors = batch_ranking(file_paths, criteria, types, weights, constraints, k, workers,
+                                        None if memory_limit is None else int(memory_limit * 2**20))
+    for region, error in errors.items():
+        print(f"Region {region} failed: {error}")
+    if leaderboard is None:
+        print("\nBatch ranking was unsuccessful.")
+        return None
+
+    sink = ResultSink(output_directory, output_format)
+    path = sink.save("leaderboard", leaderboard, {"criteria": criteria, "weights": list(np.asarray(weights, dtype=float)),
+                                                  "k": k, "regions": len(file_paths), "failed_regions": sorted(errors)})
+    print(f"\nBest ranked locations across regions:\n{leaderboard[['region', 'community_name', 'Ranking', 'region_rank']].head(10)}")
+    sink.close()
+    if path not in sink.saved:
+        print("\nSaving the leaderboard was unsuccessful.")
+        return None
+    print(f"\nLeaderboard of {len(leaderboard)} locations from {len(file_paths) - len(errors)} regions saved to {path} "
+          f"in {time.perf_counter() - start_time:.1f} s.")
+    return leaderboard
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+import numpy as np
+import pandas as pd
+
+from decision_making import AHP_weights, hierarchical_AHP_weights, batch_TOPSIS, compute_dtype
+from ranking_comparison import compare_rankings, comparison_matrix
+
+# =============================================================================
+# Stakeholder Group Weights
+# =============================================================================
+def stakeholder_weights(PCMs, repair=True):
+    """
+    Criteria weights of every stakeholder from their pairwise comparison
+    matrices (or hierarchical pairwise comparison matrices), for all
+    stakeholders at once. Returns weights of shape (stakeholders, criteria)
+    and a mask of stakeholders whose judgements are accepted (consistent or
+    repaired).
+    """
+    if isinstance(PCMs, dict):
+        weights, _, accepted = hierarchical_AHP_weights(PCMs, repair)
+    else:
+        _, weights, _, consistent, repaired = AHP_weights(np.array(PCMs, dtype=float), repair)
+        accepted = consistent | repaired
+    return weights, accepted
+
+
+def group_weights(weights, groups, accepted, criteria):
+    """
+    Criteria weights of every stakeholder group (mean weights of its accepted
+    stakeholders), with the number of stakeholders of the group and the
+    largest standard deviation of a criterion weight within the group.
+    """
+    accepted_weights = pd.DataFrame(weights[accepted], columns=criteria)
+    grouped = accepted_weights.groupby(np.asarray(groups)[accepted], sort=False)
+    result = grouped.mean()
+    result["stakeholders"] = grouped.size()
+    result["max_weight_std"] = grouped.std(ddof=0).max(axis=1)
+    return result.rename_axis("group")
+
+# =============================================================================
+# Group Rankings
+# =============================================================================
+def group_scores(data, weights, types, group_chunk=None):
+    """
+    TOPSIS scores of all alternatives under the weights of every group
+    (groups x criteria), with weights of group_chunk groups at once (all
+    groups by default) broadcast against the decision matrix.
+    Returns scores of shape (groups, alternatives).
+    """
+    X = data.to_numpy(dtype=compute_dtype(data))
+    weights = np.asarray(weights, dtype=float)
+    if group_chunk is None:
+        group_chunk = len(weights)
+    scores = np.empty((len(weights), len(X)))
+    for start in range(0, len(weights), group_chunk):
+        scores[start:start+group_chunk] = batch_TOPSIS(X, weights[start:start+group_chunk, None, :], types)
+    return scores
+
+
+def group_ranks(scores):
+    """
+    Ranks of alternatives under every group's weights (1 is the best), from
+    scores of shape (groups, alternatives).
+    """
+    order = np.argsort(-scores, axis=1, kind="stable")
+    ranks = np.empty(scores.shape, dtype=np.int64)
+    ranks[np.arange(len(scores))[:, None], order] = np.arange(1, scores.shape[1] + 1)
+    return ranks
+
+
+def compromise_candidates(ranks, index, names, k=10):
+    """
+    Alternatives that every group ranks highly: the k alternatives with the
+    best worst rank over groups (ties by mean rank), with their rank under
+    every group's weights and whether they are among the k best of every
+    group.
+    """
+    worst_rank = ranks.max(axis=0)
+    mean_rank = ranks.mean(axis=0)
+    positions = np.lexsort((mean_rank, worst_rank))[:k]
+    result = pd.DataFrame(ranks[:, positions].T, index=index[positions], columns=[f"{name}_rank" for name in names])
+    result["worst_rank"] = worst_rank[positions]
+    result["mean_rank"] = mean_rank[positions]
+    result["top_k_in_all_groups"] = worst_rank[positions] <= k
+    return result
+
+# =============================================================================
+# Consensus and Conflict Analysis
+# =============================================================================
+def consensus_analysis(data, PCMs, groups, criteria, types, k=10, group_chunk=None, workers=None):
+    """
+    Consensus and conflict between stakeholder groups in one pass: weights of
+    all stakeholders are calculated at once and averaged per group, all
+    alternatives are ranked under every group's weights at once, and group
+    rankings are compared pairwise. Conflict of two groups is the share of
+    discordant pairs of alternatives, (1 - Kendall tau) / 2.
+    Returns a dictionary of stakeholder weights (with their group and whether
+    their judgements are accepted), group weights, the k best alternatives of
+    every group, pairwise group comparisons and compromise candidates.
+    """
+    weights, accepted = stakeholder_weights(PCMs)
+    weights_of_stakeholders = pd.DataFrame(weights, columns=criteria).rename_axis("stakeholder")
+    weights_of_stakeholders["group"] = np.asarray(groups)
+    weights_of_stakeholders["accepted"] = accepted
+    weights_of_groups = group_weights(weights, groups, accepted, criteria)
+    names = list(weights_of_groups.index)
+    scores = group_scores(data, weights_of_groups[criteria].to_numpy(), types, group_chunk)
+    ranks = group_ranks(scores)
+
+    top_k_tables = []
+    for g, name in enumerate(names):
+        positions = np.flatnonzero(ranks[g] <= k)
+        positions = positions[np.argsort(ranks[g, positions])]
+        top_k_tables.append(pd.DataFrame({"group": name, "group_rank": ranks[g, positions], "Ranking": scores[g, positions]},
+                                         index=data.index[positions]))
+    group_top_k = pd.concat(top_k_tables).rename_axis("site_index")
+
+    if len(names) > 1:
+        comparison = compare_rankings({name: pd.Series(scores[g], index=data.index) for g, name in enumerate(names)}, k,
+                                      workers=workers).rename_axis("pair")
+        comparison["conflict"] = (1 - comparison["kendall_tau"]) / 2
+        # The comparison matrix has ones on its diagonal, a group does not conflict with itself
+        conflict = comparison_matrix(comparison, "conflict") - np.eye(len(names))
+    else:
+        comparison, conflict = None, None
+    return {"stakeholder_weights": weights_of_stakeholders,
+            "group_weights": weights_of_groups,
+            "group_top_k": group_top_k,
+            "group_conflict": comparison,
+            "conflict_matrix": conflict,
+            "compromise": compromise_candidates(ranks, data.index, names, k)}
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# Streaming Criteria Dependence
+# =============================================================================
+def chunks(data, criteria, chunk_size):
+    for start in range(0, len(data), chunk_size):
+        yield data[criteria].iloc[start:start+chunk_size].to_numpy(dtype=float)
+
+
+def streaming_correlation(data, criteria, chunk_size=100000):
+    """
+    Pearson correlation matrix of criteria, accumulated over chunks of rows
+    from sums of values and cross-products (shifted by the first row to keep
+    precision). Also returns the minimum and maximum of every criterion.
+    Constant criteria have zero correlation with all other criteria.
+    """
+    criteria_num = len(criteria)
+    count = 0
+    shift = None
+    sums = np.zeros(criteria_num)
+    cross_products = np.zeros((criteria_num, criteria_num))
+    min_values = np.full(criteria_num, np.inf)
+    max_values = np.full(criteria_num, -np.inf)
+    for X in chunks(data, criteria, chunk_size):
+        if shift is None:
+            shift = X[0].copy()
+        X = X - shift
+        count += len(X)
+        sums += X.sum(axis=0)
+        cross_products += X.T @ X
+        min_values = np.minimum(min_values, X.min(axis=0) + shift)
+        max_values = np.maximum(max_values, X.max(axis=0) + shift)
+
+    covariance = (cross_products - np.outer(sums, sums) / count) / max(count - 1, 1)
+    deviations = np.sqrt(np.maximum(np.diag(covariance), 0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = covariance / np.outer(deviations, deviations)
+    correlation[~np.isfinite(correlation)] = 0.
+    np.fill_diagonal(correlation, 1.)
+    return np.clip(correlation, -1, 1), min_values, max_values
+
+
+def streaming_mutual_information(data, criteria, min_values, max_values, bins=None, chunk_size=100000):
+    """
+    Normalized mutual information of criteria pairs (0 is independent, 1 is
+    fully dependent), from joint histograms of equal-width bins accumulated
+    over chunks of rows. Unlike correlation, it also detects non-linear and
+    non-monotonic dependence. Mutual information is normalized by the smaller
+    entropy of the pair. By default, the number of bins grows with the number
+    of rows (up to 16), which keeps the estimate of independent criteria close
+    to zero for small datasets.
+    """
+    criteria_num = len(criteria)
+    if bins is None:
+        bins = int(np.clip(np.sqrt(len(data) / 10), 2, 16))
+    value_range = np.where(max_values > min_values, max_values - min_values, 1.)
+    pairs = [(i, j) for i in range(criteria_num) for j in range(i + 1, criteria_num)]
+    joint_counts = np.zeros((len(pairs), bins * bins))
+    for X in chunks(data, criteria, chunk_size):
+        codes = np.clip(((X - min_values) / value_range * bins).astype(np.int64), 0, bins - 1)
+        for p, (i, j) in enumerate(pairs):
+            joint_counts[p] += np.bincount(codes[:, i] * bins + codes[:, j], minlength=bins * bins)
+
+    mutual_information = np.eye(criteria_num)
+    for p, (i, j) in enumerate(pairs):
+        joint = joint_counts[p].reshape(bins, bins) / joint_counts[p].sum()
+        marginal_i, marginal_j = joint.sum(axis=1), joint.sum(axis=0)
+        nonzero = joint > 0
+        information = np.sum(joint[nonzero] * np.log(joint[nonzero] / np.outer(marginal_i, marginal_j)[nonzero]))
+        entropy = min(entropy_of(marginal_i), entropy_of(marginal_j))
+        mutual_information[i, j] = mutual_information[j, i] = information / entropy if entropy > 0 else 0.
+    return np.clip(mutual_information, 0, 1)
+
+
+def entropy_of(probabilities):
+    probabilities = probabilities[probabilities > 0]
+    return -np.sum(probabilities * np.log(probabilities))
+
+# =============================================================================
+# Redundant Criteria Clustering
+# =============================================================================
+def redundancy_clusters(similarity, threshold):
+    """
+    Cluster criteria with complete linkage: clusters are merged, most similar
+    pairs first, only while every pair of criteria in the merged cluster is at
+    least threshold similar. This avoids chaining weakly related criteria
+    through intermediate ones.
+    Returns a list of clusters (lists of criteria positions).
+    """
+    criteria_num = len(similarity)
+    cluster_of = np.arange(criteria_num)
+    i, j = np.triu_indices(criteria_num, 1)
+    for p in np.argsort(-similarity[i, j], kind="stable"):
+        if similarity[i[p], j[p]] < threshold:
+            break
+        a, b = cluster_of[i[p]], cluster_of[j[p]]
+        if a == b:
+            continue
+        members_a, members_b = np.flatnonzero(cluster_of == a), np.flatnonzero(cluster_of == b)
+        if np.all(similarity[np.ix_(members_a, members_b)] >= threshold):
+            cluster_of[members_b] = a
+    return [list(np.flatnonzero(cluster_of == c)) for c in pd.unique(cluster_of)]
+
+
+def reduce_criteria(data, criteria, types, threshold=0.8, bins=None, chunk_size=100000):
+    """
+    Detect redundant criteria and propose a reduced criteria set. Dependence
+    of two criteria is the larger of their absolute correlation and their
+    normalized mutual information. In every cluster of redundant criteria, the
+    criterion most dependent on the others is kept as its representative.
+    Returns the reduced criteria and types (in the original order), and a
+    report data frame with the cluster and the representative of every
+    criterion.
+    """
+    correlation, min_values, max_values = streaming_correlation(data, criteria, chunk_size)
+    mutual_information = streaming_mutual_information(data, criteria, min_values, max_values, bins, chunk_size)
+    similarity = np.maximum(np.abs(correlation), mutual_information)
+
+    representative = np.arange(len(criteria))
+    cluster_num = np.zeros(len(criteria), dtype=np.int64)
+    for c, cluster in enumerate(redundancy_clusters(similarity, threshold)):
+        central = cluster[np.argmax(similarity[np.ix_(cluster, cluster)].sum(axis=1))]
+        representative[cluster] = central
+        cluster_num[cluster] = c
+
+    kept = np.flatnonzero(representative == np.arange(len(criteria)))
+    report = pd.DataFrame({"cluster": cluster_num,
+                           "representative": [criteria[r] for r in representative],
+                           "max_correlation": np.max(np.abs(correlation) - np.eye(len(criteria)), axis=1),
+                           "max_mutual_information": np.max(mutual_information - np.eye(len(criteria)), axis=1)},
+                          index=criteria)
+    return [criteria[k] for k in kept], [types[k] for k in kept], report
+
+
+def reduction_savings(criteria_num, reduced_criteria_num, alternative_num, weight_range_num=5):
+    """
+    Downstream work before and after criteria reduction: pairwise comparisons
+    per stakeholder, decision matrix values per ranking, and TOPSIS runs of the
+    sensitivity analysis (one per criterion and weight, plus the baseline).
+    """
+    def work(n):
+        return {"pairwise_comparisons": n * (n - 1) // 2,
+                "decision_matrix_values": alternative_num * n,
+                "sensitivity_runs": 1 + weight_range_num * n}
+    savings = pd.DataFrame({"before": work(criteria_num), "after": work(reduced_criteria_num)})
+    savings["saved"] = 1 - savings["after"] / savings["before"]
+    return savings
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+from bisect import bisect_left, bisect_right
+import json
+import numpy as np
+import os
+import pandas as pd
+
+from decision_making import batch_TOPSIS
+
+# =============================================================================
+# Multi-Period Data Cube
+# =============================================================================
+class DataCube:
+    """
+    Time-indexed data cube of criteria values (periods x sites x criteria),
+    stored in a directory as a memory-mapped array that grows by one slice
+    per period (values.dat), together with TOPSIS scores of every period
+    (scores.dat, periods x sites) and metadata (cube.json). Scores are kept
+    for the weights and types they were computed with, so adding a period
+    only scores its own slice, and all periods are re-scored only when the
+    weights change. Periods are kept in time order (see period_order), and a
+    period added before existing periods is inserted between their slices.
+    """
+
+    def __init__(self, directory, sites=None, criteria=None, dtype=np.float64):
+        self.directory = directory
+        self.metadata_path = os.path.join(directory, "cube.json")
+        self.values_path = os.path.join(directory, "values.dat")
+        self.scores_path = os.path.join(directory, "scores.dat")
+        if os.path.exists(self.metadata_path):
+            with open(self.metadata_path) as file:
+                self.metadata = json.load(file)
+            if sites is not None and (pd.Index(sites).tolist() != self.metadata["sites"] or list(criteria) != self.metadata["criteria"]):
+                raise ValueError(f"The data cube in {directory} was created for other locations or criteria.")
+        else:
+            if sites is None or criteria is None:
+                raise ValueError(f"No data cube found in {directory}.")
+            os.makedirs(directory, exist_ok=True)
+            self.metadata = {"sites": pd.Index(sites).tolist(), "criteria": list(criteria), "dtype": np.dtype(dtype).name,
+                             "periods": [], "scored": [], "scoring": None}
+            open(self.values_path, "wb").close()
+            open(self.scores_path, "wb").close()
+            self.save_metadata()
+        self.dtype = np.dtype(self.metadata["dtype"])
+        self.sites = pd.Index(self.metadata["sites"], name="site_index")
+        self.criteria = self.metadata["criteria"]
+
+    @property
+    def periods(self):
+        return list(self.metadata["periods"])
+
+    def save_metadata(self):
+        temporary_path = self.metadata_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(self.metadata, file)
+        os.replace(temporary_path, self.metadata_path)
+
+    def values(self, mode="r"):
+        """
+        Memory-mapped criteria values (periods x sites x criteria).
+        """
+        shape = (len(self.metadata["periods"]), len(self.sites), len(self.criteria))
+        if shape[0] == 0:
+            return np.zeros(shape, dtype=self.dtype)
+        return np.memmap(self.values_path, dtype=self.dtype, mode=mode, shape=shape)
+
+    def stored_scores(self, mode="r"):
+        shape = (len(self.metadata["periods"]), len(self.sites))
+        if shape[0] == 0:
+            return np.zeros(shape)
+        return np.memmap(self.scores_path, dtype=np.float64, mode=mode, shape=shape)
+
+    def add_period(self, period, values):
+        """
+        Add criteria values of a period (sites x criteria), or replace them
+        if the period is already in the cube. Only the slice of the period is
+        written, and only its scores are invalidated.
+        """
+        period = str(period)
+        values = np.ascontiguousarray(values, dtype=self.dtype).reshape(len(self.sites), len(self.criteria))
+        if period in self.metadata["periods"]:
+            p = self.metadata["periods"].index(period)
+            cube = self.values(mode="r+")
+            cube[p] = values
+            cube.flush()
+            del cube
+            self.metadata["scored"][p] = False
+        else:
+            p = bisect_right([period_order(other) for other in self.metadata["periods"]], period_order(period))
+            insert_slice(self.values_path, values, p, len(self.metadata["periods"]))
+            insert_slice(self.scores_path, np.zeros(len(self.sites)), p, len(self.metadata["periods"]))
+            self.metadata["periods"].insert(p, period)
+            self.metadata["scored"].insert(p, False)
+        self.save_metadata()
+
+    def preceding_values(self, period):
+        """
+        Criteria values (sites x criteria) of the last period before the given
+        period, None if there is no earlier period in the cube.
+        """
+        p = bisect_left([period_order(other) for other in self.metadata["periods"]], period_order(str(period)))
+        return np.array(self.values()[p - 1]) if p > 0 else None
+
+    def scores(self, weights, types, memory_limit=2**28):
+        """
+        TOPSIS scores of all periods (periods x sites). Periods without scores
+        for these weights and types are ranked together, in batches of periods
+        whose decision matrices fit in about memory_limit bytes.
+        """
+        scoring = {"weights": [float(weight) for weight in weights], "types": list(types)}
+        if self.metadata["scoring"] != scoring:
+            self.metadata["scoring"] = scoring
+            self.metadata["scored"] = [False] * len(self.metadata["periods"])
+        pending = [p for p, scored in enumerate(self.metadata["scored"]) if not scored]
+        if pending:
+            values = self.values()
+            scores = self.stored_scores(mode="r+")
+            # batch_TOPSIS keeps a few temporary copies of the decision matrices
+            batch_size = max(1, memory_limit // (4 * len(self.sites) * len(self.criteria) * self.dtype.itemsize))
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start+batch_size]
+                scores[batch] = batch_TOPSIS(values[batch], np.asarray(weights, dtype=float), types)
+            scores.flush()
+            del scores
+            for p in pending:
+                self.metadata["scored"][p] = True
+            self.save_metadata()
+        return np.asarray(self.stored_scores())
+
+    def ranks(self, weights, types, memory_limit=2**28):
+        """
+        Rank trajectories: ranks of all sites in every period (1 is the best),
+        as a data frame with periods as rows and sites as columns.
+        """
+        scores = self.scores(weights, types, memory_limit)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        ranks = np.empty(scores.shape, dtype=np.int64)
+        ranks[np.arange(len(scores))[:, None], order] = np.arange(1, len(self.sites) + 1)
+        return pd.DataFrame(ranks, index=pd.Index(self.periods, name="period"), columns=self.sites)
+
+
+def period_order(period):
+    """
+    Sort key of periods: numeric periods (e.g. years) by their value, before
+    other periods (e.g. 2024-03) in text order.
+    """
+    try:
+        return (0, float(period), period)
+    except ValueError:
+        return (1, 0., period)
+
+
+def insert_slice(path, values, position, slice_num):
+    """
+    Insert a slice into a file of slice_num slices of the same shape and
+    type at the given position. The file grows by one slice, and later
+    slices are moved one slice at a time, from the last one.
+    """
+    with open(path, "ab") as file:
+        file.write(values.tobytes())
+    if position < slice_num:
+        slices = np.memmap(path, dtype=values.dtype, mode="r+", shape=(slice_num + 1,) + values.shape)
+        for p in range(slice_num, position, -1):
+            slices[p] = slices[p - 1]
+        slices[position] = values
+        slices.flush()
+        del slices
+
+# =============================================================================
+# Period Data
+# =============================================================================
+def key_positions(site_keys, keys):
+    """
+    Positions of keys (a data frame of key columns) among site keys, -1 for
+    keys that are not found.
+    """
+    if len(site_keys.columns) == 1:
+        return pd.Index(site_keys.iloc[:, 0]).get_indexer(keys.iloc[:, 0])
+    return pd.MultiIndex.from_frame(site_keys).get_indexer(pd.MultiIndex.from_frame(keys))
+
+
+def period_slices(period_data, positions, criteria, base):
+    """
+    Criteria values of every period in the period data (by its period
+    column, in time order), as slices of the data cube. Period data may cover
+    only some sites (positions of its rows among the sites, -1 for unknown
+    sites) and some criteria; other values are carried over from the
+    preceding period, given by base (a function of the period, e.g. the
+    values of the preceding period in the data cube, to which yielded
+    periods are added).
+    Yields the period, its values and the number of matched rows.
+    """
+    columns = [criterion for criterion in criteria if criterion in period_data.columns]
+    column_positions = [criteria.index(column) for column in columns]
+    groups = period_data.groupby(period_data["period"].astype(str)).indices
+    for period in sorted(groups, key=period_order):
+        rows = groups[period][positions[groups[period]] >= 0]
+        values = np.array(base(period), copy=True)
+        values[np.ix_(positions[rows], column_positions)] = period_data.iloc[rows][columns].astype(float).to_numpy()
+        yield period, values, len(rows)
+
+# =============================================================================
+# Ranking Trajectories
+# =============================================================================
+def rank_volatility(ranks):
+    """
+    Statistics of rank trajectories (periods x sites, in time order) of every
+    site: first, last, mean, best and worst rank, standard deviation of the
+    rank, and mean absolute rank change between consecutive periods.
+    """
+    changes = ranks.diff().abs().iloc[1:]
+    return pd.DataFrame({"first_rank": ranks.iloc[0],
+                         "last_rank": ranks.iloc[-1],
+                         "mean_rank": ranks.mean(),
+                         "best_rank": ranks.min(),
+                         "worst_rank": ranks.max(),
+                         "rank_std": ranks.std(ddof=0),
+                         "mean_rank_change": changes.mean() if len(changes) else 0.})
+
+
+def persistent_top_k(ranks, k, min_share=1.):
+    """
+    Sites that are among the k best ranked sites in at least min_share of
+    periods (in all periods by default), with the share of periods.
+    """
+    share = (ranks <= k).mean()
+    persistent = share[share >= min_share]
+    return pd.DataFrame({"top_k_share": persistent, "mean_rank": ranks[persistent.index].mean()}).sort_values(
+        ["top_k_share", "mean_rank"], ascending=[False, True])
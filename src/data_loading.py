@@ -3,9 +3,13 @@
 @author: Aneta Kartali
 """
 
+import numpy as np
 import pandas as pd
 
-from messages import invalid_input_message, load_file_message
+from messages import invalid_input_message, load_file_message, survey_message, proximity_message
+from messages import update_message
+from pairwise_comparison import saaty_round
+from spatial import ProximityCriteria, coordinate_columns, cKDTree
 
 # =============================================================================
 # Data Loading
@@ -38,7 +42,16 @@ def load_file():
 # =============================================================================
 # Data Updating
 # =============================================================================
-def update_data(data):
+def update_data(data, key_index=None, proximity=None):
+    """
+    Load new data, or upsert an update into the existing data by site key.
+    The key index of the data and its proximity criteria are kept between
+    updates, so that they do not have to be built again for every update:
+    only inserted locations and locations with changed coordinates are
+    queried against the spatial indexes.
+    Returns the data, its key index and proximity criteria (None for new
+    data) and the change set (None if the data was not updated).
+    """
     while(True):
         print("1. Load New Data")
         print("2. Update Existing Data")
@@ -47,16 +60,430 @@ def update_data(data):
         
         if sub_choice == "1":
             updated_data = load_file()
-            return updated_data
+            if updated_data is None:
+                return data, key_index, proximity, None
+            return updated_data, None, None, None
         if sub_choice == "2":
+            print(update_message())
+            default_key = ["site_id"] if "site_id" in data.columns else ["site_index"]
+            key = input(f"Please enter the site key column(s), separated by a comma (press Enter for {', '.join(default_key)}): ")
+            key = [column.strip() for column in key.split(",")] if key.strip() != "" else default_key
             update = load_file()
+            if update is None:
+                return data, key_index, proximity, None
             try:
-                updated_data = pd.concat([data, update], ignore_index=True, sort=False)
-                return updated_data
+                if key_index is None or key_index.key != key:
+                    key_index = KeyIndex(data, key)
+                updated_data, change_set = key_index.upsert(data, update)
+                if proximity is not None:
+                    updated_data = update_proximity_criteria(proximity, data, updated_data, change_set)
+                print_change_set(change_set)
+                return updated_data, key_index, proximity, change_set
             except Exception as e:
                 print(f"\nAn error occurred: {str(e)}")
-                return data
+                return data, key_index, proximity, None
         elif sub_choice == "3":
-            return data
+            return data, key_index, proximity, None
         else:
-            print(invalid_input_message())
\ No newline at end of file
+            print(invalid_input_message())
+
+
+def print_change_set(change_set):
+    print(f"\nData updated successfully: {len(change_set['updated'])} locations updated, "
+          f"{len(change_set['inserted'])} inserted, {len(change_set['deleted'])} deleted, "
+          f"{change_set['unchanged']} unchanged.")
+    if change_set["columns"]:
+        print(f"Updated criteria: {change_set['columns']}")
+
+# =============================================================================
+# Site Key Index
+# =============================================================================
+def key_values(data, key, positions=None):
+    """
+    Key columns of the data (of rows at the given positions only, if given).
+    Key "site_index" refers to the row labels of the data, unless the data has
+    a site_index column (e.g. a saved result).
+    """
+    if key == ["site_index"] and "site_index" not in data.columns:
+        return pd.DataFrame({"site_index": data.index if positions is None else data.index[positions]})
+    missing = [column for column in key if column not in data.columns]
+    if missing:
+        raise KeyError(f"Site key columns {missing} not found.")
+    if positions is None:
+        return data[key].reset_index(drop=True)
+    return data.iloc[positions, data.columns.get_indexer(key)].reset_index(drop=True)
+
+
+def key_hashes(keys):
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def common_dtype(values, new_values):
+    """
+    Type of a column that holds both its values and new values (object if
+    they have no common numeric type).
+    """
+    try:
+        return np.result_type(values.dtype, new_values.dtype)
+    except TypeError:
+        return object
+
+
+class KeyIndex:
+    """
+    Hash index of locations by their site key, with 64-bit hashes of the key
+    columns mapped to row positions of the data. Keys of inserted locations
+    are kept in a small delta index, and deleted locations are marked with
+    position -1, so the main hash table is only built again when the delta
+    index grows beyond rebuild_ratio of the data. Looking up an update of u
+    locations costs O(u), no matter how large the data is. Applying it to
+    the data costs O(N) in the number of locations N, since pandas columns
+    are contiguous: every changed column is copied, and inserts and deletes
+    copy the data once.
+    """
+
+    def __init__(self, data, key, rebuild_ratio=0.1):
+        self.key = list(key)
+        self.rebuild_ratio = rebuild_ratio
+        self.build(data)
+
+    def build(self, data):
+        keys = key_values(data, self.key)
+        self.dtypes = keys.dtypes.to_dict()
+        self.hashes = pd.Index(key_hashes(keys))
+        if not self.hashes.is_unique:
+            raise ValueError(f"Site key {self.key} is not unique in the data.")
+        self.positions = np.arange(len(data))
+        self.delta_hashes = pd.Index(np.zeros(0, dtype=np.uint64))
+        self.delta_positions = np.zeros(0, dtype=np.int64)
+
+    def lookup(self, hashes):
+        """
+        Row positions of locations with the given key hashes (-1 if not found).
+        Newer entries of the delta index take precedence.
+        """
+        positions = np.full(len(hashes), -1, dtype=np.int64)
+        delta = self.delta_hashes.get_indexer(hashes)
+        positions[delta >= 0] = self.delta_positions[delta[delta >= 0]]
+        missing = delta < 0
+        main = self.hashes.get_indexer(hashes[missing])
+        positions[np.flatnonzero(missing)[main >= 0]] = self.positions[main[main >= 0]]
+        return positions
+
+    def upsert(self, data, update):
+        """
+        Apply an update to the data: locations with a known key are updated
+        in place (only criteria present in the update), locations with a new
+        key are inserted, and locations with a true value in the optional
+        "delete" column are deleted. Repeated keys in the update keep their
+        last row. The data is not modified: changed columns are copied (and
+        upcast to a type that holds the new values), and the updated data and
+        the index are only replaced once all steps have succeeded.
+        Returns the updated data and the change set: row labels of updated
+        (with changed values), inserted and deleted locations, the number of
+        unchanged locations and the updated criteria.
+        """
+        update = update.loc[~key_values(update, self.key).duplicated(keep="last").to_numpy()]
+        keys = key_values(update, self.key).astype(self.dtypes)
+        hashes = key_hashes(keys)
+        positions = self.lookup(hashes)
+        found = positions >= 0
+        if found.any() and not np.array_equal(key_values(data, self.key, positions[found]).to_numpy(), keys[found].to_numpy()):
+            raise ValueError("Site key hash collision. Please use another site key.")
+        delete = np.zeros(len(update), dtype=bool)
+        if "delete" in update.columns:
+            delete = update["delete"].fillna(False).astype(bool).to_numpy()
+        columns = [column for column in update.columns if column in data.columns and column not in self.key]
+        
+        # Merge: assign changed values of known locations to copies of the
+        # changed columns
+        result = data.copy(deep=False)
+        merged = found & ~delete
+        merge_positions = positions[merged]
+        changed = np.zeros(len(merge_positions), dtype=bool)
+        changed_columns = []
+        for column in columns:
+            j = data.columns.get_loc(column)
+            old_values = data.iloc[merge_positions, j].to_numpy()
+            new_values = update[column].to_numpy()[merged]
+            differs = ~((old_values == new_values) | (pd.isna(old_values) & pd.isna(new_values)))
+            if differs.any():
+                values = data.iloc[:, j].to_numpy()
+                values = values.astype(common_dtype(values, new_values))
+                values[merge_positions[differs]] = new_values[differs]
+                result[column] = values
+                changed |= differs
+                changed_columns.append(column)
+        updated_labels = data.index[merge_positions[changed]]
+        
+        # Insert: append locations with new keys, with new row labels (or the
+        # given labels, if locations are keyed by site_index)
+        inserted = ~found & ~delete
+        inserts = update.loc[inserted, [column for column in data.columns if column in update.columns]]
+        if self.key == ["site_index"] and "site_index" in update.columns:
+            inserts.index = pd.Index(update.loc[inserted, "site_index"].to_numpy())
+        else:
+            next_label = data.index.max() + 1 if len(data) else 0
+            inserts.index = pd.RangeIndex(next_label, next_label + len(inserts))
+        if len(inserts):
+            insert_positions = np.arange(len(result), len(result) + len(inserts))
+            result = pd.concat([result, inserts], sort=False)
+        
+        # Delete: drop flagged known locations, and shift positions of the
+        # following locations
+        delete_positions = positions[found & delete]
+        deleted_labels = result.index[delete_positions]
+        if len(delete_positions):
+            kept = np.ones(len(result), dtype=bool)
+            kept[delete_positions] = False
+            result = result[kept]
+        
+        # Index of the updated data
+        if len(inserts):
+            self.insert(hashes[inserted], insert_positions)
+        if len(delete_positions):
+            self.delete(hashes[found & delete], np.cumsum(~kept))
+        if len(self.delta_hashes) > self.rebuild_ratio * max(len(self.hashes), 1):
+            self.build(result)
+        
+        change_set = {"updated": updated_labels,
+                      "inserted": inserts.index,
+                      "deleted": deleted_labels,
+                      "unchanged": int((~changed).sum()),
+                      "columns": changed_columns}
+        return result, change_set
+
+    def insert(self, hashes, positions):
+        # Keys deleted earlier keep their entry in the delta index
+        existing = self.delta_hashes.get_indexer(hashes)
+        self.delta_positions[existing[existing >= 0]] = positions[existing >= 0]
+        self.delta_hashes = self.delta_hashes.append(pd.Index(hashes[existing < 0]))
+        self.delta_positions = np.concatenate([self.delta_positions, positions[existing < 0]])
+
+    def delete(self, hashes, shift):
+        # Mark deleted keys, then subtract the number of deleted rows preceding
+        # every remaining row from its position
+        for index, positions in [(self.hashes, self.positions), (self.delta_hashes, self.delta_positions)]:
+            found = index.get_indexer(hashes)
+            positions[found[found >= 0]] = -1
+            live = positions >= 0
+            positions[live] -= shift[positions[live]]
+
+# =============================================================================
+# Proximity Criteria
+# =============================================================================
+def derive_proximity_criteria(data):
+    """
+    Derive proximity criteria of locations with coordinates from files of
+    offshore wind farm and community coordinates. Returns the data with the
+    derived criteria and the proximity criteria, which are kept to update
+    the criteria of updated locations, or unchanged data and None if
+    locations have no coordinates or the user skips the derivation.
+    """
+    coordinates = coordinate_columns(data)
+    if coordinates is None:
+        return data, None
+    print(proximity_message())
+    while(True):
+        response = input("Do you want to derive proximity criteria from coordinates? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            break
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            return data, None
+        else:
+            print(invalid_input_message())
+    if cKDTree is None:
+        print("\nDeriving proximity criteria requires scipy. Please install it to use this option.")
+        return data, None
+    
+    print("\nOffshore wind farms:")
+    farms = load_file()
+    if farms is None or coordinate_columns(farms) is None:
+        print("\nOffshore wind farms file should contain latitude and longitude columns.")
+        return data, None
+    while(True):
+        radius = input("Please enter the radius (km) for counting nearby offshore wind farms (press Enter for 50 km): ")
+        try:
+            radius = float(radius) if radius != "" else 50.
+            if radius > 0:
+                break
+        except ValueError:
+            pass
+        print(invalid_input_message())
+    
+    proximity = ProximityCriteria(data[coordinates[0]], data[coordinates[1]], radius)
+    farm_coordinates = coordinate_columns(farms)
+    proximity.add_farms(farms[farm_coordinates[0]], farms[farm_coordinates[1]])
+    
+    while(True):
+        response = input("Do you want to assign locations to the nearest community? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            print("\nCommunities:")
+            communities = load_file()
+            if communities is None or coordinate_columns(communities) is None or "community_name" not in communities.columns:
+                print("\nCommunities file should contain latitude, longitude and community_name columns.")
+            else:
+                community_coordinates = coordinate_columns(communities)
+                proximity.add_communities(communities[community_coordinates[0]], communities[community_coordinates[1]], communities["community_name"])
+            break
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            break
+        else:
+            print(invalid_input_message())
+    
+    data = assign_proximity_criteria(data, proximity)
+    print(f"\nProximity criteria derived: {list(proximity.criteria().columns)}")
+    return data, proximity
+
+
+def assign_proximity_criteria(data, proximity):
+    """
+    Data with the derived criteria, which replace existing columns with the
+    same name. Community names of the data are kept, and only missing names
+    are filled in with the nearest community.
+    """
+    criteria = proximity.criteria(data.index)
+    if "community_name" in criteria.columns and "community_name" in data.columns:
+        criteria["community_name"] = data["community_name"].where(data["community_name"].notna(), criteria["community_name"])
+    return data.assign(**{criterion: criteria[criterion] for criterion in criteria.columns})
+
+
+def update_proximity_criteria(proximity, data, updated_data, change_set):
+    """
+    Update proximity criteria after an upsert of the data: locations with
+    changed coordinates are queried again, inserted locations are added and
+    deleted locations dropped, in the row order of the updated data.
+    Returns the updated data with the derived criteria.
+    """
+    coordinates = coordinate_columns(updated_data)
+    if coordinates is None:
+        raise ValueError("Updated data has no coordinates for proximity criteria.")
+    if coordinates[0] in change_set["columns"] or coordinates[1] in change_set["columns"]:
+        moved = data.index.get_indexer(change_set["updated"])
+        proximity.move_sites(moved, updated_data.loc[change_set["updated"], coordinates[0]], updated_data.loc[change_set["updated"], coordinates[1]])
+    proximity.add_sites(updated_data.loc[change_set["inserted"], coordinates[0]], updated_data.loc[change_set["inserted"], coordinates[1]])
+    kept = np.ones(len(data) + len(change_set["inserted"]), dtype=bool)
+    kept[data.index.get_indexer(change_set["deleted"])] = False
+    proximity.keep_sites(kept)
+    return assign_proximity_criteria(updated_data, proximity)
+
+# =============================================================================
+# Survey Loading
+# =============================================================================
+survey_columns = ["respondent", "group", "criterion_i", "criterion_j", "score"]
+
+def load_survey(criteria):
+    """
+    Load stakeholder survey responses (pairwise comparisons of criteria) and
+    build pairwise comparison matrices of respondents.
+    Returns pairwise comparison matrices and the group of every respondent.
+    """
+    file_path = input(survey_message())
+    try:
+        if file_path.endswith('.csv') or file_path.endswith('.txt'):
+            survey = pd.read_csv(file_path, usecols=survey_columns)
+        elif file_path.endswith('.parquet'):
+            survey = pd.read_parquet(file_path, columns=survey_columns)
+        else:
+            print("\nUnsupported file format. Please load a .txt, .csv or .parquet file.")
+            return None, None
+    except ImportError:
+        print("\nReading .parquet files requires pyarrow or fastparquet. Please install one of them, or load a .csv file.")
+        return None, None
+    except FileNotFoundError:
+        print("\nFile not found. Please check the path and try again.")
+        return None, None
+    except ValueError:
+        print(f"\nSurvey file should contain columns {survey_columns}.")
+        return None, None
+    except Exception as e:
+        print(f"\nAn error occurred: {str(e)}")
+        return None, None
+    
+    PCMs, groups = survey_PCMs(survey, criteria)
+    if PCMs is None:
+        print("\nNo complete survey responses were found for the selected criteria.")
+        return None, None
+    print(f"\nSurvey loaded successfully.\nRespondents per stakeholder group: {pd.Series(groups).value_counts().to_dict()}")
+    return PCMs, groups
+
+
+def survey_PCMs(survey, criteria, reciprocity_tolerance=np.log(2)):
+    """
+    Build pairwise comparison matrices of all respondents from long-format
+    survey responses, where score is the importance of criterion_i compared to
+    criterion_j on Saaty's scale (1/9 to 9), possibly written as a fraction
+    (e.g. 1/3). Judgements may be given in either direction, or in both:
+    every judgement is oriented from the criterion that comes first in
+    criteria, and repeated judgements of the same pair are combined with the
+    geometric mean. Respondents whose repeated judgements
+    disagree by more than reciprocity_tolerance (in log scale), or who did not
+    compare all pairs of criteria, are rejected. Consistency is checked later,
+    when calculating weights.
+    Returns an array of shape (respondents, criteria, criteria) and the group of
+    every respondent.
+    """
+    criteria_num = len(criteria)
+    criteria_index = pd.Index(criteria)
+    i = criteria_index.get_indexer(survey["criterion_i"])
+    j = criteria_index.get_indexer(survey["criterion_j"])
+    score = saaty_scores(survey["score"]).to_numpy(dtype=float)
+    
+    # Comparisons of criteria that are not selected are ignored, while invalid
+    # scores leave the comparison missing
+    respondent_codes, respondents = pd.factorize(survey["respondent"])
+    selected = (respondent_codes >= 0) & (i >= 0) & (j >= 0) & (i != j)
+    valid = selected & np.isfinite(score) & (score >= 1/9 - 1e-9) & (score <= 9 + 1e-9)
+    respondent_num = len(respondents)
+    invalid_num = np.count_nonzero(selected & ~valid)
+    
+    # Orient judgements and identify each (respondent, pair) with one key
+    i, j, log_score, codes = i[valid], j[valid], np.log(score[valid]), respondent_codes[valid]
+    swap = i > j
+    i, j = np.where(swap, j, i), np.where(swap, i, j)
+    log_score = np.where(swap, -log_score, log_score)
+    keys = (codes.astype(np.int64) * criteria_num + i) * criteria_num + j
+    
+    # Combine repeated judgements of each pair with one sort
+    order = np.argsort(keys, kind="stable")
+    keys, log_score = keys[order], log_score[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+    mean_log_score = np.add.reduceat(log_score, starts) / counts if len(keys) else np.zeros(0)
+    spread = np.maximum.reduceat(log_score, starts) - np.minimum.reduceat(log_score, starts) if len(keys) else np.zeros(0)
+    pair_keys = keys[starts]
+    pair_respondents = pair_keys // (criteria_num * criteria_num)
+    
+    # Reject non-reciprocal and incomplete respondents
+    non_reciprocal = np.bincount(pair_respondents[spread > reciprocity_tolerance], minlength=respondent_num) > 0
+    complete = np.bincount(pair_respondents, minlength=respondent_num) == criteria_num * (criteria_num - 1) // 2
+    accepted = complete & ~non_reciprocal
+    print(f"\nSurvey responses: {respondent_num} respondents, {np.count_nonzero(accepted)} accepted, "
+          f"{np.count_nonzero(~complete)} incomplete, {np.count_nonzero(complete & non_reciprocal)} with non-reciprocal judgements "
+          f"({invalid_num} invalid scores ignored).")
+    if not accepted.any():
+        return None, None
+    
+    # Fill the matrices of accepted respondents
+    PCMs = np.ones((respondent_num, criteria_num, criteria_num))
+    r, pair = np.divmod(pair_keys, criteria_num * criteria_num)
+    i, j = np.divmod(pair, criteria_num)
+    judgements = saaty_round(np.exp(mean_log_score))
+    PCMs[r, i, j] = judgements
+    PCMs[r, j, i] = 1 / judgements
+    
+    unique_codes, first_answers = np.unique(respondent_codes, return_index=True)
+    groups = survey["group"].to_numpy()[first_answers[unique_codes >= 0]]
+    return PCMs[accepted], groups[accepted]
+
+
+def saaty_scores(scores):
+    """
+    Convert survey scores to numbers, including scores written as fractions.
+    """
+    numbers = pd.to_numeric(scores, errors="coerce")
+    if scores.dtype == object:
+        fractions = scores.astype(str).str.split("/", n=1, expand=True)
+        if fractions.shape[1] == 2:
+            numbers = numbers.fillna(pd.to_numeric(fractions[0], errors="coerce") / pd.to_numeric(fractions[1], errors="coerce"))
+    return numbers
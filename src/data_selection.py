@@ -3,15 +3,18 @@
 @author: Aneta Kartali
 """
 
+import numpy as np
 import pandas as pd
 import sys
 
+from criteria_reduction import reduce_criteria, reduction_savings
 from data_loading import load_file
 from messages import invalid_input_message, select_data_message 
 from messages import criteria_selection_message, cost_benefit_message
 from messages import restrictions_message, constraints_message
 from messages import select_stakeholders_message, factor_selection_message
-from messages import area_selection_message
+from messages import area_selection_message, pareto_front_message, edit_message
+from messages import criteria_reduction_message, precision_message
 
 # =============================================================================
 # Data Selection
@@ -23,7 +26,8 @@ def select_data(data):
     criteria, types = select_criteria(default_criteria, True)
     selected_data = None
     if criteria is not None:
-        selected_data = data[criteria].astype(float)    # Converting all Boolean columns to number columns
+        criteria, types = select_reduced_criteria(data, criteria, types)
+        selected_data = data[criteria].astype(select_precision())    # Converting all Boolean columns to number columns
         constraints = select_constraints(criteria)
         constrained_data = pd.DataFrame()
         if constraints is not None and not constraints.empty:
@@ -66,10 +70,137 @@ def select_data(data):
             selected_data = constrained_data
         if constrained_data.empty and not constraints.empty:
             print("\nConstraints result in no data selection. Warning: ignoring constraints completely.")        
+        selected_data = select_pareto_front(selected_data, types)
         return selected_data, criteria, types
     else:
         return None, None, None
 
+# =============================================================================
+# Criteria Reduction
+# =============================================================================
+def select_reduced_criteria(data, criteria, types):
+    if len(criteria) < 3:
+        return criteria, types
+    print(criteria_reduction_message())
+    
+    while(True):
+        response = input("Do you want to check the selected criteria for redundancy? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            break
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            return criteria, types
+        else:
+            print(invalid_input_message())
+    while(True):
+        threshold = input("Please enter the dependence threshold of redundant criteria, between 0 and 1 (press Enter for 0.8): ")
+        try:
+            threshold = float(threshold) if threshold != "" else 0.8
+            if 0 < threshold <= 1:
+                break
+        except ValueError:
+            pass
+        print(invalid_input_message())
+    
+    reduced_criteria, reduced_types, report = reduce_criteria(data, criteria, types, threshold)
+    redundant = report[report["representative"] != report.index]
+    if redundant.empty:
+        print("\nNo redundant criteria were found.")
+        return criteria, types
+    print(f"\nRedundant criteria and their representatives:\n{redundant.to_string()}")
+    print(f"\nReduced criteria: {reduced_criteria}")
+    print(f"\nDownstream work saved by the reduction:\n{reduction_savings(len(criteria), len(reduced_criteria), len(data))}")
+    while(True):
+        response = input("Do you want to continue with the reduced criteria? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            return reduced_criteria, reduced_types
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            return criteria, types
+        else:
+            print(invalid_input_message())
+
+# =============================================================================
+# Precision Selection
+# =============================================================================
+def select_precision():
+    print(precision_message())
+    
+    while(True):
+        response = input("Do you want to use single precision (float32)? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            return np.float32
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            return float
+        else:
+            print(invalid_input_message())
+
+# =============================================================================
+# Pareto Front Selection
+# =============================================================================
+def select_pareto_front(selected_data, types):
+    print(pareto_front_message())
+    
+    while(True):
+        response = input("Do you want to remove dominated locations from the analysis? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            front = pareto_front(selected_data, types)
+            pruned_num = len(selected_data) - int(front.sum())
+            print(f"\nRemoved {pruned_num} dominated locations. {int(front.sum())} of {len(selected_data)} locations remain in the analysis.")
+            return selected_data[front]
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            return selected_data
+        else:
+            print(invalid_input_message())
+
+
+def pareto_front(selected_data, types, block_size=1024):
+    """
+    Find locations that are not dominated by any other location (skyline),
+    using the sort-filter-skyline algorithm. Criteria of type "min" are negated
+    so that every criterion is maximized. Locations are sorted by the sum of
+    their min-max normalized values, so a location can only be dominated by the
+    locations preceding it. Blocks of sorted locations are then compared against
+    the front found so far and against themselves.
+    Returns a boolean mask of non-dominated locations.
+    """
+    values = np.asarray(selected_data, dtype=float)
+    signs = np.array([1. if typ == "max" else -1. for typ in types])
+    values = values * signs
+    
+    values_min = values.min(axis=0)
+    values_span = values.max(axis=0) - values_min
+    values_span[values_span == 0] = 1.
+    order = np.argsort(-((values - values_min) / values_span).sum(axis=1), kind="stable")
+    
+    front_mask = np.zeros(len(values), dtype=bool)
+    front = np.empty((0, values.shape[1]))
+    for start in range(0, len(order), block_size):
+        block_positions = order[start:start+block_size]
+        block = values[block_positions]
+        candidates = ~dominated_by(block, front, block_size)
+        candidates[candidates] = ~dominated_by(block[candidates], block[candidates], block_size)
+        front_positions = block_positions[candidates]
+        front_mask[front_positions] = True
+        front = np.concatenate([front, values[front_positions]])
+    
+    return front_mask
+
+
+def dominated_by(points, reference, chunk_size=1024):
+    """
+    Check which points are dominated by at least one of the reference points.
+    All criteria are assumed to be maximized.
+    """
+    dominated = np.zeros(len(points), dtype=bool)
+    for start in range(0, len(reference), chunk_size):
+        chunk = reference[start:start+chunk_size]
+        not_worse = np.ones((len(points), len(chunk)), dtype=bool)
+        better = np.zeros((len(points), len(chunk)), dtype=bool)
+        for j in range(points.shape[1]):
+            not_worse &= chunk[:, j] >= points[:, j, None]
+            better |= chunk[:, j] > points[:, j, None]
+        dominated |= (not_worse & better).any(axis=1)
+    return dominated
+
 # =============================================================================
 # Criteria Selection
 # =============================================================================
@@ -266,6 +397,57 @@ def define_restrictions(criteria):
     return restrictions     
 
 
+# =============================================================================
+# Error Model Selection
+# =============================================================================
+def select_error_model(criteria):
+    while(True):
+        print("1. Input Relative Error for All Criteria")
+        print("2. Load Error Model File")
+        print("3. Back to Main Menu")
+        sub_choice = input("Select an option (1-3): ")
+        
+        if sub_choice == "1":
+            relative_error = input("Relative error of criteria values (e.g. 0.1 for 10%): ")
+            try:
+                relative_error = float(relative_error)
+                error_model = {criterion: {"type": "relative", "value": relative_error} for criterion in criteria}
+                print(f"\nRelative error of {relative_error} defined sucessfully for criteria {criteria}.")
+                return error_model
+            except Exception as e:
+                print(f"\nAn error occurred: {str(e)}")
+                continue
+        
+        elif sub_choice == "2":
+            loaded_errors = load_file()
+            if loaded_errors is not None:
+                try:
+                    error_model = {}
+                    for _, error in loaded_errors.iterrows():
+                        if error["criteria"] not in criteria:
+                            print(f"Criterion \"{error['criteria']}\" not found in the data. Ignoring its error.")
+                            continue
+                        if error["error_type"] in ["relative", "absolute"]:
+                            error_model[error["criteria"]] = {"type": error["error_type"], "value": float(error["error_value"])}
+                        elif error["error_type"] == "bounds":
+                            error_model[error["criteria"]] = {"type": "bounds", "lower": float(error["lower"]), "upper": float(error["upper"])}
+                        else:
+                            print(f"Error type \"{error['error_type']}\" of criterion \"{error['criteria']}\" is not valid. Ignoring its error.")
+                    print(f"\nErrors for criteria {list(error_model.keys())} selected sucessfully.")
+                    return error_model
+                except Exception as e:
+                    print(f"\nAn error occurred: {str(e)}")
+                    print("Please check the loaded file and try again.")
+                    continue
+            else:
+                continue
+        
+        elif sub_choice == "3":
+            return None
+        
+        else:
+            print(invalid_input_message())
+
 # =============================================================================
 # Stakeholder Selection
 # ============================================================================= 
@@ -315,4 +497,87 @@ def select_areas(areas):
         return area_selection
     except Exception as e:
         print(f"\nAn error occurred: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+# =============================================================================
+# What-If Changes Selection
+# =============================================================================
+def select_edits(locations, criteria):
+    print(edit_message())
+    areas = list(locations["community_name"].unique())
+    while(True):
+        print("1. Input Changes")
+        print("2. Load Changes File")
+        print("3. Back to Main Menu")
+        sub_choice = input("Select an option (1-3): ")
+        
+        if sub_choice == "1":
+            edits = []
+            while(True):
+                print(f"Available criteria are: {criteria}")
+                criterion = input("Criterion to change: ").strip()
+                operation = input("Operation (scale, add or set): ").strip()
+                value = input("Value: ")
+                scope = input(f"Type location indices or areas (from {areas}) to change, in a comma separated manner. Press Enter to change all locations: ")
+                try:
+                    if criterion not in criteria:
+                        raise ValueError(f"Criterion \"{criterion}\" not found in the data.")
+                    if operation not in ["scale", "add", "set"]:
+                        raise ValueError(f"Operation \"{operation}\" is not valid.")
+                    edits.append({"criterion": criterion, "operation": operation, "value": float(value),
+                                  "rows": edit_rows(locations, [item.strip() for item in scope.split(",") if item.strip()])})
+                    print(f"\nChange of criterion \"{criterion}\" defined sucessfully.")
+                except Exception as e:
+                    print(f"\nAn error occurred: {str(e)}")
+                response = input("Do you want to define another change? (YES/NO) ")
+                if not (response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y"):
+                    break
+            if edits:
+                return edits
+        
+        elif sub_choice == "2":
+            loaded_edits = load_file()
+            if loaded_edits is not None:
+                try:
+                    edits = []
+                    for _, edit in loaded_edits.iterrows():
+                        if edit["criterion"] not in criteria:
+                            print(f"Criterion \"{edit['criterion']}\" not found in the data. Ignoring its change.")
+                            continue
+                        scope = []
+                        if "site_index" in loaded_edits.columns and pd.notna(edit["site_index"]):
+                            scope = [str(int(edit["site_index"]))]
+                        elif "community_name" in loaded_edits.columns and pd.notna(edit["community_name"]):
+                            scope = [edit["community_name"]]
+                        edits.append({"criterion": edit["criterion"], "operation": edit["operation"], "value": float(edit["value"]),
+                                      "rows": edit_rows(locations, scope)})
+                    print(f"\n{len(edits)} changes selected sucessfully.")
+                    return edits
+                except Exception as e:
+                    print(f"\nAn error occurred: {str(e)}")
+                    print("Please check the loaded file and try again.")
+                    continue
+        
+        elif sub_choice == "3":
+            return None
+        
+        else:
+            print(invalid_input_message())
+
+
+def edit_rows(locations, scope):
+    """
+    Convert a scope of a change (location indices and area names) to labels
+    of the changed locations, or to None if all locations are changed.
+    """
+    if not scope:
+        return None
+    rows = []
+    for item in scope:
+        if item in set(locations["community_name"]):
+            rows.extend(locations.index[locations["community_name"] == item])
+        elif item.isnumeric() and int(item) in locations.index:
+            rows.append(int(item))
+        else:
+            raise ValueError(f"Location or area \"{item}\" not found.")
+    return rows
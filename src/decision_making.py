@@ -4,10 +4,12 @@
 """
 
 import numpy as np
-from pyDecision.algorithm import ahp_method, fuzzy_ahp_method
+import pandas as pd
 from pyDecision.algorithm import topsis_method, fuzzy_topsis_method
 import random
 
+from pairwise_comparison import consistency_ratio, repair_PCM, fuzzify_PCMs, batch_fuzzy_AHP
+
 
 # =============================================================================
 # Pairwise Comparison Matrix (PCM)
@@ -108,6 +110,20 @@ def DM(evaluated_dataset, preferable_criteria_range):
                 DM[i, j] = 5
     return DM
 
+def batch_DM(evaluated_dataset, preferable_criteria_range, DM_num, rng=None):
+    """
+    Generate a batch of decision matrices at once, with the same distribution
+    of evaluation scores as DM.
+    Returns an array of shape (DM_num, alternatives, criteria).
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    evaluated_dataset = np.asarray(evaluated_dataset).astype(np.int64)
+    preferable = np.isin(np.arange(evaluated_dataset.shape[1]), preferable_criteria_range)
+    scores = evaluated_dataset + rng.integers(-2, 2, (DM_num,) + evaluated_dataset.shape)
+    # Evaluation scores (1-9) are stored in one byte each
+    return np.where(preferable, np.clip(scores, 1, 9), 5).astype(np.int8)
+
 # =============================================================================
 # Fuzzy Decision Matrix (Fuzzy DM)
 # =============================================================================
@@ -130,20 +146,28 @@ def fuzzify_DM(DM):
     return fuzzy_DM
 
 
+def fuzzify_DMs(DMs):
+    """
+    Fuzzify a batch of decision matrices (..., alternatives, criteria) into
+    triangular fuzzy numbers (..., alternatives, criteria, 3), with the same
+    mapping as fuzzify_DM.
+    """
+    DMs = np.asarray(DMs).astype(np.int64)
+    return np.stack([DMs, DMs, np.minimum(DMs + 1, 9)], axis=-1).astype(float)
+
+
 # =============================================================================
 # Analytic Hieraracy Process (AHP)
 # =============================================================================
-def AHP(PCM_list, verbose=False):
-    weights_list = []
+def AHP(PCM_list, verbose=False, repair=True):
     
     # Calculate criteria weights based on each stakeholder's judgement matrix
-    # (pairwise comparison matrix)
-    for PCM in PCM_list:
+    # (pairwise comparison matrix), for all stakeholders at once
+    PCM_array = np.array(PCM_list, dtype=float)
+    _, weights_array, rc_array, consistent, repaired = AHP_weights(PCM_array, repair)
     
-        weight_derivation = 'max_eigen'  # 'mean'; 'geometric' or 'max_eigen'
-        weights, rc = ahp_method(PCM, wd=weight_derivation)
-        
-        if verbose:
+    if verbose:
+        for weights, rc in zip(weights_array, rc_array):
             for i in range(0, weights.shape[0]):
                 print('w(C'+str(i+1)+'): ', round(weights[i], 3))
             
@@ -153,104 +177,219 @@ def AHP(PCM_list, verbose=False):
                 print('The solution is inconsistent, the pairwise comparisons must be reviewed')
             else:
                 print('The solution is consistent')
-            
-        if (rc < 0.10):
-            weights_list.append(weights)
-          
-    weights_array = np.array(weights_list)
-    ahp_weights = np.mean(weights_array, axis=0)
+    
+    print_consistency_statistics(len(PCM_array), consistent.sum(), repaired.sum())
+    ahp_weights = np.mean(weights_array[consistent | repaired], axis=0)
     
     return ahp_weights
 
+
+def AHP_weights(PCM_array, repair=True):
+    """
+    Calculate weights of a batch of pairwise comparison matrices using the
+    principal eigenvector. Inconsistent matrices are repaired instead of
+    discarded. Returns (repaired) matrices, weights, consistency ratios, and
+    masks of matrices that are consistent and that were successfully repaired.
+    """
+    PCM_array = np.array(PCM_array, dtype=float)
+    weights_array, rc_array = consistency_ratio(PCM_array)
+    consistent = rc_array < 0.10
+    repaired = np.zeros_like(consistent)
+    if repair and not consistent.all():
+        repaired_PCM_array, repaired_weights, repaired_rc, _ = repair_PCM(PCM_array[~consistent])
+        PCM_array[~consistent] = repaired_PCM_array
+        weights_array[~consistent] = repaired_weights
+        rc_array[~consistent] = repaired_rc
+        repaired[~consistent] = repaired_rc < 0.10
+    return PCM_array, weights_array, rc_array, consistent, repaired
+
+
+def print_consistency_statistics(PCM_num, consistent_num, repaired_num):
+    rejected_num = PCM_num - consistent_num - repaired_num
+    print(f"\nPairwise comparison matrices: {consistent_num} of {PCM_num} consistent, {repaired_num} repaired, {rejected_num} rejected.")
+
 # =============================================================================
 # Fuzzy Analytic Hieraracy Process (Fuzzy AHP)
 # =============================================================================
-def fuzzy_AHP(PCM_list, verbose=False):
-    weights_list = []
-    fuzzy_weights_list = []
-    consistent_fuzzy_PCM_list = []
+def fuzzy_AHP(PCM_list, verbose=False, repair=True):
     
     # Fuzzify stakeholder's judgement matrices and check their consistency
     # Then, calculate fuzzy criteria weights based on each stakeholder's fuzzified
-    # judgement matrix (fuzzified pairwise comparison matrix)
-    for PCM in PCM_list:
-        
-        fuzzy_PCM = fuzzify_PCM(PCM)
-        fuzzy_weights, defuzzified_weights, normalized_weights, rc = fuzzy_ahp_method(fuzzy_PCM)
-        
-        if verbose:
-            # Fuzzy weights
-            print("\nFuzzy weights:")
-            for i in range(0, len(fuzzy_weights)):
-                print('g'+str(i+1)+': ', np.around(fuzzy_weights[i], 3))
-              
-            # Crisp Weigths
-            print("\nCrisp weights:")
-            for i in range(0, len(defuzzified_weights)):
-                print('g'+str(i+1)+': ', round(defuzzified_weights[i], 3))
-              
-            # Normalized Weigths
-            print("\nNormalized weights:")
-            for i in range(0, len(normalized_weights)):
-                print('g'+str(i+1)+': ', round(normalized_weights[i], 3))
-                
-            # Consistency Ratio
-            print('RC: ' + str(round(rc, 2)))
-            if (rc > 0.10):
-                print('The solution is inconsistent, the pairwise comparisons must be reviewed')
-            else:
-                print('The solution is consistent')
-        
-        if (rc < 0.10):
-            weights_list.append(normalized_weights)
-            fuzzy_weights_list.append(fuzzy_weights)
-            consistent_fuzzy_PCM_list.append(fuzzy_PCM)
+    # judgement matrix (fuzzified pairwise comparison matrix), for all
+    # stakeholders at once
+    PCM_array = np.array(PCM_list, dtype=float)
+    fuzzy_PCM_array, fuzzy_weights_array, defuzzified_weights_array, normalized_weights_array, rc_array, consistent, repaired = fuzzy_AHP_weights(PCM_array, repair)
+    
+    if verbose:
+        for fuzzy_weights, defuzzified_weights, normalized_weights, rc in zip(fuzzy_weights_array, defuzzified_weights_array, normalized_weights_array, rc_array):
+            print_fuzzy_weights(fuzzy_weights, defuzzified_weights, normalized_weights, rc)
+    
+    print_consistency_statistics(len(PCM_array), consistent.sum(), repaired.sum())
+    accepted = consistent | repaired
+    fuzzy_weights_list = list(fuzzy_weights_array[accepted])
     
     # Aggregate fuzzy PCM -----------------------------------------------------
-    if not weights_list:
+    if not fuzzy_weights_list:
         return None, None
-        
-    weights_array = np.array(weights_list)
-    criteria_num = len(np.mean(weights_array, axis=0))
     
-    consistent_fuzzy_PCM_array = np.array(consistent_fuzzy_PCM_list)
-    aggregate_fuzzy_PCM = np.empty((criteria_num, criteria_num), dtype=object)
-    for i in range(criteria_num):
-        for j in range(criteria_num):
-            l = consistent_fuzzy_PCM_array[:, i, j, 0]
-            m = consistent_fuzzy_PCM_array[:, i, j, 1]
-            u = consistent_fuzzy_PCM_array[:, i, j, 2]
-            aggregate_fuzzy_PCM[i, j] = (np.min(l), m.prod()**(1.0/len(m)), np.max(u))
+    aggregate_fuzzy_PCM = aggregate_fuzzy_PCMs(fuzzy_PCM_array[accepted])
             
     # Calculate aggregated fuzzy weights --------------------------------------
-    fuzzy_weights, defuzzified_weights, normalized_weights, rc = fuzzy_ahp_method(aggregate_fuzzy_PCM)
+    fuzzy_weights, defuzzified_weights, normalized_weights, rc = batch_fuzzy_AHP(aggregate_fuzzy_PCM)
         
     if verbose:
-        # Fuzzy weights
-        print("\nFuzzy weights:")
-        for i in range(0, len(fuzzy_weights)):
-            print('g'+str(i+1)+': ', np.around(fuzzy_weights[i], 3))
-          
-        # Crisp Weigths
-        print("\nCrisp weights:")
-        for i in range(0, len(defuzzified_weights)):
-            print('g'+str(i+1)+': ', round(defuzzified_weights[i], 3))
-          
-        # Normalized Weigths
-        print("\nNormalized weights:")
-        for i in range(0, len(normalized_weights)):
-            print('g'+str(i+1)+': ', round(normalized_weights[i], 3))
-            
-        # Consistency Ratio
-        print('RC: ' + str(round(rc, 2)))
-        if (rc > 0.10):
-            print('The solution is inconsistent, the pairwise comparisons must be reviewed')
-        else:
-            print('The solution is consistent')
+        print_fuzzy_weights(fuzzy_weights, defuzzified_weights, normalized_weights, rc)
             
     return normalized_weights, fuzzy_weights_list
 
 
+def fuzzy_AHP_weights(PCM_array, repair=True):
+    """
+    Fuzzify a batch of pairwise comparison matrices and calculate their fuzzy
+    weights. Inconsistent matrices are repaired instead of discarded.
+    Returns fuzzy matrices, fuzzy, defuzzified and normalized weights,
+    consistency ratios, and masks of matrices that are consistent and that were
+    successfully repaired.
+    """
+    fuzzy_PCM_array = fuzzify_PCMs(PCM_array)
+    fuzzy_weights_array, defuzzified_weights_array, normalized_weights_array, rc_array = batch_fuzzy_AHP(fuzzy_PCM_array)
+    consistent = rc_array < 0.10
+    repaired = np.zeros_like(consistent)
+    if repair and not consistent.all():
+        repaired_PCM_array, _, _, _ = repair_PCM(PCM_array[~consistent])
+        fuzzy_PCM_array[~consistent] = fuzzify_PCMs(repaired_PCM_array)
+        fuzzy_weights, defuzzified_weights, normalized_weights, rc = batch_fuzzy_AHP(fuzzy_PCM_array[~consistent])
+        fuzzy_weights_array[~consistent] = fuzzy_weights
+        defuzzified_weights_array[~consistent] = defuzzified_weights
+        normalized_weights_array[~consistent] = normalized_weights
+        rc_array[~consistent] = rc
+        repaired[~consistent] = rc < 0.10
+    return fuzzy_PCM_array, fuzzy_weights_array, defuzzified_weights_array, normalized_weights_array, rc_array, consistent, repaired
+
+
+def aggregate_fuzzy_PCMs(fuzzy_PCM_array):
+    """
+    Aggregate fuzzy pairwise comparison matrices of stakeholders (minimum of
+    lower bounds, geometric mean of modal values and maximum of upper bounds).
+    """
+    return np.stack([np.min(fuzzy_PCM_array[..., 0], axis=0),
+                     np.exp(np.mean(np.log(fuzzy_PCM_array[..., 1]), axis=0)),
+                     np.max(fuzzy_PCM_array[..., 2], axis=0)], axis=-1)
+
+
+def print_fuzzy_weights(fuzzy_weights, defuzzified_weights, normalized_weights, rc):
+    # Fuzzy weights
+    print("\nFuzzy weights:")
+    for i in range(0, len(fuzzy_weights)):
+        print('g'+str(i+1)+': ', np.around(fuzzy_weights[i], 3))
+      
+    # Crisp Weigths
+    print("\nCrisp weights:")
+    for i in range(0, len(defuzzified_weights)):
+        print('g'+str(i+1)+': ', round(defuzzified_weights[i], 3))
+      
+    # Normalized Weigths
+    print("\nNormalized weights:")
+    for i in range(0, len(normalized_weights)):
+        print('g'+str(i+1)+': ', round(normalized_weights[i], 3))
+        
+    # Consistency Ratio
+    print('RC: ' + str(round(rc, 2)))
+    if (rc > 0.10):
+        print('The solution is inconsistent, the pairwise comparisons must be reviewed')
+    else:
+        print('The solution is consistent')
+
+
+# =============================================================================
+# Hierarchical AHP
+# =============================================================================
+def hierarchical_AHP(hierarchical_PCMs, repair=True):
+    """
+    Calculate criteria weights over a two-level hierarchy: each stakeholder
+    compares criteria groups with each other, and criteria within each group.
+    Global weight of a criterion is the weight of its group multiplied by its
+    local weight within the group. Weights of all stakeholders are calculated
+    at once, level by level.
+    """
+    print_judgement_statistics(hierarchical_PCMs["groups"])
+    global_weights, consistent, accepted = hierarchical_AHP_weights(hierarchical_PCMs, repair)
+    print_consistency_statistics(len(global_weights), consistent.sum(), (accepted & ~consistent).sum())
+    return np.mean(global_weights[accepted], axis=0)
+
+
+def hierarchical_AHP_weights(hierarchical_PCMs, repair=True):
+    """
+    Calculate global criteria weights of every stakeholder over a two-level
+    hierarchy. Returns global weights, and masks of stakeholders whose
+    matrices are all consistent and whose matrices are all consistent or
+    repaired.
+    """
+    groups = hierarchical_PCMs["groups"]
+    criteria_num = sum(len(group) for group in groups)
+    
+    # A stakeholder's judgements are accepted only if all of their matrices
+    # are consistent or repaired
+    _, group_weights, _, consistent, repaired = AHP_weights(hierarchical_PCMs["group_PCMs"], repair)
+    accepted = consistent | repaired
+    global_weights = np.zeros((len(group_weights), criteria_num))
+    for k, group in enumerate(groups):
+        _, local_weights, _, local_consistent, local_repaired = AHP_weights(hierarchical_PCMs["local_PCMs"][k], repair)
+        global_weights[:, group] = group_weights[:, k, None] * local_weights
+        accepted &= local_consistent | local_repaired
+        consistent &= local_consistent
+    return global_weights, consistent, accepted
+
+
+def hierarchical_fuzzy_AHP(hierarchical_PCMs, repair=True):
+    """
+    Calculate fuzzy criteria weights over a two-level hierarchy. Global fuzzy
+    weight of a criterion is the product of the fuzzy weight of its group and
+    its local fuzzy weight within the group. Crisp weights are calculated from
+    the aggregated fuzzy pairwise comparison matrices of each level.
+    Consistency is checked on crisp matrices, since the spread of fuzzified
+    equal judgements alone makes small fuzzy matrices inconsistent.
+    Returns crisp weights and the list of global fuzzy weights of stakeholders.
+    """
+    groups = hierarchical_PCMs["groups"]
+    criteria_num = sum(len(group) for group in groups)
+    print_judgement_statistics(groups)
+    
+    level_PCMs = [hierarchical_PCMs["group_PCMs"]] + list(hierarchical_PCMs["local_PCMs"])
+    level_fuzzy_PCMs = []
+    for level, PCM_array in enumerate(level_PCMs):
+        PCM_array, _, _, level_consistent, level_repaired = AHP_weights(PCM_array, repair)
+        level_fuzzy_PCMs.append(fuzzify_PCMs(PCM_array))
+        if level == 0:
+            consistent = level_consistent
+            accepted = level_consistent | level_repaired
+        else:
+            consistent &= level_consistent
+            accepted &= level_consistent | level_repaired
+    print_consistency_statistics(len(accepted), consistent.sum(), (accepted & ~consistent).sum())
+    if not accepted.any():
+        return None, None
+    
+    group_fuzzy_weights = batch_fuzzy_AHP(level_fuzzy_PCMs[0][accepted])[0]
+    aggregated_group_weights = batch_fuzzy_AHP(aggregate_fuzzy_PCMs(level_fuzzy_PCMs[0][accepted]))[2]
+    global_fuzzy_weights = np.zeros((accepted.sum(), criteria_num, 3))
+    normalized_weights = np.zeros(criteria_num)
+    for k, group in enumerate(groups):
+        local_fuzzy_weights = batch_fuzzy_AHP(level_fuzzy_PCMs[k+1][accepted])[0]
+        aggregated_local_weights = batch_fuzzy_AHP(aggregate_fuzzy_PCMs(level_fuzzy_PCMs[k+1][accepted]))[2]
+        # Product of triangular fuzzy numbers
+        global_fuzzy_weights[:, group] = group_fuzzy_weights[:, k, None, :] * local_fuzzy_weights
+        normalized_weights[group] = aggregated_group_weights[k] * aggregated_local_weights
+    
+    return normalized_weights, list(global_fuzzy_weights)
+
+
+def print_judgement_statistics(groups):
+    criteria_num = sum(len(group) for group in groups)
+    judgement_num = len(groups) * (len(groups) - 1) // 2 + sum(len(group) * (len(group) - 1) // 2 for group in groups)
+    print(f"\nPairwise judgements per stakeholder: {judgement_num} (instead of {criteria_num * (criteria_num - 1) // 2} without hierarchy).")
+
+
 # =============================================================================
 # Technique for Order of Preference by Similarity to Ideal Solution (TOPSIS)
 # =============================================================================
@@ -262,10 +401,264 @@ def TOPSIS(data, weights, types):
     return ranking
 
 
+def compute_dtype(data):
+    """
+    Floating point type of computations on the decision matrix: single
+    precision (float32) if all of its criteria are stored in single precision,
+    double precision (float64) otherwise.
+    """
+    dtypes = data.dtypes if isinstance(data, pd.DataFrame) else [np.asarray(data).dtype]
+    return np.float32 if all(dtype == np.float32 for dtype in dtypes) else np.float64
+
+
+def TOPSIS_parameters(data, weights, types, chunk_size=1000000):
+    """
+    Calculate the column norms and the positive and negative ideal solutions
+    of the weighted normalized decision matrix, one chunk of alternatives at
+    a time.
+    """
+    chunks = (data[start:start+chunk_size] for start in range(0, len(data), chunk_size))
+    return TOPSIS_chunk_parameters(chunks, np.size(data, 1), weights, types)
+
+
+def TOPSIS_chunk_parameters(chunks, criteria_num, weights, types):
+    """
+    Calculate TOPSIS parameters from chunks of alternatives.
+    """
+    return TOPSIS_statistics_parameters(TOPSIS_statistics(chunks, criteria_num), weights, types)
+
+
+def TOPSIS_statistics(chunks, criteria_num):
+    """
+    Calculate column sums of squares, maxima and minima of chunks of
+    alternatives. Chunks keep their precision, while sums of squares are
+    accumulated in double precision. Statistics of separate parts of a
+    decision matrix are merged with merge_TOPSIS_statistics.
+    """
+    sum_squares = np.zeros(criteria_num)
+    max_values = np.full(criteria_num, -np.inf)
+    min_values = np.full(criteria_num, np.inf)
+    for chunk in chunks:
+        chunk = np.asarray(chunk, dtype=compute_dtype(chunk))
+        if len(chunk) == 0:
+            continue
+        sum_squares += np.sum(chunk * chunk, axis=0, dtype=np.float64)
+        max_values = np.maximum(max_values, np.max(chunk, axis=0))
+        min_values = np.minimum(min_values, np.min(chunk, axis=0))
+    return sum_squares, max_values, min_values
+
+
+def merge_TOPSIS_statistics(statistics_list):
+    sum_squares = np.sum([statistics[0] for statistics in statistics_list], axis=0)
+    max_values = np.max([statistics[1] for statistics in statistics_list], axis=0)
+    min_values = np.min([statistics[2] for statistics in statistics_list], axis=0)
+    return sum_squares, max_values, min_values
+
+
+def TOPSIS_statistics_parameters(statistics, weights, types):
+    """
+    Calculate the column norms and the positive and negative ideal solutions
+    from column statistics of the decision matrix.
+    """
+    sum_squares, max_values, min_values = statistics
+    weights = np.asarray(weights, dtype=float)
+    norms = sum_squares ** (1/2)
+    maximize = np.array([typ == "max" for typ in types])
+    p_ideal = np.where(maximize, max_values, min_values) / norms * weights
+    n_ideal = np.where(maximize, min_values, max_values) / norms * weights
+    return norms, p_ideal, n_ideal
+
+
+def TOPSIS_closeness(data, weights, norms, p_ideal, n_ideal):
+    """
+    Calculate the relative closeness to the ideal solution for a chunk of
+    alternatives, given the parameters of the whole decision matrix. The
+    chunk is scored in its own precision.
+    """
+    dtype = compute_dtype(data)
+    v = np.asarray(data, dtype=dtype) * np.asarray(weights / norms, dtype=dtype)
+    p_ideal = np.asarray(p_ideal, dtype=dtype)
+    n_ideal = np.asarray(n_ideal, dtype=dtype)
+    p_distance = np.sum((v - p_ideal) ** 2, axis=1) ** (1/2)
+    n_distance = np.sum((v - n_ideal) ** 2, axis=1) ** (1/2)
+    return n_distance / (p_distance + n_distance)
+
+
+def batch_TOPSIS(data, weights, types):
+    """
+    Calculate TOPSIS rankings for a batch of decision matrices and/or weights
+    in one vectorized computation. Alternatives and criteria are the last two
+    axes of data (..., alternatives, criteria), and weights are broadcast
+    against it, e.g. weights of shape (batch, 1, criteria) rank one decision
+    matrix with many weight vectors. Single precision data is scored in single
+    precision. Returns scores of shape (..., alternatives).
+    """
+    X = np.asarray(data, dtype=compute_dtype(data))
+    maximize = np.array([typ == "max" for typ in types])
+    v = X / np.sum(X * X, axis=-2, keepdims=True) ** (1/2) * np.asarray(weights, dtype=X.dtype)
+    v_max = np.max(v, axis=-2, keepdims=True)
+    v_min = np.min(v, axis=-2, keepdims=True)
+    p_ideal = np.where(maximize, v_max, v_min)
+    n_ideal = np.where(maximize, v_min, v_max)
+    p_distance = np.sum((v - p_ideal) ** 2, axis=-1) ** (1/2)
+    n_distance = np.sum((v - n_ideal) ** 2, axis=-1) ** (1/2)
+    return n_distance / (p_distance + n_distance)
+
+
+def guarded_TOPSIS(data, weights, types, reference=None, k=None, tolerance=1e-6, chunk_size=1000000, verbose=False,
+                   cancelled=None):
+    """
+    Calculate TOPSIS ranking in the precision of the decision matrix. Double
+    precision data is ranked with pyDecision's TOPSIS. Single precision data
+    is scored chunk by chunk in single precision, which differs from double
+    precision scores by about 1e-7. Alternatives whose scores are closer than
+    tolerance to a neighbouring score (among the k best alternatives, or all
+    alternatives if k is not specified) are re-scored in double precision from
+    the reference data (original values, with the same index and criteria
+    columns as the decision matrix), so their order is the same as in double
+    precision. Double precision data with more than chunk_size alternatives
+    is also scored chunk by chunk, which bounds the memory of intermediate
+    results. A ranking with a cancelled event (threading.Event) is always
+    scored chunk by chunk, and stops between chunks when the event is set.
+    Returns scores in double precision (None if the ranking was cancelled).
+    """
+    if compute_dtype(data) == np.float64 and len(data) <= chunk_size and cancelled is None:
+        return TOPSIS(data, weights, types)
+    norms, p_ideal, n_ideal = TOPSIS_parameters(data, weights, types, chunk_size)
+    scores = np.empty(len(data))
+    for start in range(0, len(data), chunk_size):
+        if cancelled is not None and cancelled.is_set():
+            return None
+        scores[start:start+chunk_size] = TOPSIS_closeness(data[start:start+chunk_size], weights, norms, p_ideal, n_ideal)
+    if compute_dtype(data) == np.float64:
+        return scores
+    ties = close_ties(scores, tolerance, k)
+    if reference is None or len(ties) == 0:
+        return scores
+    
+    # Parameters of the whole decision matrix and scores of close ties in
+    # double precision, reading the reference data one chunk at a time. When
+    # most scores are close ties (e.g. full ranking of millions of
+    # alternatives), all alternatives are re-scored chunk by chunk instead of
+    # gathering the ties
+    positions = reference.index.get_indexer(data.index)
+    columns = reference.columns.get_indexer(data.columns)
+    def reference_chunks():
+        for start in range(0, len(data), chunk_size):
+            yield start, reference.iloc[positions[start:start+chunk_size], columns].to_numpy(dtype=float)
+    reference_parameters = TOPSIS_chunk_parameters((chunk for _, chunk in reference_chunks()), len(columns), weights, types)
+    if len(ties) > len(scores) // 2:
+        for start, chunk in reference_chunks():
+            if cancelled is not None and cancelled.is_set():
+                return None
+            scores[start:start+len(chunk)] = TOPSIS_closeness(chunk, weights, *reference_parameters)
+    else:
+        scores[ties] = TOPSIS_closeness(reference.iloc[positions[ties], columns].to_numpy(dtype=float), weights, *reference_parameters)
+    if verbose:
+        print(f"\nRe-scored {len(ties)} close ties of single precision scores in double precision.")
+    return scores
+
+
+def close_ties(scores, tolerance, k=None):
+    """
+    Positions of alternatives whose score is closer than tolerance to the
+    score of another alternative. If k is specified, only alternatives that
+    can be among the k best are checked.
+    """
+    if k is None or k >= len(scores):
+        candidates = np.arange(len(scores))
+    else:
+        candidates = np.flatnonzero(scores >= top_k(scores, k)[1][-1] - tolerance)
+    order = candidates[np.argsort(scores[candidates], kind="stable")]
+    close = np.diff(scores[order]) < tolerance
+    tied = np.zeros(len(order), dtype=bool)
+    tied[:-1] |= close
+    tied[1:] |= close
+    return order[tied]
+
+
+def full_precision(data, reference=None):
+    """
+    Double precision decision matrix: the reference values of single precision
+    data, if the reference data is given.
+    """
+    if reference is None or compute_dtype(data) == np.float64:
+        return data
+    return reference.loc[data.index, list(data.columns)].astype(float)
+
+
+# =============================================================================
+# Top-k Ranking
+# =============================================================================
+def top_k(ranking, k):
+    """
+    Select positions of the k best ranked alternatives with partial selection
+    instead of sorting the whole ranking. Only the selected alternatives are
+    sorted, from the best to the worst (ties keep their original order).
+    """
+    ranking = np.asarray(ranking)
+    k = min(k, len(ranking))
+    if k <= 0:
+        return np.array([], dtype=np.int64), ranking[:0]
+    if k < len(ranking):
+        positions = np.argpartition(-ranking, k - 1)[:k]
+    else:
+        positions = np.arange(len(ranking))
+    positions = positions[np.lexsort((positions, -ranking[positions]))]
+    return positions, ranking[positions]
+
+
+def merge_top_k(partial_results, k):
+    """
+    Merge top-k results (pairs of alternative positions and their scores)
+    computed separately for chunks of data or by different workers.
+    """
+    positions = np.concatenate([partial[0] for partial in partial_results])
+    scores = np.concatenate([partial[1] for partial in partial_results])
+    selection, merged_scores = top_k(scores, k)
+    return positions[selection], merged_scores
+
+
+def TOPSIS_top_k(data, weights, types, k, chunk_size=1000000):
+    """
+    Find the k best ranked alternatives with TOPSIS, scoring the decision matrix
+    chunk by chunk and keeping only the best alternatives of each chunk.
+    Returns positions of the alternatives and their scores.
+    """
+    norms, p_ideal, n_ideal = TOPSIS_parameters(data, weights, types, chunk_size)
+    partial_results = []
+    for start in range(0, len(data), chunk_size):
+        ranking = TOPSIS_closeness(data[start:start+chunk_size], weights, norms, p_ideal, n_ideal)
+        positions, scores = top_k(ranking, k)
+        partial_results.append((positions + start, scores))
+    return merge_top_k(partial_results, k)
+
+
+def rank_alternatives(data, selected_data, ranking, k=None):
+    """
+    Attach ranking scores and community names to the k best ranked alternatives
+    (to all alternatives if k is not specified), sorted from the best to the
+    worst alternative.
+    """
+    if k is None:
+        k = len(ranking)
+    positions, scores = top_k(ranking, k)
+    result = selected_data.iloc[positions].copy()
+    result["Ranking"] = scores
+    result["community_name"] = data["community_name"].loc[result.index].to_numpy()
+    return result
+
+
 # =============================================================================
 # Fuzzy TOPSIS
 # =============================================================================
-def fuzzy_TOPSIS(fuzzy_weights_list, DM_list, types):
+def fuzzy_TOPSIS(fuzzy_weights_list, DM_list, types, chunk_size=None):
+    """
+    Rank alternatives with Fuzzy TOPSIS, with aggregated fuzzy weights and the
+    aggregated fuzzy decision matrix of stakeholders. Returns the ranking and
+    the aggregated fuzzy decision matrix (alternatives x criteria x 3), which
+    is needed to re-score alternatives with other fuzzy weights.
+    """
     
     criteria_num = len(fuzzy_weights_list[0])
     alternative_num = len(DM_list[0])
@@ -273,25 +666,55 @@ def fuzzy_TOPSIS(fuzzy_weights_list, DM_list, types):
     aggregated_fuzzy_weights = aggregate_fuzzy_weights(fuzzy_weights_list).tolist()
     
     # Generate a fuzzy decision matrix from simulated ranking of alternatives and
-    # criteria by a group of stakeholders
-    fuzzy_DM_list = []
-    for DM in DM_list:
-        fuzzy_DM = fuzzify_DM(DM)
-        fuzzy_DM_list.append(fuzzy_DM)
-    
-    fuzzy_DM_array = np.array(fuzzy_DM_list)
+    # criteria by a group of stakeholders, for chunk_size stakeholders at once
+    # (all stakeholders by default)
+    if chunk_size is None:
+        chunk_size = len(DM_list)
     aggregated_fuzzy_DM = np.empty((alternative_num, criteria_num), dtype=object)
     
+    l, log_m_sum, u = np.inf, 0., -np.inf
+    for start in range(0, len(DM_list), chunk_size):
+        fuzzy_DM_array = fuzzify_DMs(np.array(DM_list[start:start+chunk_size]))
+        l = np.minimum(l, np.min(fuzzy_DM_array[..., 0], axis=0))
+        log_m_sum = log_m_sum + np.sum(np.log(fuzzy_DM_array[..., 1]), axis=0)
+        u = np.maximum(u, np.max(fuzzy_DM_array[..., 2], axis=0))
+        del fuzzy_DM_array
+    m = np.exp(log_m_sum / len(DM_list))  # With geometric mean (in log space, so that it does not overflow for many stakeholders)
     for i in range(alternative_num):
         for j in range(criteria_num):
-            l = np.array([f[0] for f in list(fuzzy_DM_array[:, i, j])])
-            m = np.array([f[1] for f in list(fuzzy_DM_array[:, i, j])]).astype(np.int64)
-            u = np.array([f[2] for f in list(fuzzy_DM_array[:, i, j])])
-            # aggregate_fuzzy_DM[i, j] = (np.min(l), np.mean(m), np.max(u))  # With arithmetic mean
-            aggregated_fuzzy_DM[i, j] = (np.min(l), m.prod()**(1.0/len(m)), np.max(u))  # With geometric mean
+            aggregated_fuzzy_DM[i, j] = (l[i, j], m[i, j], u[i, j])
             
     ranking = fuzzy_topsis_method(aggregated_fuzzy_DM, list([aggregated_fuzzy_weights]), types, graph = False, verbose = False)
-    return ranking
+    return ranking, np.stack([l, m, u], axis=-1)
+
+
+def batch_fuzzy_TOPSIS(fuzzy_DM, fuzzy_weights, types, positions=None):
+    """
+    Calculate Fuzzy TOPSIS scores (as pyDecision's Fuzzy TOPSIS) of an
+    aggregated fuzzy decision matrix (alternatives x criteria x 3) for a batch
+    of triangular fuzzy weights (..., criteria, 3) in one vectorized
+    computation. Benefit criteria are normalized by their largest upper value
+    and cost criteria by their smallest lower value, and ideal solutions are
+    the component-wise extremes of the weighted normalized matrix. Only the
+    alternatives at positions are scored (all alternatives by default), with
+    the ideal solutions of all alternatives.
+    Returns scores of shape (..., alternatives).
+    """
+    fuzzy_DM = np.asarray(fuzzy_DM, dtype=float)
+    maximize = np.array([typ == "max" for typ in types])
+    with np.errstate(divide="ignore"):
+        normalized = np.where(maximize[:, None], fuzzy_DM / np.max(fuzzy_DM[..., 2], axis=0)[:, None],
+                              np.min(fuzzy_DM[..., 0], axis=0)[:, None] / fuzzy_DM[..., ::-1])
+    # Weights are positive, so extremes of the weighted matrix are weighted extremes
+    p_ideal = np.max(normalized, axis=0)
+    n_ideal = np.min(normalized, axis=0)
+    if positions is not None:
+        normalized = normalized[positions]
+    weights = np.asarray(fuzzy_weights, dtype=float)[..., None, :, :]
+    criteria_num = fuzzy_DM.shape[1]
+    p_distance = np.sum(np.sum((weights * (normalized - p_ideal)) ** 2, axis=-1) ** (1/2), axis=-1) / criteria_num ** (1/2)
+    n_distance = np.sum(np.sum((weights * (normalized - n_ideal)) ** 2, axis=-1) ** (1/2), axis=-1) / criteria_num ** (1/2)
+    return n_distance / (p_distance + n_distance)
 
 
 def aggregate_fuzzy_weights(fuzzy_weights_list, mode="geometric"):
@@ -309,7 +732,7 @@ def aggregate_fuzzy_weights(fuzzy_weights_list, mode="geometric"):
         if mode == "arithmetic":
             aggregate_fuzzy_weights[i] = (np.min(l), np.mean(m), np.max(u))  # With arithmetic mean
         elif mode == "geometric":
-            aggregate_fuzzy_weights[i] = (np.min(l), m.prod()**(1.0/len(m)), np.max(u))  # With geometric mean
+            aggregate_fuzzy_weights[i] = (np.min(l), np.exp(np.mean(np.log(m))), np.max(u))  # With geometric mean (in log space, so that it does not underflow for many stakeholders)
         else:
             print(f"Invalid aggregation mode: {mode}")
             break
@@ -322,4 +745,116 @@ def compare_locations(data, selected_data, criteria):
     filtered_data = data[criteria]
     # Calculate the deviation from mean value
     deviation = ((selected_data - filtered_data.mean()) / filtered_data.mean()) * 100
-    return deviation
\ No newline at end of file
+    return deviation
+
+def summarize_locations(data, criteria, areas=None, chunk_size=1000000, bins=128, percentiles=(0.1, 0.5, 0.9)):
+    """
+    Summarize gains of locations (percent deviations from the average of all
+    locations, as in compare_locations) for each area (community_name), in
+    two passes over chunks of locations, without the location-level table.
+    For every area and criterion, the summary has the number of locations,
+    the mean gain, percentiles of gains, the share of locations above the
+    average and the location with the highest gain. Missing and infinite
+    gains (e.g. of a criterion with zero average) are left out of the
+    statistics. Percentiles are interpolated from histograms of bins
+    equal-width bins over the range of gains of every area and criterion,
+    so they are accurate to about 1/bins of the range of the area. The
+    histograms need their bin edges before any gain is binned, so the
+    first pass only finds the ranges and the second pass does the rest;
+    gains are not kept between the passes, which keeps the memory bounded
+    by the chunk size. Only areas in areas are summarized (all areas by
+    default).
+    Returns a data frame with a row per area and criterion.
+    """
+    values = data[criteria]
+    mean = values.mean().to_numpy(dtype=float)
+    
+    # Area codes of all locations (-1 for areas that are not summarized)
+    area_codes, area_names = pd.factorize(data["community_name"], sort=True)
+    if areas is not None:
+        selected_areas = np.isin(area_names, list(areas))
+        code_map = np.where(selected_areas, np.cumsum(selected_areas) - 1, -1)
+        area_codes = np.where(area_codes >= 0, code_map[area_codes], -1)
+        area_names = area_names[selected_areas]
+    area_num, criteria_num = len(area_names), len(criteria)
+    
+    def area_chunks():
+        # Gains of locations of every chunk, grouped by area
+        for start in range(0, len(data), chunk_size):
+            chunk_codes = area_codes[start:start+chunk_size]
+            rows = np.flatnonzero(chunk_codes >= 0)
+            rows = rows[np.argsort(chunk_codes[rows], kind="stable")]
+            if not len(rows):
+                continue
+            codes = chunk_codes[rows]
+            group_starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                gains = (values.iloc[start:start+chunk_size].to_numpy(dtype=float)[rows] - mean) / mean * 100
+            gains[~np.isfinite(gains)] = np.nan
+            yield start, rows, codes, group_starts, gains
+    
+    # Range of gains of every area and criterion (missing values are ignored)
+    gain_min = np.full((area_num, criteria_num), np.inf)
+    gain_max = np.full((area_num, criteria_num), -np.inf)
+    for _, _, codes, group_starts, gains in area_chunks():
+        group_codes = codes[group_starts]
+        gain_min[group_codes] = np.fmin(gain_min[group_codes], np.fmin.reduceat(gains, group_starts, axis=0))
+        gain_max[group_codes] = np.fmax(gain_max[group_codes], np.fmax.reduceat(gains, group_starts, axis=0))
+    bin_width = np.where(gain_max > gain_min, (gain_max - gain_min) / bins, 1.)
+    gain_min = np.where(np.isfinite(gain_min), gain_min, 0.)
+    
+    counts = np.zeros(area_num, dtype=np.int64)
+    finite_counts = np.zeros((area_num, criteria_num), dtype=np.int64)
+    gain_sums = np.zeros((area_num, criteria_num))
+    above_counts = np.zeros((area_num, criteria_num), dtype=np.int64)
+    best_gains = np.full((area_num, criteria_num), -np.inf)
+    best_sites = np.full((area_num, criteria_num), -1, dtype=np.int64)
+    histograms = np.zeros((criteria_num, area_num * bins), dtype=np.int64)
+    
+    for start, rows, codes, group_starts, gains in area_chunks():
+        group_codes = codes[group_starts]
+        counts[group_codes] += np.diff(np.r_[group_starts, len(rows)])
+        finite = np.isfinite(gains)
+        finite_counts[group_codes] += np.add.reduceat(finite.astype(np.int64), group_starts, axis=0)
+        gain_sums[group_codes] += np.add.reduceat(np.where(finite, gains, 0.), group_starts, axis=0)
+        above_counts[group_codes] += np.add.reduceat((gains > 0).astype(np.int64), group_starts, axis=0)
+        # Missing values are never the best
+        best_candidates = np.where(np.isnan(gains), -np.inf, gains)
+        chunk_best = np.maximum.reduceat(best_candidates, group_starts, axis=0)
+        for j in range(criteria_num):
+            # First location of every area with the highest gain of the chunk
+            is_best = best_candidates[:, j] == np.repeat(chunk_best[:, j], np.diff(np.r_[group_starts, len(rows)]))
+            best_positions = np.flatnonzero(is_best)
+            _, first = np.unique(codes[best_positions], return_index=True)
+            better = chunk_best[:, j] > best_gains[group_codes, j]
+            best_gains[group_codes[better], j] = chunk_best[better, j]
+            best_sites[group_codes[better], j] = start + rows[best_positions[first]][better]
+            binned = finite[:, j]
+            binned_codes = codes[binned]
+            gain_bins = np.clip(((gains[binned, j] - gain_min[binned_codes, j]) / bin_width[binned_codes, j]).astype(np.int64), 0, bins - 1)
+            histograms[j] += np.bincount(binned_codes * bins + gain_bins, minlength=area_num * bins)
+    
+    # Percentiles interpolated within histogram bins (criteria x areas x bins)
+    histograms = histograms.reshape(criteria_num, area_num, bins)
+    cumulative = np.cumsum(histograms, axis=2)
+    def gain_percentile(q):
+        target = q * finite_counts.T
+        percentile_bin = np.argmax(cumulative >= np.maximum(target, 1)[..., None], axis=2)
+        in_bin = np.take_along_axis(histograms, percentile_bin[..., None], axis=2)[..., 0]
+        before = np.take_along_axis(cumulative, percentile_bin[..., None], axis=2)[..., 0] - in_bin
+        fraction = np.clip((target - before) / np.maximum(in_bin, 1), 0, 1)
+        return gain_min + (percentile_bin + fraction).T * bin_width
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        summary = {"community_name": np.repeat(np.asarray(area_names, dtype=object), criteria_num),
+                   "criterion": np.tile(np.asarray(criteria, dtype=object), area_num),
+                   "locations": np.repeat(counts, criteria_num),
+                   "mean_gain": (gain_sums / finite_counts).ravel()}
+        for q in percentiles:
+            summary["median_gain" if q == 0.5 else f"p{round(q * 100):02d}_gain"] = gain_percentile(q).ravel()
+        summary["share_above_average"] = (above_counts / finite_counts).ravel()
+    best_sites = best_sites.ravel()
+    summary["best_site"] = np.where(best_sites >= 0, data.index.to_numpy()[np.maximum(best_sites, 0)], None)
+    summary["best_gain"] = np.where(best_sites >= 0, best_gains.ravel(), np.nan)
+    summary = pd.DataFrame(summary)
+    return summary[summary["locations"] > 0].reset_index(drop=True)
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+import numpy as np
+import pandas as pd
+
+# =============================================================================
+# Normalization
+# =============================================================================
+def normalize(data, types):
+    """
+    Calculate the column statistics and the normalizations of the decision
+    matrix shared by all ranking methods. Min-max and sum normalized values
+    are oriented so that higher is always better (cost criteria are reversed),
+    while vector normalized values keep their orientation, as in TOPSIS.
+    """
+    X = np.asarray(data, dtype=float)
+    maximize = np.array([typ == "max" for typ in types])
+
+    col_min = X.min(axis=0)
+    col_max = X.max(axis=0)
+    col_range = col_max - col_min
+    col_range[col_range == 0] = 1.
+
+    # Cost criteria are reversed as (max + min - x) before sum normalization,
+    # which keeps the values within the original range
+    oriented = np.where(maximize, X, col_max + col_min - X)
+    col_sum = oriented.sum(axis=0)
+    col_sum[col_sum == 0] = 1.
+
+    normalized = {"X": X,
+                  "maximize": maximize,
+                  "mean": X.mean(axis=0),
+                  "vector": X / np.sum(X * X, axis=0) ** (1/2),
+                  "minmax": np.where(maximize, X - col_min, col_max - X) / col_range,
+                  "sum": oriented / col_sum}
+    return normalized
+
+# =============================================================================
+# Ranking Methods
+# =============================================================================
+def TOPSIS_score(normalized, weights):
+    """
+    TOPSIS relative closeness to the ideal solution (vector normalization).
+    """
+    v = normalized["vector"] * weights
+    maximize = normalized["maximize"]
+    p_ideal = np.where(maximize, v.max(axis=0), v.min(axis=0))
+    n_ideal = np.where(maximize, v.min(axis=0), v.max(axis=0))
+    p_distance = np.sum((v - p_ideal) ** 2, axis=1) ** (1/2)
+    n_distance = np.sum((v - n_ideal) ** 2, axis=1) ** (1/2)
+    return n_distance / (p_distance + n_distance)
+
+
+def VIKOR_score(normalized, weights, strategy_coefficient=0.5):
+    """
+    VIKOR compromise score 1 - Q (min-max normalization), so that higher is
+    better like for the other methods.
+    """
+    regret = weights * (1 - normalized["minmax"])
+    S = regret.sum(axis=1)
+    R = regret.max(axis=1)
+    S_range = S.max() - S.min() if S.max() > S.min() else 1.
+    R_range = R.max() - R.min() if R.max() > R.min() else 1.
+    Q = strategy_coefficient * (S - S.min()) / S_range + (1 - strategy_coefficient) * (R - R.min()) / R_range
+    return 1 - Q
+
+
+def WSM_score(normalized, weights):
+    """
+    Weighted sum model (sum normalization).
+    """
+    return normalized["sum"] @ weights
+
+
+def WPM_score(normalized, weights):
+    """
+    Weighted product model (sum normalization), calculated in log space.
+    Alternatives with a zero normalized value get a zero score.
+    """
+    with np.errstate(divide="ignore"):
+        return np.exp(np.log(normalized["sum"]) @ weights)
+
+
+def difference_quantile(values, quantile, iterations=50):
+    """
+    Quantile of absolute differences of all pairs of values, found by
+    bisection over the difference: the number of pairs within a difference
+    is counted on the sorted values, without forming the pairs.
+    """
+    values = np.sort(values)
+    pair_num = len(values) * (len(values) - 1) / 2
+    low, high = 0., values[-1] - values[0]
+    for _ in range(iterations):
+        middle = (low + high) / 2
+        within = np.sum(np.searchsorted(values, values + middle, side="right") - np.arange(1, len(values) + 1))
+        if within >= quantile * pair_num:
+            high = middle
+        else:
+            low = middle
+    return high
+
+
+def PROMETHEE_II_score(normalized, weights, threshold_quantile=0.5):
+    """
+    PROMETHEE II net outranking flow with the V-shape preference function
+    P(a, b) = min(max(d, 0) / p, 1) of the difference d of min-max normalized
+    values. The preference threshold p of every criterion is the quantile of
+    absolute differences of all pairs of alternatives, so that a difference
+    larger than the typical one is a full preference. The sum of
+    P(a, b) - P(b, a) = clip(d / p, -1, 1) over all alternatives b is
+    calculated from sorted values and their cumulative sums, which gives the
+    exact net flow of all pairwise comparisons in O(n log n) per criterion.
+    """
+    alternative_num = len(normalized["minmax"])
+    if alternative_num < 2:
+        return np.zeros(alternative_num)
+    flow = np.zeros(alternative_num)
+    for j in range(normalized["minmax"].shape[1]):
+        r = normalized["minmax"][:, j]
+        values = np.sort(r)
+        p = difference_quantile(values, threshold_quantile)
+        if p > 0:
+            # Alternatives b with r_b <= r_a - p are fully preferred by a, and
+            # with r_b >= r_a + p fully preferred to a
+            below = np.searchsorted(values, r - p, side="right")
+            above = np.searchsorted(values, r + p, side="left")
+            cumulative = np.concatenate([[0.], np.cumsum(values)])
+            between = ((above - below) * r - (cumulative[above] - cumulative[below])) / p
+            net = below - (alternative_num - above) + between
+        else:
+            net = np.searchsorted(values, r, side="left") - (alternative_num - np.searchsorted(values, r, side="right"))
+        flow += weights[j] * net
+    return flow / (alternative_num - 1)
+
+
+def EDAS_score(normalized, weights):
+    """
+    Evaluation based on distance from average solution (EDAS) appraisal score.
+    """
+    X = normalized["X"]
+    mean = normalized["mean"]
+    mean = np.where(mean == 0, 1., mean)
+    distance = np.where(normalized["maximize"], X - normalized["mean"], normalized["mean"] - X) / np.abs(mean)
+    SP = np.maximum(distance, 0) @ weights
+    SN = np.maximum(-distance, 0) @ weights
+    NSP = SP / SP.max() if SP.max() > 0 else np.ones_like(SP)
+    NSN = 1 - SN / SN.max() if SN.max() > 0 else np.ones_like(SN)
+    return (NSP + NSN) / 2
+
+
+ranking_methods = {"TOPSIS": TOPSIS_score,
+                   "VIKOR": VIKOR_score,
+                   "WSM": WSM_score,
+                   "WPM": WPM_score,
+                   "PROMETHEE II": PROMETHEE_II_score,
+                   "EDAS": EDAS_score}
+
+# =============================================================================
+# Consensus Ranking
+# =============================================================================
+def ranks(scores):
+    """
+    Convert scores to ranks (1 is the best), ties keep their original order.
+    """
+    order = np.argsort(-scores, kind="stable")
+    rank = np.empty(len(scores), dtype=np.int64)
+    rank[order] = np.arange(1, len(scores) + 1)
+    return rank
+
+
+def borda_consensus(rank_matrix):
+    """
+    Borda count of the rankings (alternatives x methods), scaled to [0, 1].
+    """
+    alternative_num, method_num = rank_matrix.shape
+    if alternative_num < 2:
+        return np.ones(alternative_num)
+    return np.sum(alternative_num - rank_matrix, axis=1) / (method_num * (alternative_num - 1))
+
+
+def copeland_consensus(rank_matrix, chunk_size=1000):
+    """
+    Copeland score of the rankings (alternatives x methods), scaled to [-1, 1]:
+    the number of alternatives each alternative beats by a majority of methods,
+    minus the number of alternatives it loses to. Pairwise comparisons are
+    calculated in chunks of alternatives to keep the memory bounded.
+    """
+    alternative_num = len(rank_matrix)
+    if alternative_num < 2:
+        return np.zeros(alternative_num)
+    copeland = np.zeros(alternative_num)
+    for start in range(0, alternative_num, chunk_size):
+        chunk = rank_matrix[start:start+chunk_size]
+        majority = np.zeros((len(chunk), alternative_num), dtype=np.int64)
+        for m in range(rank_matrix.shape[1]):
+            majority += np.sign(rank_matrix[:, m][None, :] - chunk[:, m][:, None])
+        copeland[start:start+chunk_size] = np.sign(majority).sum(axis=1)
+    return copeland / (alternative_num - 1)
+
+
+def ensemble_ranking(data, weights, types, methods=None, consensus="borda"):
+    """
+    Rank alternatives with several ranking methods, which share one pass of
+    normalization, and combine their rankings into a consensus ranking.
+    Returns a data frame with the score and rank of every method, and the
+    consensus score and rank, indexed as the data.
+    """
+    if methods is None:
+        methods = list(ranking_methods.keys())
+    weights = np.asarray(weights, dtype=float)
+    normalized = normalize(data, types)
+
+    result = pd.DataFrame(index=data.index if isinstance(data, pd.DataFrame) else None)
+    rank_matrix = np.empty((len(normalized["X"]), len(methods)), dtype=np.int64)
+    for m, method in enumerate(methods):
+        scores = ranking_methods[method](normalized, weights)
+        rank_matrix[:, m] = ranks(scores)
+        result[f"{method}_score"] = scores
+        result[f"{method}_rank"] = rank_matrix[:, m]
+
+    if consensus == "borda":
+        consensus_score = borda_consensus(rank_matrix)
+    elif consensus == "copeland":
+        consensus_score = copeland_consensus(rank_matrix)
+    else:
+        raise ValueError(f"Invalid consensus mode: {consensus}")
+    result["consensus_score"] = consensus_score
+    result["consensus_rank"] = ranks(consensus_score)
+    return result
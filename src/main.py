@@ -3,17 +3,33 @@
 @author: Aneta Kartali
 """
 
+import glob
 import numpy as np
 import os
 import time
 
-from data_loading import load_file, update_data
-from data_selection import select_data, select_criteria, select_areas
-from decision_making import AHP, fuzzy_AHP, TOPSIS, fuzzy_TOPSIS, compare_locations
+from consensus import consensus_analysis
+from data_cube import DataCube, key_positions, period_slices, rank_volatility, persistent_top_k
+from data_loading import load_file, update_data, load_survey, derive_proximity_criteria, key_values
+from data_selection import select_data, select_criteria, select_areas, select_error_model, select_edits
+from decision_making import AHP, fuzzy_AHP, hierarchical_AHP, hierarchical_fuzzy_AHP, fuzzy_TOPSIS, compare_locations, summarize_locations
+from decision_making import rank_alternatives, guarded_TOPSIS, full_precision, compute_dtype, aggregate_fuzzy_weights
+from ensemble_ranking import ensemble_ranking
+from parallel_ranking import rank_areas
+from portfolio import select_portfolio
+from preview_ranking import preview_ranking, background_ranking
+from ranking_comparison import load_rankings, compare_rankings
+from resources import MemoryGovernor, TOPSIS_footprint, fuzzy_TOPSIS_footprint, simulation_footprint
+from resources import uncertainty_footprint, comparison_footprint, summary_footprint, preview_footprint, consensus_footprint
+from result_sink import ResultSink
+from what_if import WhatIfRanking
 from messages import info_message, invalid_input_message
 from messages import weighting_message, ranking_message, ranking_option_message
 from messages import evaluation_message, sensitivity_option_message, sensitivity_message
-from simulations import simulate_data, sensitivity_analysis
+from messages import top_k_message, preview_message, consensus_message, area_ranking_message, uncertainty_message, hierarchy_message
+from messages import ranking_comparison_message, adaptive_simulation_message, PCM_sampling_message
+from messages import scenario_option_message, what_if_message, portfolio_message, trajectory_message
+from simulations import evaluate_dataset, select_simulation, simulate_data, sensitivity_analysis, data_uncertainty_analysis
 
   
 # =============================================================================
@@ -33,37 +49,56 @@ def option_one():
     print("Load Data")
     print("-------------------------------------------------------")
     file_loaded = False
+    proximity = None
     data = load_file()
     if data is not None:
         file_loaded = True
-    return file_loaded, data
+        data, proximity = derive_proximity_criteria(data)
+    return file_loaded, data, proximity
 
 # =============================================================================
 # 2. Data Updating
 # =============================================================================
-def option_two(data):
+def option_two(data, key_index=None, proximity=None):
     print("\n-------------------------------------------------------")
     print("Update Data")
     print("-------------------------------------------------------")
     file_loaded = False
-    updated_data = update_data(data)
+    updated_data, key_index, proximity, change_set = update_data(data, key_index, proximity)
     if updated_data is not None:
         file_loaded = True
-    return file_loaded, data
+    return file_loaded, updated_data, key_index, proximity, change_set
 
 # =============================================================================
 # 3. Scenario Analysis
 # =============================================================================
-def option_three(data):
+def option_three(data, selected_data=None, types=None, weights=None, governor=None, what_if=None):
     print("\n-------------------------------------------------------")
     print("Scenario Analysis")
     print("-------------------------------------------------------")
-    result = evaluate_locations(data)
-    return result
+    print(scenario_option_message())
+    while(True):
+        print("1. Compare Locations to Average")
+        if weights is not None:
+            print("2. What-If Analysis")
+            print("3. Ranking Trajectories over Time")
+        print("4. Back to Main Menu")
+        sub_choice = input("Select an option (1-4): ")
+        
+        if sub_choice == "1":
+            return evaluate_locations(data, governor), what_if
+        elif sub_choice == "2" and weights is not None:
+            return evaluate_what_if(data, selected_data, types, weights, what_if)
+        elif sub_choice == "3" and weights is not None:
+            return evaluate_trajectories(data, selected_data, types, weights, governor), what_if
+        elif sub_choice == "4":
+            return None, what_if
+        else:
+            print(invalid_input_message())
 
-def evaluate_locations(data):
+def evaluate_locations(data, governor):
     print(evaluation_message())
-    areas = list(data.sort_values("community_name")["community_name"].unique())
+    areas = sorted(data["community_name"].unique())
     area_selection = select_areas(areas)
     if area_selection is None:
         print("\nScenario analysis was unsuccessful.")
@@ -73,12 +108,108 @@ def evaluate_locations(data):
     if criteria_selection is None:
         print("\nScenario analysis was unsuccessful.")
         return None
-    selected_data = data.copy()
-    selected_data = selected_data[selected_data["community_name"].isin(area_selection)]
-    selected_data = selected_data[criteria_selection].astype(float)
-    result = compare_locations(data, selected_data, criteria_selection)
+    while(True):
+        response = input("Do you want location-level results in addition to area summaries? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            location_level = True
+            break
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            location_level = False
+            break
+        else:
+            print(invalid_input_message())
+    chunk_size = governor.chunk_size(summary_footprint(1, len(criteria_selection)), len(data),
+                                     summary_footprint(0, len(criteria_selection), len(area_selection), len(data)))
+    with governor.stage("Scenario analysis", summary_footprint(len(data), len(criteria_selection), len(area_selection), len(data))) as stage:
+        stage["chunk_size"] = chunk_size
+        summary = summarize_locations(data, criteria_selection, area_selection, chunk_size)
+    print(f"\nSummary of location gains by area:\n{summary.head(10)}")
+    if not location_level:
+        return summary
+    selected_data = data[data["community_name"].isin(area_selection)]
+    with governor.stage("Location-level scenario analysis", comparison_footprint(len(selected_data), len(criteria_selection))):
+        result = compare_locations(data, selected_data[criteria_selection].astype(float), criteria_selection)
+    result["distance_from_offshore_wind_farm"] = selected_data["distance_from_offshore_wind_farm"]
+    result["community_name"] = selected_data["community_name"]
+    return {"scenario_analysis": summary, "scenario_details": result}
+
+def evaluate_what_if(data, selected_data, types, weights, what_if=None):
+    print(what_if_message())
+    edits = select_edits(data.loc[selected_data.index], list(selected_data.columns))
+    if edits is None:
+        print("\nWhat-if analysis was unsuccessful.")
+        return None, what_if
+    # The ranking is scored once per selection and weights, and every what-if
+    # question only re-scores the edited criteria
+    if what_if is None:
+        what_if = WhatIfRanking(full_precision(selected_data, data), weights, types)
+    try:
+        changes = what_if.what_if(edits)
+    except (KeyError, ValueError) as e:
+        print(f"\nAn error occurred: {str(e)}")
+        print("\nWhat-if analysis was unsuccessful.")
+        return None, what_if
+    changes["distance_from_offshore_wind_farm"] = data.loc[changes.index]["distance_from_offshore_wind_farm"]
+    changes["community_name"] = data.loc[changes.index]["community_name"]
+    print(f"\nRanks of the best ranked and changed locations after the changes:\n{changes}")
+    print("\nWhat-if analysis successful.")
+    return changes, what_if
+
+def evaluate_trajectories(data, selected_data, types, weights, governor):
+    print(trajectory_message())
+    directory = input("Please enter the data cube folder (press Enter for data_cube): ").strip() or "data_cube"
+    try:
+        cube = DataCube(directory, selected_data.index, list(selected_data.columns), compute_dtype(selected_data))
+    except ValueError as e:
+        print(f"\n{str(e)} Please select another folder.")
+        print("\nTrajectory analysis was unsuccessful.")
+        return None
+    key = ["site_id"] if "site_id" in data.columns else ["site_index"]
+    site_keys = key_values(data.loc[selected_data.index], key)
+    while(True):
+        print(f"\nPeriods in the data cube: {', '.join(cube.periods) if cube.periods else 'none'}")
+        response = input("Do you want to add data of a period? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            period_data = load_file()
+            if period_data is None:
+                continue
+            if "period" not in period_data.columns:
+                period_data["period"] = input("Please enter the period of the data (e.g. 2024): ").strip()
+            try:
+                positions = key_positions(site_keys, key_values(period_data, key))
+                # Values are carried over from the preceding period in time
+                def base(period):
+                    values = cube.preceding_values(period)
+                    return selected_data.to_numpy() if values is None else values
+                for period, values, matched in period_slices(period_data, positions, cube.criteria, base):
+                    cube.add_period(period, values)
+                    print(f"Period {period} added: {matched} locations updated.")
+            except Exception as e:
+                print(f"\nAn error occurred: {str(e)}")
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            break
+        else:
+            print(invalid_input_message())
+    if not cube.periods:
+        print("\nTrajectory analysis was unsuccessful.")
+        return None
+    k = input("Please enter the number of best ranked locations to track (press Enter for 10): ").strip()
+    k = int(k) if k.isdigit() and int(k) > 0 else 10
+    start_time = time.perf_counter()
+    with governor.stage("Trajectory ranking", TOPSIS_footprint(len(cube.sites), len(cube.criteria), cube.dtype.itemsize, len(cube.periods))):
+        ranks = cube.ranks(weights, types, governor.budget)
+    result = rank_volatility(ranks)
+    result["top_k_share"] = (ranks <= k).mean()
+    for period in ranks.index:
+        result[f"rank_{period}"] = ranks.loc[period]
+    result = result.sort_values("mean_rank")
     result["distance_from_offshore_wind_farm"] = data.loc[result.index]["distance_from_offshore_wind_farm"]
     result["community_name"] = data.loc[result.index]["community_name"]
+    print(f"\nRanked {len(ranks.columns)} locations in {len(ranks)} periods in {time.perf_counter() - start_time:.2f} s.")
+    persistent = persistent_top_k(ranks, k)
+    print(f"\nLocations among the {k} best ranked in all periods:\n{persistent if not persistent.empty else 'none'}")
+    print(f"\nMost volatile of the best ranked locations:\n{result[result['best_rank'] <= k].sort_values('rank_std', ascending=False)[['mean_rank', 'best_rank', 'worst_rank', 'rank_std']].head(10)}")
+    print("\nTrajectory analysis successful.")
     return result
 
 # =============================================================================
@@ -99,23 +230,147 @@ def option_four(data):
 # =============================================================================
 # 5. Ranking
 # =============================================================================
-def option_five(data, selected_data, criteria, types):
+def option_five(data, selected_data, criteria, types, governor, sink):
     print("\n-------------------------------------------------------")
     print("Rank Alternative Locations")
     print("-------------------------------------------------------")
     print(ranking_option_message())
-    ranking = get_ranking(selected_data, criteria, types)
+    area_ranking = select_area_ranking()
+    preview = not area_ranking and select_preview()
+    k = select_top_k(len(selected_data))
+    if area_ranking:
+        areas = data["community_name"].loc[selected_data.index]
+        ranking, weights, fuzzy_model, deferred = get_ranking(selected_data, criteria, types, governor, sink, areas, k, reference=data)
+    else:
+        ranking, weights, fuzzy_model, deferred = get_ranking(selected_data, criteria, types, governor, sink, k=k, reference=data, preview=preview)
+    if deferred:
+        # TOPSIS ranking is previewed on a sample, and the full ranking runs in the background
+        areas = data["community_name"].loc[selected_data.index]
+        with governor.stage("Preview ranking", preview_footprint(len(selected_data), len(criteria))) as stage:
+            result, stage["sample_size"] = preview_ranking(full_precision(selected_data, data), areas, weights, types, 10 if k is None else k)
+        print(f"Best ranked alternatives of the sample are:\n{result[['community_name', 'Ranking', 'score_lower', 'score_upper', 'estimated_rank', 'rank_lower', 'rank_upper']].head(10)}")
+        itemsize = np.dtype(compute_dtype(selected_data)).itemsize
+        chunk_size = governor.chunk_size(TOPSIS_footprint(1, len(criteria), itemsize), len(selected_data))
+        full_ranking = background_ranking(data, selected_data, weights, types, k, chunk_size)
+        print("\nFull ranking continues in the background.")
+        return result, weights, fuzzy_model, full_ranking
     if ranking is not None:
-        result = selected_data.copy()
-        result["Ranking"] = ranking
-        result.sort_values("Ranking", ascending=False, inplace=True)
-        result["community_name"] = data.loc[result.index]["community_name"]
-        print(f"Best ranked alternative is:\n{result.iloc[0]}")
-        return result
+        if area_ranking:
+            result = ranking
+            print(f"Best ranked alternatives in each area are:\n{result[result['area_rank'] == 1]}")
+        else:
+            result = rank_alternatives(data, selected_data, ranking, k)
+            print(f"Best ranked alternative is:\n{result.iloc[0]}")
+        evaluate_portfolio(data, result, sink)
+        return result, weights, fuzzy_model, None
     else:
+        return None, None, None, None
+
+def evaluate_portfolio(data, result, sink):
+    print(portfolio_message())
+    while(True):
+        response = input("Do you want to select a portfolio of locations? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            break
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            return None
+        else:
+            print(invalid_input_message())
+    try:
+        target_capacity = float(input("Target total potential wind farm capacity: "))
+        max_per_community = input("Maximum number of locations per area (press Enter for no limit): ")
+        max_per_community = int(max_per_community) if max_per_community else None
+        min_spacing = input("Minimum difference in distance from shore between selected locations (press Enter for no limit): ")
+        min_spacing = float(min_spacing) if min_spacing else 0.
+    except ValueError:
+        print(invalid_input_message())
+        print("\nPortfolio selection was unsuccessful.")
+        return None
+    
+    locations = data.loc[result.index]
+    selection, summary = select_portfolio(result["Ranking"], locations["potential_wind_farm_capacity"], locations["community_name"],
+                                          locations["distance_from_offshore_wind_farm"], target_capacity, max_per_community, min_spacing)
+    if selection is None:
+        print("\nNo portfolio of locations reaches the target capacity under the given constraints.")
         return None
+    portfolio = result.iloc[selection].copy()
+    for column in ["potential_wind_farm_capacity", "distance_from_offshore_wind_farm", "community_name"]:
+        portfolio[column] = locations[column].iloc[selection]
+    print(f"\nSelected portfolio of {summary['locations']} locations with total capacity {summary['capacity']}:\n{portfolio}")
+    print(f"Portfolio cost {summary['cost']:.4f}, lower bound {summary['lower_bound']:.4f}, optimality gap {summary['gap']:.2%}" +
+          (" (optimal)." if summary["optimal"] else f" (search stopped after {summary['nodes']} nodes)."))
+    path = sink.save("portfolio", portfolio, {"target_capacity": target_capacity, "max_per_community": max_per_community,
+                                              "min_spacing": min_spacing})
+    print(f"Portfolio is being saved to {path}.")
+    return portfolio
+
+def select_area_ranking():
+    print(area_ranking_message())
+    while(True):
+        response = input("Do you want to rank locations within each area separately? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            return True
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            return False
+        else:
+            print(invalid_input_message())
+
+def select_preview():
+    print(preview_message())
+    while(True):
+        response = input("Do you want to preview the ranking on a sample of locations? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            return True
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            return False
+        else:
+            print(invalid_input_message())
+
+def select_hierarchy():
+    print(hierarchy_message())
+    while(True):
+        response = input("Do you want to use hierarchical AHP over stakeholder criteria groups? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            return True
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            return False
+        else:
+            print(invalid_input_message())
+
+def select_PCM_sampling():
+    print(PCM_sampling_message())
+    while(True):
+        response = input("Do you want to simulate near-consistent pairwise comparisons? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            return "latent"
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            return "uniform"
+        else:
+            print(invalid_input_message())
+
+def select_adaptive_simulation():
+    print(adaptive_simulation_message())
+    while(True):
+        response = input("Do you want to simulate stakeholders until criteria weights and ranking converge? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            return True
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+            return False
+        else:
+            print(invalid_input_message())
+
+def select_top_k(alternative_num):
+    print(top_k_message())
+    while(True):
+        k = input("Number of best ranked locations to keep: ")
+        if k == "":
+            return None
+        elif k.isnumeric() and int(k) > 0:
+            return min(int(k), alternative_num)
+        else:
+            print(invalid_input_message())
     
-def get_ranking(data, criteria, types):
+def get_ranking(data, criteria, types, governor, sink, areas=None, k=None, reference=None, preview=False):
     
     print(weighting_message())
     while(True):
@@ -126,7 +381,7 @@ def get_ranking(data, criteria, types):
         print("4. Back to Main Menu")
         sub_choice = input("Select an option (1-4): ")
         
-        simulated_weights = False
+        stakeholder_weights = False
         uncertain_decision_making = False
         
         if sub_choice == "1":
@@ -135,73 +390,192 @@ def get_ranking(data, criteria, types):
             break
         
         elif sub_choice == "2" and len(criteria) > 1:
-            print("\nPlease note that this option is currently unavailable and select another option.\n")
+            PCM_list, groups = load_survey(criteria)
+            if PCM_list is None:
+                continue
+            stakeholder_weights = True
+            # Fuzzy TOPSIS evaluates locations on the 9-point scale derived
+            # from the data, since the survey contains only criteria judgements
+            DM_list = [evaluate_dataset(data)]
+            response = input("Do you want to consider uncertainty of stakeholder judgements? (YES/NO)")
+            if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+                uncertain_decision_making = True
+                weights, fuzzy_weights_list = fuzzy_AHP(PCM_list)
+                if weights is None:
+                    print("\nUnable to calculate weights from the survey.")
+                    return None, None, None, False
+                break
+            elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
+                weights = AHP(PCM_list)
+                break
+            else:
+                print(invalid_input_message())
             
         elif sub_choice == "3" and len(criteria) > 1:
-            simulated_weights = True
-            PCM_list, DM_list = simulate_data(data)
-            if PCM_list is None and DM_list is None:
-                return None
+            stakeholder_weights = True
+            hierarchical = select_hierarchy()
+            # Hierarchical simulation always samples near-consistent comparisons
+            PCM_sampling = "latent" if hierarchical else select_PCM_sampling()
+            adaptive = select_adaptive_simulation()
+            selection = select_simulation(data, types)
+            if selection is None:
+                return None, None, None, False
+            # Decision matrices of all simulated stakeholders are kept in memory,
+            # which limits the number of adaptively simulated stakeholders
+            fixed_bytes = simulation_footprint(0, len(data), len(criteria))
+            stakeholder_bytes = simulation_footprint(1, len(data), len(criteria)) - fixed_bytes
+            max_stakeholders = governor.chunk_size(stakeholder_bytes, 10000, fixed_bytes)
+            # Without adaptive simulation, 5 stakeholders of at most 4 groups are simulated
+            with governor.stage("Stakeholder simulation", simulation_footprint(max_stakeholders if adaptive else 20, len(data), len(criteria))) as stage:
+                if adaptive:
+                    stage["max_stakeholders"] = max_stakeholders
+                PCM_list, DM_list, groups = simulate_data(data, selection, sink, hierarchical, adaptive, max_stakeholders, PCM_sampling)
             response = input("Do you want to simulate uncertain stakeholder decision making? (YES/NO)")
             if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
                 uncertain_decision_making = True
-                weights, fuzzy_weights_list = fuzzy_AHP(PCM_list)
+                if hierarchical:
+                    weights, fuzzy_weights_list = hierarchical_fuzzy_AHP(PCM_list)
+                else:
+                    weights, fuzzy_weights_list = fuzzy_AHP(PCM_list)
                 if weights is None:
                     print("\nUnable to simulate decision making.")
-                    return None
+                    return None, None, None, False
                 break
             elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
-                weights = AHP(PCM_list)
+                weights = hierarchical_AHP(PCM_list) if hierarchical else AHP(PCM_list)
                 break
             else:
                 print(invalid_input_message())
                 
         elif sub_choice == "4":
-            return None
+            return None, None, None, False
         else:
             print(invalid_input_message())
     
+    if stakeholder_weights and len(np.unique(groups)) > 1:
+        evaluate_consensus(data, PCM_list, groups, criteria, types, governor, sink, k)
     
     print(ranking_message())
     while(True):
         print("1. TOPSIS ranking")
-        if simulated_weights and uncertain_decision_making:
+        if stakeholder_weights and uncertain_decision_making and areas is None:
             print("2. Fuzzy TOPSIS ranking")
-        print("3. Back to Main Menu")
-        sub_choice = input("Select an option (1-3): ")
+        if areas is None:
+            print("3. Ensemble ranking (TOPSIS, VIKOR, WSM, WPM, PROMETHEE II, EDAS)")
+        print("4. Back to Main Menu")
+        sub_choice = input("Select an option (1-4): ")
         
         if sub_choice == "1":
+            itemsize = np.dtype(compute_dtype(data)).itemsize
             try:
-                ranking = TOPSIS(data, weights, types)
+                if areas is not None:
+                    # Workers rank one area each, next to the decision matrix and its shared copy
+                    shared_bytes = 2 * len(data) * len(criteria) * 8
+                    area_bytes = TOPSIS_footprint(areas.value_counts().max(), len(criteria))
+                    with governor.stage("Area ranking", shared_bytes + area_bytes) as stage:
+                        stage["workers"] = governor.workers(area_bytes, areas.nunique(), shared_bytes)
+                        ranking = rank_areas(full_precision(data, reference), areas, weights, types, k, stage["workers"])
+                elif preview:
+                    # The full ranking is deferred to the background, after the preview
+                    return None, weights, None, True
+                else:
+                    with governor.stage("Ranking", TOPSIS_footprint(len(data), len(criteria), itemsize)) as stage:
+                        stage["chunk_size"] = governor.chunk_size(TOPSIS_footprint(1, len(criteria), itemsize), len(data))
+                        ranking = guarded_TOPSIS(data, weights, types, reference, k, chunk_size=stage["chunk_size"], verbose=True)
                 print("\nRanking of alternative locations completed sucessfully.")
-                return ranking
+                return ranking, weights, None, False
             except Exception as e:
                 print(f"\nAn error occurred: {str(e)}")
-                return None
+                return None, None, None, False
             
-        elif sub_choice == "2" and simulated_weights and uncertain_decision_making:
+        elif sub_choice == "2" and stakeholder_weights and uncertain_decision_making and areas is None:
             try:
-                ranking = fuzzy_TOPSIS(fuzzy_weights_list, DM_list, types)
+                # Stakeholders are fuzzified and aggregated in chunks
+                fixed_bytes = fuzzy_TOPSIS_footprint(0, len(data), len(criteria))
+                stakeholder_bytes = fuzzy_TOPSIS_footprint(1, len(data), len(criteria)) - fixed_bytes
+                with governor.stage("Fuzzy ranking", fuzzy_TOPSIS_footprint(len(DM_list), len(data), len(criteria))) as stage:
+                    stage["chunk_size"] = governor.chunk_size(stakeholder_bytes, len(DM_list), fixed_bytes)
+                    ranking, fuzzy_DM = fuzzy_TOPSIS(fuzzy_weights_list, DM_list, types, stage["chunk_size"])
+                # Sensitivity analysis re-scores locations with the aggregated fuzzy weights and decision matrix
+                fuzzy_model = (aggregate_fuzzy_weights(fuzzy_weights_list).tolist(), fuzzy_DM)
                 print("\nRanking of alternative locations completed sucessfully.")
-                return ranking
+                return ranking, weights, fuzzy_model, False
             except Exception as e:
                 print(f"\nAn error occurred: {str(e)}")
-                return None
-            return ranking
+                return None, None, None, False
         
-        elif sub_choice == "3":
+        elif sub_choice == "3" and areas is None:
+            try:
+                with governor.stage("Ensemble ranking"):
+                    ensemble = ensemble_ranking(full_precision(data, reference), weights, types)
+                method_ranks = [column for column in ensemble.columns if column.endswith("_rank")]
+                print(f"\nRanks of the best ranked alternatives by each method:\n{ensemble.sort_values('consensus_rank')[method_ranks].head()}")
+                print("\nRanking of alternative locations completed sucessfully.")
+                return ensemble["consensus_score"].to_numpy(), weights, None, False
+            except Exception as e:
+                print(f"\nAn error occurred: {str(e)}")
+                return None, None, None, False
+        
+        elif sub_choice == "4":
+            return None, None, None, False
+        else:
+            print(invalid_input_message())
+
+def evaluate_consensus(data, PCM_list, groups, criteria, types, governor, sink, k=None):
+    print(consensus_message())
+    while(True):
+        response = input("Do you want to compare rankings of stakeholder groups? (YES/NO) ")
+        if response == "YES" or response == "Y" or response == "Yes" or response == "yes" or response == "y":
+            break
+        elif response == "NO" or response == "N" or response == "No" or response == "no" or response == "n":
             return None
         else:
             print(invalid_input_message())
+    group_num = len(np.unique(groups))
+    k = 10 if k is None else k
+    try:
+        # Groups are ranked together, as many at once as fit the memory budget
+        with governor.stage("Consensus analysis", consensus_footprint(group_num, len(data), len(criteria))) as stage:
+            stage["group_chunk"] = governor.chunk_size(consensus_footprint(1, len(data), len(criteria)), group_num)
+            result = consensus_analysis(data, PCM_list, groups, criteria, types, k, stage["group_chunk"])
+    except Exception as e:
+        print(f"\nAn error occurred: {str(e)}")
+        return None
+    print(f"\nCriteria weights of stakeholder groups:\n{result['group_weights'].T}")
+    print(f"\nConflict between stakeholder groups (share of discordant pairs of locations):\n{result['conflict_matrix']}")
+    print(f"\nCompromise locations ranked highly by every group:\n{result['compromise']}")
+    for name in ["stakeholder_weights", "group_weights", "group_top_k", "group_conflict", "compromise"]:
+        path = sink.save(f"consensus_{name}", result[name], run_parameters(criteria, types))
+        print(f"Consensus analysis results are being saved to {path}.")
+    return result
 
 # =============================================================================
 # 6. Sensitivity Analysis
 # =============================================================================    
-def option_six(data, selected_data, criteria, types, ranking):
+def option_six(data, selected_data, criteria, types, ranking, weights, fuzzy_model, governor, results_directory="results"):
     print("\n-------------------------------------------------------")
     print("Sensitivity Analysis")
     print("-------------------------------------------------------")
     print(sensitivity_option_message())
+    while(True):
+        print("1. Weight Sensitivity Analysis")
+        print("2. Data Uncertainty Analysis")
+        print("3. Ranking Comparison")
+        print("4. Back to Main Menu")
+        sub_choice = input("Select an option (1-4): ")
+        
+        if sub_choice == "1":
+            return evaluate_sensitivity(data, selected_data, criteria, types, ranking, weights, fuzzy_model, governor)
+        elif sub_choice == "2":
+            return evaluate_uncertainty(data, selected_data, criteria, types, weights, governor)
+        elif sub_choice == "3":
+            return evaluate_rankings(results_directory)
+        elif sub_choice == "4":
+            return None
+        else:
+            print(invalid_input_message())
+
+def evaluate_sensitivity(data, selected_data, criteria, types, ranking, weights, fuzzy_model, governor):
     print(sensitivity_message())
     rank_selection = input("Offshore wind farm location rank: ")
     alternative_num = len(ranking)
@@ -214,10 +588,68 @@ def option_six(data, selected_data, criteria, types, ranking):
         return None
     selection_index = ranking.index[rank_selection-1]
     print(f"You have selected the following offshore wind farm location for sensitivity analysis:\n{data.loc[selection_index]}")
-    sensitivity = sensitivity_analysis(data, selected_data, criteria, types, selection_index)
+    # Stream the decision matrix if TOPSIS of the whole matrix does not fit the budget
+    footprint = TOPSIS_footprint(len(selected_data), len(criteria))
+    with governor.stage("Sensitivity analysis", footprint) as stage:
+        chunk_size = None if governor.fits(footprint) else governor.chunk_size(TOPSIS_footprint(1, len(criteria)), len(selected_data))
+        stage["chunk_size"] = chunk_size or len(selected_data)
+        sensitivity = sensitivity_analysis(data, selected_data, criteria, types, selection_index, weights, fuzzy_model, chunk_size)
     print("\nSensitivity analysis successful.")
     return sensitivity
 
+def evaluate_uncertainty(data, selected_data, criteria, types, weights, governor):
+    print(uncertainty_message())
+    error_model = select_error_model(criteria)
+    if error_model is None:
+        print("\nData uncertainty analysis was unsuccessful.")
+        return None
+    realization_num = input("Number of Monte Carlo realizations (press Enter for 1000): ")
+    k = input("Number of best ranked locations to consider (press Enter for 10): ")
+    if (realization_num != "" and not realization_num.isnumeric()) or (k != "" and not k.isnumeric()):
+        print("\nData uncertainty analysis was unsuccessful.")
+        return None
+    realization_num = int(realization_num) if realization_num != "" else 1000
+    k = int(k) if k != "" else 10
+    if weights is None:
+        weights = np.zeros(len(criteria)) + (1. / len(criteria))
+    # Rank statistics of all alternatives are kept next to batches of realizations
+    itemsize = np.dtype(compute_dtype(selected_data)).itemsize
+    fixed_bytes = uncertainty_footprint(len(selected_data), len(criteria), 0)
+    with governor.stage("Data uncertainty analysis", uncertainty_footprint(len(selected_data), len(criteria), realization_num, itemsize)) as stage:
+        stage["realizations_per_batch"] = governor.chunk_size(TOPSIS_footprint(len(selected_data), len(criteria), itemsize), realization_num, fixed_bytes)
+        uncertainty = data_uncertainty_analysis(selected_data, weights, types, error_model, realization_num, k, max(governor.budget - fixed_bytes, 0))
+    uncertainty["distance_from_offshore_wind_farm"] = data.loc[uncertainty.index]["distance_from_offshore_wind_farm"]
+    uncertainty["community_name"] = data.loc[uncertainty.index]["community_name"]
+    print(f"\nMost robust offshore wind farm locations are:\n{uncertainty.head()}")
+    print("\nData uncertainty analysis successful.")
+    return uncertainty
+
+def evaluate_rankings(results_directory="results"):
+    print(ranking_comparison_message())
+    file_paths = input("Type paths to ranking files here: ")
+    if file_paths == "":
+        file_paths = sorted(glob.glob("ranking_*.csv") + glob.glob(os.path.join(results_directory, "ranking_*.csv"))
+                            + glob.glob(os.path.join(results_directory, "ranking", "run=*")))
+    else:
+        file_paths = [file_path.strip() for file_path in file_paths.split(",")]
+    if len(file_paths) < 2:
+        print("\nAt least two rankings are needed. Ranking comparison was unsuccessful.")
+        return None
+    k = input("Number of best ranked locations to compare (press Enter for 10): ")
+    if k != "" and not k.isnumeric():
+        print("\nRanking comparison was unsuccessful.")
+        return None
+    k = int(k) if k != "" else 10
+    try:
+        comparison = compare_rankings(load_rankings(file_paths), k)
+    except Exception as e:
+        print(f"\nAn error occurred: {str(e)}")
+        print("\nRanking comparison was unsuccessful.")
+        return None
+    print(f"\nRanking comparison:\n{comparison}")
+    print("\nRanking comparison successful.")
+    return comparison
+
 # =============================================================================
 # 7. Exit
 # =============================================================================    
@@ -230,17 +662,51 @@ def option_seven():
 # =============================================================================
 # Main console UI
 # =============================================================================
-def console_ui():
+def run_parameters(criteria=None, types=None, weights=None):
+    return {"criteria": criteria, "types": types, "weights": None if weights is None else list(np.asarray(weights, dtype=float))}
+
+def collect_ranking(full_ranking, sink, parameters):
+    try:
+        ranking = full_ranking.result()
+    except Exception as e:
+        print(f"\nFull ranking was unsuccessful: {str(e)}")
+        return None, False
+    path = sink.save("ranking", ranking, parameters)
+    print(f"\nFull ranking is finished and replaces the preview. Best ranked alternative is:\n{ranking.iloc[0]}")
+    print(f"Ranking results are being saved to {path}.")
+    return ranking, True
+
+def cancel_ranking(full_ranking):
+    # A discarded full ranking stops in the background
+    if full_ranking is not None:
+        full_ranking.cancel()
+    return None
+
+def console_ui(output_format="parquet", output_directory="results", memory_budget=None):
     
     file_loaded = False
     constraints_selected = False
     alternatives_ranked = True
+    selected_data, types, weights = None, None, None
+    ranking, full_ranking = None, None
+    fuzzy_model = None
+    what_if = None
+    key_index = None
+    proximity = None
+    criteria = None
+    sink = ResultSink(output_directory, output_format)
+    governor = MemoryGovernor(memory_budget)
     os.system('cls' if os.name == 'nt' else 'clear')
     print("========================================================")
     print("  Welcome to the Offshore Wind Farm Location Evaluator  ")
     print("========================================================")
     
     while(True):
+        sink.report()
+        # The full ranking replaces the preview when it is finished
+        if full_ranking is not None and full_ranking.done():
+            ranking, alternatives_ranked = collect_ranking(full_ranking, sink, run_parameters(criteria, types, weights))
+            full_ranking = None
         print("\n")
         print("0. Information")
         print("1. Load Data")
@@ -260,40 +726,69 @@ def console_ui():
             option_zero()
             
         elif choice == "1":
-            file_loaded, data = option_one()
+            file_loaded, data, proximity = option_one()
             alternatives_ranked = False
+            weights = None
+            fuzzy_model = None
+            what_if = None
+            full_ranking = cancel_ranking(full_ranking)
+            key_index = None
             
         elif choice in ["2", "3", "4", "5"] and not file_loaded:
             print("Please load a file first (Option 1).")
         
         elif choice == "2" and file_loaded:
-            file_loaded, data = option_two(data)
-            alternatives_ranked = False
+            file_loaded, data, key_index, proximity, change_set = option_two(data, key_index, proximity)
+            # Results stay valid if the update did not change any location
+            if change_set is None or len(change_set["updated"]) or len(change_set["inserted"]) or len(change_set["deleted"]):
+                alternatives_ranked = False
+                weights = None
+                fuzzy_model = None
+                what_if = None
+                full_ranking = cancel_ranking(full_ranking)
             
         elif choice == "3" and file_loaded:
-            location_assessment = option_three(data)
+            location_assessment, what_if = option_three(data, selected_data, types, weights, governor, what_if)
             if location_assessment is not None:
-                location_assessment.to_csv(f"scenario_analysis_{time.strftime('%Y%m%d-%H%M%S')}.csv", index=False)  
-                print("Scenario analysis results saved to a file.")
+                # Grouped scenario analysis may also return location-level results
+                if not isinstance(location_assessment, dict):
+                    location_assessment = {"scenario_analysis": location_assessment}
+                for name, result in location_assessment.items():
+                    path = sink.save(name, result, run_parameters(criteria, types, weights))
+                    print(f"Scenario analysis results are being saved to {path}.")
                 
         elif choice == "4" and file_loaded:
             constraints_selected, selected_data, criteria, types = option_four(data)
+            weights = None
+            fuzzy_model = None
+            what_if = None
+            full_ranking = cancel_ranking(full_ranking)
             
         elif choice == "5" and file_loaded and constraints_selected:
-            ranking = option_five(data, selected_data, criteria, types)
+            full_ranking = cancel_ranking(full_ranking)
+            ranking, weights, fuzzy_model, full_ranking = option_five(data, selected_data, criteria, types, governor, sink)
+            what_if = None
             if ranking is not None:
                 alternatives_ranked = True
-                ranking.to_csv(f"ranking_{time.strftime('%Y%m%d-%H%M%S')}.csv", index=False)  
-                print("Ranking results saved to a file.")
+                path = sink.save("ranking" if full_ranking is None else "ranking_preview", ranking, run_parameters(criteria, types, weights))
+                print(f"Ranking results are being saved to {path}.")
             
         elif choice == "6" and file_loaded and constraints_selected and alternatives_ranked:
-            sensitivity = option_six(data, selected_data, criteria, types, ranking)
+            if full_ranking is not None:
+                print("\nWaiting for the full ranking to finish...")
+                ranking, alternatives_ranked = collect_ranking(full_ranking, sink, run_parameters(criteria, types, weights))
+                full_ranking = None
+                if not alternatives_ranked:
+                    input("\nPress Enter to continue ")
+                    continue
+            sensitivity = option_six(data, selected_data, criteria, types, ranking, weights, fuzzy_model, governor, sink.directory)
             if sensitivity is not None:
-                sensitivity.to_csv(f"sensitivity_{time.strftime('%Y%m%d-%H%M%S')}.csv", index=False)  
-                print("Sensitivity analysis results saved to a file.")
+                path = sink.save("sensitivity", sensitivity, run_parameters(criteria, types, weights))
+                print(f"Sensitivity analysis results are being saved to {path}.")
         
         elif choice == "7":
             option_seven()
+            sink.close()
             break
         else:
             print(invalid_input_message())
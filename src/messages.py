@@ -12,6 +12,15 @@ def invalid_input_message():
 def load_file_message():
     return "\nData should be stored in a tabular form, in a .txt or .csv file. Please enter the path to file containing the data:\n"
 
+def proximity_message():
+    return "\nThe loaded data contains coordinates of locations (latitude and longitude columns, in degrees). Proximity criteria can be derived from them: distance from the nearest offshore wind farm (km) and the number of offshore wind farms within a radius, from a file of wind farm coordinates, and optionally the nearest community and the distance from it (km), from a file of community coordinates with community_name column. Derived criteria replace existing columns with the same name, except community_name, where only missing names are filled in. Derived criteria are kept up to date when the data is updated (Option 2).\n"
+
+def update_message():
+    return "\nUpdates are matched to existing locations by a site key: row labels of the loaded data (site_index column in the update, as in saved results), an explicit site id, or a combination of criteria (e.g. community_name, distance_from_offshore_wind_farm). Matched locations are updated with the criteria values of the update, locations with a new key are inserted, and matched locations with a true value in the delete column are deleted.\n"
+
+def survey_message():
+    return "\nSurvey responses should be stored in a long tabular form, in a .csv, .txt or .parquet file, with columns respondent, group, criterion_i, criterion_j and score. Score is the importance of criterion_i compared to criterion_j on Saaty's scale (1/9 to 9). Every respondent should compare all pairs of selected criteria. Please enter the path to file containing the survey responses:\n"
+
 def select_data_message():
     return "\nYou can select the data you want to consider in the analysis by specifying criteria types that will be used and criteria constraints that will be applied to your data.\n"
 
@@ -27,11 +36,20 @@ def constraints_message():
 def restrictions_message():
     return "\nFor each of the criteria you selected, you need to specify a threshold value above which the data is not valid for analysis. Defining constraints is an inportant aspect of the decision making process.\n"
     
+def criteria_reduction_message():
+    return "\nStrongly dependent criteria (e.g. fishing dependency and fish stock health) describe the same effect and count it more than once, while every additional criterion adds pairwise comparisons for stakeholders, values to rank and sensitivity analysis runs. Redundant criteria are detected with correlation and mutual information, and only one representative criterion of every group of redundant criteria is kept.\n"
+
+def precision_message():
+    return "\nSelected data can be stored and ranked in single precision (float32), which halves the memory of the decision matrix and speeds up ranking and data uncertainty analysis of large datasets. Locations with nearly equal scores are re-scored in double precision from the loaded data, so the ranking order is the same as in double precision.\n"
+
+def pareto_front_message():
+    return "\nLocations that are dominated by another location (i.e. perform no better on any criterion and worse on at least one) can never be the best ranked alternative. Removing them keeps only the Pareto front of non-dominated locations, which reduces the time needed for ranking and sensitivity analysis. Note that ranking scores are calculated relative to the remaining locations.\n"
+    
 def weighting_message():
     return "\nFor ranking alternative locations for offshore wind farm installation, evaluation criteria has to be weighted. Weights can be equal for all criteria (Option 1), calculated based on evaluation data obtained from stakeholders (Option 2), or simulated (Option 3).\n"
 
 def ranking_message():
-    return "\nThere are two ranking algorithm options to select from. One performs Technique for Order of Preference by Similarity to Ideal Solution (Option 1), while the other represents the fuzzy option which uses fuzzified weights (Option 2).\n"
+    return "\nThere are three ranking algorithm options to select from. One performs Technique for Order of Preference by Similarity to Ideal Solution (Option 1), the other represents the fuzzy option which uses fuzzified weights (Option 2), while the ensemble option ranks locations with several methods (TOPSIS, VIKOR, WSM, WPM, PROMETHEE II and EDAS) and combines their rankings into a consensus ranking (Option 3).\n"
 
 def simulate_data_message():
     return "\nFor ranking alternative offshore wind farm locations let's simulate evaluation data obtained from different stakeholders. This data will contain information about the pairwise comparison of evaluation criteria. For simulating decision making of stakeholders you can select specific stakeholder groups (Option 1), or specific decision making criteria (Option 2).\n"
@@ -42,8 +60,44 @@ def select_stakeholders_message():
 def ranking_option_message():
     return "\nRanking will result in a sorted list of all alternative offshore wind farm locations, ranked by existing criteria and their importance.\n"
 
+def area_ranking_message():
+    return "\nLocations can be ranked against all other locations, or within each area (community) separately, which results in the best ranked locations of every area. Ranking within areas is performed in parallel and supports TOPSIS ranking only.\n"
+
+def hierarchy_message():
+    return "\nInstead of comparing all criteria with each other, stakeholders can compare criteria groups (socio-economic, fisheries, environmental, technical) with each other, and then criteria within each group. This requires far fewer pairwise comparisons, and smaller comparison matrices are more likely to be consistent. Weight of each criterion is then the weight of its group multiplied by its weight within the group.\n"
+
+def PCM_sampling_message():
+    return "\nBy default, every pairwise comparison of a simulated stakeholder is sampled independently, which often makes comparison matrices of many criteria inconsistent. Alternatively, comparisons can be derived from a sampled priority of every criterion, with small deviations, which makes comparison matrices near-consistent and keeps more simulated stakeholders in the analysis.\n"
+
+def adaptive_simulation_message():
+    return "\nBy default, 5 stakeholders of every stakeholder group are simulated. Alternatively, stakeholders can be simulated in batches until the aggregated criteria weights are precise enough (the 95% confidence interval of every weight is within +-0.005) and the 10 best ranked locations stop changing, or until 10000 stakeholders (fewer, if their decision matrices do not fit the memory budget) or 60 seconds of simulation are used. The convergence trace is saved with the other results.\n"
+
+def portfolio_message():
+    return "\nInstead of a single best location, a portfolio of ranked locations can be selected that reaches a target total wind farm capacity, preferring the best ranked locations. The number of locations in every area can be limited, and selected locations can be required to differ in distance from shore by a minimum spacing. The portfolio is optimized with branch and bound for at most a few seconds, and the optimality gap of the selected portfolio is reported.\n"
+
+def top_k_message():
+    return "\nIf you are interested only in the best ranked locations, you can specify how many of them to keep in the ranking results (in each area, if ranking within areas). This is much faster for large datasets, since the complete ranking does not have to be sorted. To keep all locations, press Enter.\n"
+
+def consensus_message():
+    return "\nConsensus analysis ranks all locations with the criteria weights of every stakeholder group at once (the mean weights of its stakeholders), and shows the best ranked locations of every group, the conflict between every pair of groups (the share of pairs of locations they order differently), and compromise locations that every group ranks highly. Results, with the weights of every stakeholder, are saved with the other results.\n"
+
+def preview_message():
+    return "\nPreview ranking ranks a sample of locations, stratified by area and by the most important criteria, within about half a second, and shows the best ranked locations of the sample with confidence bounds of their scores and ranks among all locations. The full ranking continues in the background and replaces the preview when it is finished. Sensitivity analysis waits for the full ranking.\n"
+
+def scenario_option_message():
+    return "\nScenario analysis compares locations to the average performance of all locations (Option 1). After ranking, it can also answer what-if questions, e.g. what if some locations gain 20% capacity, or what if fishing dependency of an area drops, by re-ranking locations after changes of their criteria values (Option 2), and show how rankings evolve over time, from yearly updates of criteria values (Option 3).\n"
+
+def what_if_message():
+    return "\nWhat-if analysis changes criteria values of selected locations (or of all locations), and re-ranks all locations with TOPSIS and the weights of the last ranking. Only the changed criteria are re-scored, which makes the analysis fast even for very large datasets. The original data is not changed.\n"
+
+def trajectory_message():
+    return "\nTrajectory analysis ranks locations in every period of a data cube (periods x locations x criteria), with TOPSIS and the weights of the last ranking. The data cube is stored in a folder and kept between sessions. Data of a period can cover only some locations and criteria (e.g. only yearly updated criteria), and other values are carried over from the previous period. Files can contain a period column with several periods. Adding a period only ranks that period. The result shows the rank trajectory of every location, its volatility (standard deviation and mean change of its rank), and the share of periods in which it is among the best ranked locations.\n"
+
+def edit_message():
+    return "\nEvery change applies an operation to a criterion: scale (multiply values by a factor), add (add a value) or set (replace values). A change applies to selected locations (by their indices), to all locations of selected areas, or to all locations. Changes can be typed in, or loaded from a file with columns criterion, operation, value, community_name and site_index (leave community_name and site_index empty to change all locations).\n"
+
 def evaluation_message():
-    return "\nFor each of the selected areas, you can see how each offshore wind farm location influences selected criteria, compared to their average value calculated from all possible areas and locations. This way, you can see how specific location performs in terms of selected criteria - the values are displayed in percentages of gain.\n"
+    return "\nFor each of the selected areas, you can see how offshore wind farm locations influence selected criteria, compared to their average value calculated from all possible areas and locations - the values are displayed in percentages of gain. Results are summarized by area: the mean, median and 10th and 90th percentile of gains of each criterion, the share of locations above average and the location with the highest gain. Location-level gains can be added on request (for many locations, they are much larger than the summaries).\n"
     
 def area_selection_message():
     return "\nFor location evaluation, please select the area(s) you want to evaluate. If you wish to select multiple areas, please separate them with a comma. To take all areas into consideration, press Enter.\n"
@@ -54,5 +108,11 @@ def factor_selection_message():
 def sensitivity_option_message():
     return "\nSensitivity analysis provides insights how stable each alternative is to the changes of stakeholder preferences (i.e. criteria weights).\n"
 
+def uncertainty_message():
+    return "\nData uncertainty analysis shows how stable the ranking is to errors in performance data (e.g. criteria values obtained from noisy surveys). Criteria values are perturbed with the specified errors and all locations are ranked for every perturbation. You can specify the same relative error for all criteria (Option 1), or upload a file containing the error of each criterion (Option 2).\n"
+
+def ranking_comparison_message():
+    return "\nRanking comparison shows how similar the saved rankings are (e.g. rankings with equal, simulated or fuzzy weights), using Kendall and Spearman rank correlation, overlap of the best ranked locations and rank-biased overlap. Please enter the paths to ranking files in a comma separated manner. To compare all saved rankings (ranking files in the current folder and rankings in the results folder), press Enter.\n"
+
 def sensitivity_message():
-    return "\nTo perform sensitivity analysis, please specify an offshore wind farm location alternative based on its ranking. For example, for evaluating the best ranked location, type 1.\n"
\ No newline at end of file
+    return "\nTo perform sensitivity analysis, please specify an offshore wind farm location alternative based on its ranking. For example, for evaluating the best ranked location, type 1. The weight of each criterion in the last ranking is changed by -50% to +50%, while the other weights keep their ratios, and the location is re-scored with the ranking method (TOPSIS or Fuzzy TOPSIS, with its fuzzy weights scaled the same way).\n"
\ No newline at end of file
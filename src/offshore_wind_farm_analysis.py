@@ -3,7 +3,31 @@
 @author: Aneta Kartali
 """
 
+import argparse
+
+from batch_ranking import run_batch
 from main import console_ui
 
 if __name__ == "__main__":
-    console_ui()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Offshore Wind Farm Location Evaluator")
+    parser.add_argument("--output-format", choices=["parquet", "csv"], default="parquet",
+                        help="format of saved results (Parquet datasets partitioned by run and community, or CSV files)")
+    parser.add_argument("--output-directory", default="results", help="directory of saved results")
+    parser.add_argument("--memory-budget", type=float,
+                        help="memory budget of analysis stages in MB (half of the available memory by default)")
+    parser.add_argument("--batch", metavar="DIRECTORY",
+                        help="rank all regional datasets (.csv, .txt or .parquet) of a directory without the console UI")
+    parser.add_argument("--criteria", help="criteria file (criteria and type columns), required in batch mode")
+    parser.add_argument("--constraints", help="constraints file in batch mode")
+    parser.add_argument("--survey", help="stakeholder survey file for criteria weights in batch mode (equal weights otherwise)")
+    parser.add_argument("--k", type=int, default=10, help="number of best ranked locations of each region in the leaderboard")
+    parser.add_argument("--workers", type=int, help="number of worker processes in batch mode (all CPUs by default)")
+    parser.add_argument("--memory-limit", type=float, help="memory limit of each worker process in MB")
+    args = parser.parse_args()
+    if args.batch is not None:
+        if args.criteria is None:
+            parser.error("--criteria is required in batch mode")
+        run_batch(args.batch, args.criteria, args.constraints, args.survey, args.k, args.workers,
+                  args.memory_limit, args.output_format, args.output_directory)
+    else:
+        console_ui(args.output_format, args.output_directory, None if args.memory_budget is None else int(args.memory_budget * 2**20))
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+import numpy as np
+
+# Random consistency index (RI) for up to 15 criteria, as used by pyDecision
+random_consistency_index = np.array([0, 0, 0, 0.58, 0.9, 1.12, 1.24, 1.32, 1.41, 1.45, 1.49, 1.51, 1.48, 1.56, 1.57, 1.59])
+
+# =============================================================================
+# Saaty's Scale
+# =============================================================================
+def saaty_round(ratios):
+    """
+    Round importance ratios to the closest judgement of Saaty's 1-9 scale
+    (or its reciprocal), keeping the rounded matrix reciprocal.
+    """
+    ratios = np.asarray(ratios, dtype=float)
+    inverse = ratios < 1
+    scores = np.clip(np.rint(np.where(inverse, 1 / ratios, ratios)), 1, 9)
+    return np.where(inverse, 1 / scores, scores)
+
+# =============================================================================
+# Consistency
+# =============================================================================
+def random_index(criteria_num):
+    """
+    Random consistency index. For more than 15 criteria, it is extrapolated
+    with the linear fit of the maximum eigenvalue of random matrices
+    (Alonso and Lamata, 2006).
+    """
+    if criteria_num < len(random_consistency_index):
+        return random_consistency_index[criteria_num]
+    return (1.7699 * criteria_num - 4.3513) / (criteria_num - 1)
+
+
+def eigen_weights(PCMs, iterations=1000, tolerance=1e-12):
+    """
+    Calculate the principal eigenvector (normalized to sum to 1) and the maximum
+    eigenvalue of a batch of pairwise comparison matrices (..., n, n) with power
+    iteration.
+    """
+    A = np.asarray(PCMs, dtype=float)
+    weights = np.full(A.shape[:-1], 1. / A.shape[-1])
+    for _ in range(iterations):
+        new_weights = np.einsum("...ij,...j->...i", A, weights)
+        new_weights /= new_weights.sum(axis=-1, keepdims=True)
+        converged = np.max(np.abs(new_weights - weights)) < tolerance
+        weights = new_weights
+        if converged:
+            break
+    lambda_max = np.mean(np.einsum("...ij,...j->...i", A, weights) / weights, axis=-1)
+    return weights, lambda_max
+
+
+def consistency_ratio(PCMs):
+    """
+    Calculate the eigenvector weights and the consistency ratio (CR) of a batch
+    of pairwise comparison matrices. Matrices with less than 3 criteria are
+    always consistent.
+    """
+    criteria_num = np.shape(PCMs)[-1]
+    weights, lambda_max = eigen_weights(PCMs)
+    if criteria_num < 3:
+        return weights, np.zeros_like(lambda_max)
+    return weights, (lambda_max - criteria_num) / (criteria_num - 1) / random_index(criteria_num)
+
+# =============================================================================
+# Consistent Pairwise Comparison Matrix Sampling
+# =============================================================================
+def consistent_PCM(criteria_num, preferable_criteria_range, PCM_num=1, rng=None):
+    """
+    Generate near-consistent pairwise comparison matrices by sampling latent
+    priority vectors and rounding their ratios to Saaty's scale. Preferable
+    criteria are about 3 to 5 times as important as other criteria, while
+    criteria of the same kind are about equally important (1 to 2 times), as
+    in the uniformly sampled pairwise comparison matrices.
+    Returns an array of shape (PCM_num, criteria_num, criteria_num).
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    preferable = np.isin(np.arange(criteria_num), preferable_criteria_range)
+    log_weights = np.log(4) * preferable + rng.normal(0, 0.25, (PCM_num, criteria_num))
+    ratios = np.exp(log_weights[:, :, None] - log_weights[:, None, :])
+    return saaty_round(ratios)
+
+# =============================================================================
+# Pairwise Comparison Matrix Repair
+# =============================================================================
+def repair_PCM(PCMs, threshold=0.10, max_iterations=None):
+    """
+    Repair inconsistent pairwise comparison matrices. In every iteration, the
+    judgement that deviates the most from the ratio of the current priority
+    weights is replaced with that ratio, rounded to Saaty's scale. All matrices
+    of the batch are repaired at once, and only inconsistent matrices are
+    changed. Repair of a matrix stops when it becomes consistent (CR below the
+    threshold) or when its worst judgement cannot be improved any further.
+    Returns repaired matrices, their weights, consistency ratios and the number
+    of replaced judgements.
+    """
+    A = np.array(PCMs, dtype=float)
+    PCM_num, criteria_num = A.shape[0], A.shape[-1]
+    if max_iterations is None:
+        max_iterations = criteria_num * (criteria_num - 1) // 2
+    weights, rc = consistency_ratio(A)
+    iterations = np.zeros(PCM_num, dtype=np.int64)
+    stalled = np.zeros(PCM_num, dtype=bool)
+    upper = np.triu(np.ones((criteria_num, criteria_num), dtype=bool), 1)
+
+    for _ in range(max_iterations):
+        active = np.flatnonzero((rc >= threshold) & ~stalled)
+        if len(active) == 0:
+            break
+        B = A[active]
+        w = weights[active]
+        ratios = w[:, :, None] / w[:, None, :]
+        deviation = np.where(upper, np.abs(np.log(B) - np.log(ratios)), -1)
+        worst = np.argmax(deviation.reshape(len(active), -1), axis=1)
+        i, j = np.unravel_index(worst, (criteria_num, criteria_num))
+        batch = np.arange(len(active))
+        target = saaty_round(ratios[batch, i, j])
+
+        stalled[active] = target == B[batch, i, j]
+        B[batch, i, j] = target
+        B[batch, j, i] = 1 / target
+        A[active] = B
+        iterations[active] += ~stalled[active]
+        weights[active], rc[active] = consistency_ratio(B)
+
+    return A, weights, rc, iterations
+
+# =============================================================================
+# Batched Fuzzy AHP
+# =============================================================================
+def fuzzify_PCMs(PCMs):
+    """
+    Fuzzify a batch of pairwise comparison matrices (..., n, n) into triangular
+    fuzzy numbers (..., n, n, 3), with the same rules as fuzzify_PCM.
+    """
+    m = np.asarray(PCMs, dtype=float)
+    x = 1 / m
+    with np.errstate(divide="ignore"):
+        l = np.where(m < 1, np.where(x == 9, 1 / x, 1 / (x + 1)), np.where(m == 1, m / 2, m - 1))
+        u = np.where(m < 1, 1 / (x - 1), np.where(m == 1, m + 1, np.where(m == 9, m, m + 1)))
+    fuzzy_PCMs = np.stack([l, m, u], axis=-1)
+    diagonal = np.arange(m.shape[-1])
+    fuzzy_PCMs[..., diagonal, diagonal, :] = 1
+    return fuzzy_PCMs
+
+
+def batch_fuzzy_AHP(fuzzy_PCMs):
+    """
+    Calculate fuzzy, defuzzified and normalized weights and the consistency
+    ratio of a batch of fuzzy pairwise comparison matrices (..., n, n, 3) with
+    the geometric mean method, as pyDecision's fuzzy_ahp_method does for a
+    single matrix.
+    """
+    fuzzy_PCMs = np.asarray(fuzzy_PCMs, dtype=float)
+    criteria_num = fuzzy_PCMs.shape[-2]
+    row_means = np.exp(np.mean(np.log(fuzzy_PCMs), axis=-2))
+    totals = row_means.sum(axis=-2, keepdims=True)
+    fuzzy_weights = row_means / totals[..., ::-1]
+    defuzzified_weights = fuzzy_weights.mean(axis=-1)
+    normalized_weights = defuzzified_weights / defuzzified_weights.sum(axis=-1, keepdims=True)
+
+    X = (fuzzy_PCMs[..., 0] + 4 * fuzzy_PCMs[..., 1] + fuzzy_PCMs[..., 2]) / 6
+    lambda_max = np.mean(np.einsum("...ij,...j->...i", X, normalized_weights) / normalized_weights, axis=-1)
+    if criteria_num < 3:
+        rc = np.zeros_like(lambda_max)
+    else:
+        rc = (lambda_max - criteria_num) / (criteria_num - 1) / random_index(criteria_num)
+    return fuzzy_weights, defuzzified_weights, normalized_weights, rc
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+import numpy as np
+
+from decision_making import TOPSIS_parameters, TOPSIS_closeness, top_k
+from shared_data import SharedDecisionMatrix, map_shared
+
+# =============================================================================
+# Per-Area Ranking
+# =============================================================================
+def rank_area(shared_matrix, task):
+    """
+    Rank alternatives of one area with TOPSIS, independently of other areas.
+    Alternatives of the area are stored in rows start:stop of the shared
+    decision matrix. Returns positions of the k best alternatives of the area
+    and their scores.
+    """
+    start, stop, weights, k = task
+    area_matrix = shared_matrix.matrix[start:stop]
+    norms, p_ideal, n_ideal = TOPSIS_parameters(area_matrix, weights, shared_matrix.types)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ranking = TOPSIS_closeness(area_matrix, weights, norms, p_ideal, n_ideal)
+    # Areas with a single location (or identical locations) have no ideal
+    # distance, so all of their locations are considered equally good
+    ranking = np.nan_to_num(ranking, nan=1.)
+    positions, scores = top_k(ranking, stop - start if k is None else k)
+    return positions + start, scores
+
+
+def rank_areas(selected_data, areas, weights, types, k=None, workers=None):
+    """
+    Rank alternative locations within each area independently and return the
+    k best locations of every area (all locations if k is not specified).
+    Areas are ranked in parallel by a pool of processes, which read the
+    decision matrix from shared memory instead of receiving a copy of it.
+    """
+    areas = np.asarray(areas)
+    area_names, area_codes = np.unique(areas, return_inverse=True)
+
+    # Store alternatives of each area in contiguous rows, so that workers only
+    # need the row range of an area
+    order = np.argsort(area_codes, kind="stable")
+    bounds = np.searchsorted(area_codes[order], np.arange(len(area_names) + 1))
+    weights = np.asarray(weights, dtype=float)
+    tasks = [(bounds[i], bounds[i+1], weights, k) for i in range(len(area_names))]
+
+    with SharedDecisionMatrix.create(selected_data.iloc[order], types) as shared_matrix:
+        results = map_shared(rank_area, shared_matrix, tasks, workers)
+
+    positions = np.concatenate([result[0] for result in results])
+    area_ranks = np.concatenate([np.arange(1, len(result[0]) + 1) for result in results])
+    scores = np.concatenate([result[1] for result in results])
+
+    result = selected_data.iloc[order[positions]].copy()
+    result["Ranking"] = scores
+    result["community_name"] = areas[order[positions]]
+    result["area_rank"] = area_ranks
+    return result
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+import numpy as np
+import pandas as pd
+import time
+
+# =============================================================================
+# Portfolio Selection
+# =============================================================================
+def select_portfolio(scores, capacities, communities, distances, target_capacity,
+                     max_per_community=None, min_spacing=0., node_limit=1000000, time_limit=5.):
+    """
+    Select a portfolio of locations that reaches the target capacity at the
+    lowest total cost, where the cost of a location is 1 - score (its distance
+    from a perfectly ranked location). At most max_per_community locations are
+    selected in every community, and distances from shore of any two selected
+    locations differ by at least min_spacing.
+    A greedy heuristic and a Lagrangian-guided heuristic give the first
+    solution, which is then refined with depth-first branch and bound until
+    the search is complete or the node or time limit is reached.
+    Returns positions of the selected locations (None if no feasible portfolio
+    was found) and the summary of the search, including the lower bound and
+    the optimality gap.
+    """
+    start_time = time.perf_counter()
+    costs = 1 - np.asarray(scores, dtype=float)
+    capacities = np.asarray(capacities, dtype=float)
+    communities = pd.factorize(np.asarray(communities))[0]
+    distances = np.asarray(distances, dtype=float)
+    if max_per_community is None:
+        max_per_community = len(costs)
+
+    # Only locations that add capacity can help; they are considered in the
+    # order of their cost per unit of capacity
+    candidates = np.flatnonzero(capacities > 0)
+    candidates = candidates[np.argsort(costs[candidates] / capacities[candidates], kind="stable")]
+    constraints = (communities, distances, max_per_community, min_spacing)
+
+    # Heuristic solutions
+    lagrangian_bound, multiplier = lagrangian_lower_bound(costs, capacities, communities, target_capacity, max_per_community)
+    best_selection = greedy_portfolio(candidates, costs, capacities, target_capacity, constraints)
+    lagrangian_order = candidates[np.argsort(costs[candidates] - multiplier * capacities[candidates], kind="stable")]
+    lagrangian_selection = greedy_portfolio(lagrangian_order, costs, capacities, target_capacity, constraints)
+    if best_selection is None or (lagrangian_selection is not None and costs[lagrangian_selection].sum() < costs[best_selection].sum()):
+        best_selection = lagrangian_selection
+    best_cost = np.inf if best_selection is None else costs[best_selection].sum()
+
+    # Branch and bound
+    ordered_costs = costs[candidates]
+    ordered_capacities = capacities[candidates]
+    cumulative_costs = np.r_[0., np.cumsum(ordered_costs)]
+    cumulative_capacities = np.r_[0., np.cumsum(ordered_capacities)]
+
+    def bound(depth, remaining_capacity, cost):
+        # Fractional cover of the remaining capacity with the cheapest
+        # remaining locations per unit of capacity (constraints relaxed)
+        reachable = cumulative_capacities[depth] + remaining_capacity
+        last = np.searchsorted(cumulative_capacities, reachable)
+        if last >= len(cumulative_capacities):
+            return np.inf
+        fraction = (reachable - cumulative_capacities[last-1]) / ordered_capacities[last-1]
+        return cost + cumulative_costs[last-1] - cumulative_costs[depth] + fraction * ordered_costs[last-1]
+
+    stack = [(0, float(target_capacity), 0., ())]
+    node_num = 0
+    while stack and node_num < node_limit and time.perf_counter() - start_time < time_limit:
+        depth, remaining_capacity, cost, selection = stack.pop()
+        node_num += 1
+        if remaining_capacity <= 0:
+            if cost < best_cost:
+                best_cost, best_selection = cost, candidates[list(selection)]
+            continue
+        if depth >= len(candidates) or bound(depth, remaining_capacity, cost) >= best_cost - 1e-12:
+            continue
+        # Exclude the location, then (searched first) include it if allowed
+        stack.append((depth + 1, remaining_capacity, cost, selection))
+        if feasible_addition(candidates[depth], candidates[list(selection)], constraints):
+            stack.append((depth + 1, remaining_capacity - ordered_capacities[depth], cost + ordered_costs[depth], selection + (depth,)))
+
+    # Every unexplored portfolio belongs to a subtree of an open node
+    complete = not stack
+    lower_bound = lagrangian_bound
+    if complete:
+        lower_bound = best_cost
+    else:
+        open_bound = min(bound(depth, remaining_capacity, cost) if remaining_capacity > 0 else cost
+                         for depth, remaining_capacity, cost, _ in stack)
+        lower_bound = max(lower_bound, min(open_bound, best_cost))
+
+    summary = {"locations": 0 if best_selection is None else len(best_selection),
+               "capacity": 0. if best_selection is None else capacities[best_selection].sum(),
+               "cost": best_cost,
+               "lower_bound": lower_bound,
+               "gap": 0. if best_cost == lower_bound else (best_cost - lower_bound) / max(best_cost, 1e-12),
+               "optimal": complete,
+               "nodes": node_num,
+               "time": time.perf_counter() - start_time}
+    return best_selection, summary
+
+
+def feasible_addition(candidate, selection, constraints):
+    """
+    Check if a location can be added to the selected locations without
+    violating community and spacing constraints.
+    """
+    communities, distances, max_per_community, min_spacing = constraints
+    if np.count_nonzero(communities[selection] == communities[candidate]) >= max_per_community:
+        return False
+    return not np.any(np.abs(distances[selection] - distances[candidate]) < min_spacing)
+
+
+def greedy_portfolio(order, costs, capacities, target_capacity, constraints):
+    """
+    Add locations in the given order, skipping those that violate constraints,
+    until the target capacity is reached. Returns positions of the selected
+    locations, or None if the target capacity cannot be reached.
+    """
+    selection = []
+    capacity = 0.
+    for candidate in order:
+        if capacity >= target_capacity:
+            break
+        if feasible_addition(candidate, np.array(selection, dtype=np.int64), constraints):
+            selection.append(candidate)
+            capacity += capacities[candidate]
+    if capacity < target_capacity:
+        return None
+    return np.array(selection, dtype=np.int64)
+
+
+def lagrangian_lower_bound(costs, capacities, communities, target_capacity, max_per_community, iterations=60):
+    """
+    Lower bound of the portfolio cost from the Lagrangian relaxation of the
+    capacity target (spacing constraints relaxed). For a multiplier l, the
+    relaxed problem selects in every community up to max_per_community
+    locations with the most negative reduced cost (cost - l * capacity). The
+    bound is concave in l and is maximized with ternary search.
+    Returns the bound and the best multiplier.
+    """
+    def dual(multiplier):
+        reduced_costs = costs - multiplier * capacities
+        order = np.lexsort((reduced_costs, communities))
+        sorted_communities = communities[order]
+        starts = np.flatnonzero(np.r_[True, sorted_communities[1:] != sorted_communities[:-1]])
+        rank_in_community = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        selected = (rank_in_community < max_per_community) & (reduced_costs[order] < 0)
+        return multiplier * target_capacity + reduced_costs[order][selected].sum()
+
+    if not np.any(capacities > 0):
+        return np.inf, 0.
+    low, high = 0., np.max(costs[capacities > 0] / capacities[capacities > 0]) * 2 + 1e-12
+    for _ in range(iterations):
+        left, right = low + (high - low) / 3, high - (high - low) / 3
+        if dual(left) < dual(right):
+            low = left
+        else:
+            high = right
+    multiplier = (low + high) / 2
+    return dual(multiplier), multiplier
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+import numpy as np
+import pandas as pd
+import threading
+import time
+import weakref
+from statistics import NormalDist
+
+from decision_making import TOPSIS_statistics_parameters, TOPSIS_closeness, guarded_TOPSIS, rank_alternatives
+
+# =============================================================================
+# Stratified Sampling
+# =============================================================================
+def sample_strata(areas, values, weights, key_criteria_num=1, bins=4, probe_size=10000, rng=None):
+    """
+    Strata of alternatives: their area (integer area codes) and quantile bins
+    of the key criteria (the criteria with the largest weights). Quantiles are
+    estimated from a uniform probe of alternatives.
+    Returns stratum codes of all alternatives (not all codes are used).
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    strata = np.asarray(areas, dtype=np.int64)
+    probe = rng.choice(len(values), min(probe_size, len(values)), replace=False)
+    for j in np.argsort(-np.asarray(weights), kind="stable")[:key_criteria_num]:
+        edges = np.unique(np.quantile(values[probe, j], np.linspace(0, 1, bins + 1)[1:-1]))
+        strata = strata * (len(edges) + 1) + np.searchsorted(edges, values[:, j], side="right")
+    return strata
+
+
+def stratum_allocation(stratum_sizes, sample_size, min_per_stratum=2):
+    """
+    Expected sample sizes of strata: proportional allocation, with at least
+    min_per_stratum alternatives of every stratum (all alternatives of smaller
+    strata). The proportional part is scaled down by bisection, so that the
+    expected sample size stays within sample_size when there are many strata.
+    """
+    def allocate(size):
+        return np.minimum(np.maximum(size * stratum_sizes / stratum_sizes.sum(), min_per_stratum), stratum_sizes)
+    low, high = 0., float(sample_size)
+    if allocate(low).sum() >= sample_size:
+        return allocate(low)
+    for _ in range(50):
+        middle = (low + high) / 2
+        low, high = (middle, high) if allocate(middle).sum() <= sample_size else (low, middle)
+    return allocate(low)
+
+
+def stratified_sample(strata, sample_size, min_per_stratum=2, rng=None):
+    """
+    Poisson sample of alternatives with proportional allocation to strata (see
+    stratum_allocation), which takes one pass over the stratum codes.
+    Returns sample positions and their inclusion probabilities.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    stratum_sizes = np.bincount(strata)
+    allocation = stratum_allocation(stratum_sizes, sample_size, min_per_stratum)
+    probabilities = allocation / np.maximum(stratum_sizes, 1)
+    positions = np.flatnonzero(rng.random(len(strata)) < probabilities[strata])
+    return positions, probabilities[strata[positions]]
+
+
+def inclusion_multipliers(probabilities, rng):
+    """
+    Bootstrap multipliers of Poisson inclusions: 1 + sqrt(1 - p) * e with
+    random signs e, so that bootstrap Horvitz-Thompson estimates vary with the
+    Horvitz-Thompson variance of Poisson sampling. Alternatives included with
+    certainty keep their weight.
+    """
+    return 1 + np.sqrt(1 - probabilities) * rng.choice([-1., 1.], len(probabilities))
+
+# =============================================================================
+# Preview Ranking
+# =============================================================================
+def sample_scores(sample, sample_weights, scored, weights, types, maxima, minima):
+    """
+    TOPSIS scores of the scored alternatives, with column norms estimated from
+    the sample (Horvitz-Thompson estimate of the sums of squares, with sampled
+    alternatives weighted by their inverse inclusion probabilities) and ideal
+    solutions from the column extremes of all alternatives.
+    """
+    statistics = (sample_weights @ (sample * sample), maxima, minima)
+    return TOPSIS_closeness(scored, weights, *TOPSIS_statistics_parameters(statistics, weights, types))
+
+
+def higher_counts(scores, reference_scores, reference_weights):
+    """
+    Number of reference (sampled) alternatives with a higher score than the
+    given scores, and their sum of inverse inclusion probabilities, which
+    estimates the number of all alternatives with a higher score.
+    """
+    order = np.argsort(-reference_scores, kind="stable")
+    higher_weights = np.r_[0., np.cumsum(reference_weights[order])]
+    higher = np.searchsorted(-reference_scores[order], -scores, side="left")
+    return higher, higher_weights[higher]
+
+
+def population_ranks(scores, weights, reference_scores, reference_weights):
+    """
+    Estimated ranks of alternatives with the given scores among all
+    alternatives: one plus the estimated number of alternatives with a higher
+    score. An alternative sampled with weight w stands for w - 1 other
+    alternatives, half of which are expected to rank higher.
+    """
+    return 1 + higher_counts(scores, reference_scores, reference_weights)[1] + (weights - 1) / 2
+
+
+def count_bounds(counts, confidence=0.95):
+    """
+    Confidence bounds of the mean of Poisson counts (Garwood interval, with
+    the Wilson-Hilferty approximation of chi-square quantiles). The number of
+    sampled alternatives ranked above an alternative is such a count, which
+    is small for the best alternatives, where bootstrap percentiles do not
+    cover alternatives that are not sampled.
+    """
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    def chi2_half(dof, z):
+        dof = np.maximum(dof, 1e-12)
+        return dof / 2 * np.maximum(1 - 2 / (9 * dof) + z * np.sqrt(2 / (9 * dof)), 0) ** 3
+    counts = np.asarray(counts, dtype=float)
+    lower = np.where(counts > 0, chi2_half(2 * counts, -z), 0.)
+    return lower, chi2_half(2 * counts + 2, z)
+
+
+def preview_setup(selected_data, areas):
+    """
+    Decision matrix, column extremes and area codes of the alternatives,
+    which take a pass over all alternatives. They are calculated once per
+    selected data (areas belong to the selected alternatives) and reused by
+    previews with other weights.
+    """
+    key = (id(selected_data), selected_data.shape)
+    if _setup_cache.get("key") != key or _setup_cache["data"]() is not selected_data:
+        values = selected_data.to_numpy(dtype=float)
+        area_codes, _ = pd.factorize(areas)
+        _setup_cache.update(key=key, data=weakref.ref(selected_data), values=values, maxima=np.max(values, axis=0),
+                            minima=np.min(values, axis=0), area_codes=area_codes.astype(np.int64))
+    return _setup_cache["values"], _setup_cache["maxima"], _setup_cache["minima"], _setup_cache["area_codes"]
+
+_setup_cache = {}
+
+
+def preview_ranking(selected_data, areas, weights, types, k=10, latency=0.5, bootstrap_num=50, min_bootstrap_num=20,
+                    confidence=0.95, key_criteria_num=1, strata_bins=4, seed=None):
+    """
+    Approximate TOPSIS ranking from a stratified sample of alternatives, sized
+    to return within about latency seconds, including the pass over all
+    alternatives for the strata. Alternatives are stratified by area and by
+    the key criteria, so that every area and range of the most important
+    criteria is represented. Column norms are estimated from the sample, and
+    sampled alternatives are scored and ranked among all alternatives. Ideal
+    solutions are the exact column extremes, since sample extremes
+    underestimate them and cannot be bootstrapped. Confidence bounds of scores
+    and ranks are estimated by bootstrap resampling of the Poisson inclusions
+    (see inclusion_multipliers), with at least min_bootstrap_num and at most
+    bootstrap_num resamples, as many as fit the latency.
+    If the sample would cover most alternatives, all alternatives are ranked
+    (with exact scores and ranks).
+    Returns the k best sampled alternatives with their scores, ranks and
+    bounds, and the sample size.
+    """
+    rng = np.random.default_rng(seed)
+    start_time = time.perf_counter()
+    values, maxima, minima, area_codes = preview_setup(selected_data, areas)
+    weights = np.asarray(weights, dtype=float)
+    alternative_num = len(values)
+    strata = sample_strata(area_codes, values, weights, key_criteria_num, strata_bins, rng=rng)
+
+    # Sample size from the scoring and ranking rate of a probe of alternatives
+    # and the remaining latency, with all bootstrap resamples
+    probe = values[:min(10000, alternative_num)]
+    probe_time = time.perf_counter()
+    probe_weights = np.ones(len(probe))
+    probe_scores = sample_scores(probe, probe_weights, probe, weights, types, maxima, minima)
+    population_ranks(probe_scores, probe_weights, probe_scores, probe_weights)
+    rate = len(probe) / max(time.perf_counter() - probe_time, 1e-6)
+    remaining = latency - (time.perf_counter() - start_time)
+    sample_size = int(max(1000, remaining * rate / (min_bootstrap_num + 1)))
+
+    if sample_size >= alternative_num / 2:
+        positions, probabilities = np.arange(alternative_num), np.ones(alternative_num)
+        bootstrap_num = 0
+    else:
+        positions, probabilities = stratified_sample(strata, sample_size, rng=rng)
+    sample = values[positions]
+    sample_weights = 1 / probabilities
+    scores = sample_scores(sample, sample_weights, sample, weights, types, maxima, minima)
+    ranks = population_ranks(scores, sample_weights, scores, sample_weights)
+
+    # Bootstrap resampling of the Poisson inclusions: sampled alternatives are
+    # reweighted by multipliers with the variance of their inclusion
+    best = np.argsort(-scores, kind="stable")[:k]
+    score_bounds = np.stack([scores[best], scores[best]])
+    rank_bounds = np.stack([ranks[best], ranks[best]])
+    if bootstrap_num:
+        bootstrap_scores = np.empty((bootstrap_num, len(best)))
+        bootstrap_higher = np.empty((bootstrap_num, len(best)))
+        b, resample_time = 0, 0.
+        while b < bootstrap_num and (b < min_bootstrap_num or time.perf_counter() - start_time + resample_time < latency):
+            resample_start = time.perf_counter()
+            resample_scores = sample_scores(sample, sample_weights * inclusion_multipliers(probabilities, rng), sample,
+                                            weights, types, maxima, minima)
+            bootstrap_scores[b] = resample_scores[best]
+            bootstrap_higher[b] = higher_counts(resample_scores[best], resample_scores, sample_weights)[0]
+            b += 1
+            resample_time = time.perf_counter() - resample_start
+        # Bounds from the bootstrap standard deviation, since there are too few
+        # resamples for the tail percentiles (Student t quantile of b - 1
+        # degrees of freedom, from its Cornish-Fisher expansion)
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        z += (z ** 3 + z) / (4 * (b - 1))
+        score_spread = z * bootstrap_scores[:b].std(axis=0, ddof=1)
+        score_bounds = np.stack([scores[best] - score_spread, scores[best] + score_spread])
+        # Ranks are bounded by the sampled alternatives that may rank higher
+        # under the resampled scores, and by alternatives that are not sampled
+        # (Poisson counts scaled by the mean weight of higher alternatives)
+        higher, higher_weights = higher_counts(scores[best], scores, sample_weights)
+        scale = np.where(higher > 0, higher_weights / np.maximum(higher, 1), sample_weights[best])
+        higher_spread = z * bootstrap_higher[:b].std(axis=0, ddof=1)
+        higher_bounds = np.stack([np.maximum(higher - higher_spread, 0), higher + higher_spread])
+        rank_bounds = np.stack([1 + scale * count_bounds(higher_bounds[0], confidence)[0],
+                                1 + scale * count_bounds(higher_bounds[1], confidence)[1]])
+
+    preview = selected_data.iloc[positions[best]].copy()
+    preview["Ranking"] = scores[best]
+    preview["score_lower"] = np.minimum(score_bounds[0], scores[best])
+    preview["score_upper"] = np.maximum(score_bounds[1], scores[best])
+    preview["estimated_rank"] = np.rint(ranks[best]).astype(np.int64)
+    preview["rank_lower"] = np.rint(np.minimum(rank_bounds[0], ranks[best])).astype(np.int64)
+    preview["rank_upper"] = np.rint(np.maximum(rank_bounds[1], ranks[best])).astype(np.int64)
+    preview["community_name"] = np.asarray(areas)[positions[best]]
+    print(f"\nPreview ranking of a sample of {len(positions)} of {alternative_num} locations "
+          f"in {time.perf_counter() - start_time:.2f} s.")
+    return preview, len(positions)
+
+# =============================================================================
+# Background Ranking
+# =============================================================================
+class BackgroundRanking:
+    """
+    Run a ranking function in a background thread, so that the session can
+    continue while a large dataset is ranked. The function is called with a
+    cancelled event (threading.Event) as keyword argument, which is set by
+    cancel() when the ranking is discarded, so that it can stop early. The
+    result is taken with result(), which waits for the ranking to finish and
+    raises its error.
+    """
+
+    def __init__(self, function, *args, **kwargs):
+        self.value = None
+        self.error = None
+        self.cancelled = threading.Event()
+        kwargs["cancelled"] = self.cancelled
+        self.thread = threading.Thread(target=self._run, args=(function, args, kwargs), name="background-ranking", daemon=True)
+        self.thread.start()
+
+    def _run(self, function, args, kwargs):
+        try:
+            self.value = function(*args, **kwargs)
+        except Exception as e:
+            self.error = e
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    def result(self):
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def snapshot_ranking(data, selected_data, weights, types, k=None, chunk_size=1000000, cancelled=None):
+    """
+    Full TOPSIS ranking of the selected alternatives (see guarded_TOPSIS),
+    with community names of the data. Returns None if it was cancelled.
+    """
+    ranking = guarded_TOPSIS(selected_data, weights, types, data, k, chunk_size=chunk_size, cancelled=cancelled)
+    if ranking is None or (cancelled is not None and cancelled.is_set()):
+        return None
+    return rank_alternatives(data, selected_data, ranking, k)
+
+
+def background_ranking(data, selected_data, weights, types, k=None, chunk_size=1000000):
+    """
+    Start the full ranking of the selected alternatives in the background, on
+    a snapshot of the selected data and of its reference values and community
+    names, since the data can be updated in place while the ranking runs.
+    """
+    reference = data.loc[selected_data.index, list(selected_data.columns) + ["community_name"]]
+    return BackgroundRanking(snapshot_ranking, reference, selected_data.copy(), np.array(weights, dtype=float), list(types),
+                             k, chunk_size)
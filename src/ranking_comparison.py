@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+import numpy as np
+import os
+import pandas as pd
+
+from result_sink import load_result
+from shared_data import SharedDecisionMatrix, map_shared
+
+# =============================================================================
+# Ranks
+# =============================================================================
+def dense_ranks(scores):
+    """
+    Convert scores to dense ranks, where 0 is the best (highest) score and tied
+    scores share the same rank.
+    """
+    _, ranks = np.unique(-np.asarray(scores, dtype=float), return_inverse=True)
+    return ranks.reshape(-1)
+
+
+def average_ranks(ranks):
+    """
+    Convert dense ranks to ranks 1..n, where tied alternatives get the average
+    of the ranks they span.
+    """
+    counts = np.bincount(ranks)
+    ends = np.cumsum(counts)
+    return (ends - (counts - 1) / 2)[ranks]
+
+# =============================================================================
+# Rank Correlation
+# =============================================================================
+def count_inversions(values):
+    """
+    Count pairs i < j with values[i] > values[j] in O(n log n), bit by bit of
+    the values (a radix merge): values are kept grouped by their higher bits,
+    in their original order within a group. At every bit, pairs of a group
+    that differ in the bit are inversions if a one precedes a zero, and the
+    groups are then split by the bit with a stable partition, which carries
+    the order to the next bit in linear time. Values are ranks, so there are
+    about log2(n) bits.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    n = len(values)
+    if n < 2:
+        return 0
+    values = values - values.min()
+    if values.max() >= n:
+        _, values = np.unique(values, return_inverse=True)
+        values = values.reshape(-1)
+    positions = np.arange(n)
+    inversions = 0
+    for bit in range(int(values.max()).bit_length() - 1, -1, -1):
+        ones = (values >> bit) & 1
+        prefix = values >> (bit + 1)
+        group_starts = np.flatnonzero(np.r_[True, prefix[1:] != prefix[:-1]])
+        group = np.cumsum(np.r_[True, prefix[1:] != prefix[:-1]]) - 1
+        group_sizes = np.diff(np.r_[group_starts, n])
+        
+        # Ones preceding every value within its group
+        ones_before = np.cumsum(ones) - ones
+        ones_before -= ones_before[group_starts][group]
+        inversions += int(ones_before[ones == 0].sum())
+        
+        # Stable partition of every group: zeros first, then ones
+        group_ones = np.add.reduceat(ones, group_starts)
+        zeros_before = positions - group_starts[group] - ones_before
+        destination = group_starts[group] + np.where(ones == 0, zeros_before, group_sizes[group] - group_ones[group] + ones_before)
+        partitioned = np.empty_like(values)
+        partitioned[destination] = values
+        values = partitioned
+    return inversions
+
+
+def tie_pairs(ranks):
+    """
+    Number of tied pairs in dense ranks.
+    """
+    counts = np.bincount(ranks)
+    return int(np.sum(counts * (counts - 1) // 2))
+
+
+def kendall_tau(ranks_a, ranks_b, order_a=None):
+    """
+    Kendall tau-b rank correlation of two rankings (dense ranks) calculated in
+    O(n log n) with Knight's algorithm: alternatives are sorted by the first
+    ranking (ties by the second ranking), and discordant pairs are counted as
+    inversions of the second ranking.
+    """
+    n = len(ranks_a)
+    if order_a is None or tie_pairs(ranks_a) > 0:
+        order_a = np.lexsort((ranks_b, ranks_a))
+    sorted_a = ranks_a[order_a]
+    sorted_b = ranks_b[order_a]
+
+    pairs = n * (n - 1) // 2
+    ties_a = tie_pairs(ranks_a)
+    ties_b = tie_pairs(ranks_b)
+    # Pairs tied in both rankings
+    joint = np.flatnonzero(np.diff(sorted_a) | np.diff(sorted_b)) + 1
+    joint_counts = np.diff(np.concatenate([[0], joint, [n]]))
+    ties_joint = int(np.sum(joint_counts * (joint_counts - 1) // 2))
+
+    discordant = count_inversions(sorted_b)
+    denominator = np.sqrt(float(pairs - ties_a) * float(pairs - ties_b))
+    if denominator == 0:
+        return np.nan
+    return (pairs - ties_a - ties_b + ties_joint - 2 * discordant) / denominator
+
+
+def spearman_rho(average_ranks_a, average_ranks_b):
+    """
+    Spearman rank correlation (Pearson correlation of average ranks).
+    """
+    a = average_ranks_a - average_ranks_a.mean()
+    b = average_ranks_b - average_ranks_b.mean()
+    denominator = np.sqrt(np.sum(a * a) * np.sum(b * b))
+    if denominator == 0:
+        return np.nan
+    return np.sum(a * b) / denominator
+
+# =============================================================================
+# Top-k Similarity
+# =============================================================================
+def top_k_overlap(order_a, order_b, k):
+    """
+    Share of alternatives that are among the k best in both rankings.
+    """
+    k = min(k, len(order_a))
+    return len(np.intersect1d(order_a[:k], order_b[:k], assume_unique=True)) / k
+
+
+def rank_biased_overlap(order_a, order_b, p=0.9, depth=None):
+    """
+    Extrapolated rank-biased overlap (RBO) of two rankings given as orders of
+    alternatives (best first), evaluated to the given depth. An alternative
+    enters the overlap at the depth where it has been seen in both rankings,
+    so the overlap at every depth is a cumulative count.
+    """
+    n = len(order_a)
+    depth = n if depth is None else min(depth, n)
+    position_a = np.empty(n, dtype=np.int64)
+    position_b = np.empty(n, dtype=np.int64)
+    position_a[order_a] = np.arange(1, n + 1)
+    position_b[order_b] = np.arange(1, n + 1)
+    overlap = np.cumsum(np.bincount(np.maximum(position_a, position_b), minlength=n + 1)[1:depth + 1])
+    depths = np.arange(1, depth + 1)
+    agreement = overlap / depths
+    return agreement[-1] * p ** depth + (1 - p) / p * np.sum(agreement * p ** depths)
+
+# =============================================================================
+# Ranking Comparison
+# =============================================================================
+def compare_pair(shared_ranks, task):
+    """
+    Compare two rankings stored in the shared rank matrix, which holds the dense
+    ranks of all rankings followed by their average ranks.
+    """
+    i, j, k, p = task
+    ranking_num = shared_ranks.matrix.shape[1] // 2
+    ranks_a = shared_ranks.matrix[:, i].astype(np.int64)
+    ranks_b = shared_ranks.matrix[:, j].astype(np.int64)
+    order_a = np.argsort(ranks_a, kind="stable")
+    order_b = np.argsort(ranks_b, kind="stable")
+    return {"kendall_tau": kendall_tau(ranks_a, ranks_b, order_a),
+            "spearman_rho": spearman_rho(shared_ranks.matrix[:, ranking_num + i], shared_ranks.matrix[:, ranking_num + j]),
+            f"top_{k}_overlap": top_k_overlap(order_a, order_b, k),
+            "rank_biased_overlap": rank_biased_overlap(order_a, order_b, p, k)}
+
+
+def compare_rankings(rankings, k=10, p=0.9, workers=None):
+    """
+    Compare every pair of rankings (a dictionary of score series indexed by
+    location, where higher scores are better) on the locations they have in
+    common. Pairs are compared in parallel, with ranks of all rankings in shared
+    memory. Returns a data frame with one row per pair of rankings.
+    """
+    names = list(rankings.keys())
+    scores = pd.concat([rankings[name] for name in names], axis=1, join="inner", keys=names)
+    dense = np.column_stack([dense_ranks(scores[name]) for name in names])
+    average = np.column_stack([average_ranks(dense[:, i]) for i in range(len(names))])
+    ranks = pd.DataFrame(np.hstack([dense, average]), index=scores.index,
+                         columns=[f"{name}_dense" for name in names] + [f"{name}_average" for name in names])
+
+    tasks = [(i, j, k, p) for i in range(len(names)) for j in range(i + 1, len(names))]
+    with SharedDecisionMatrix.create(ranks, ["max"] * ranks.shape[1]) as shared_ranks:
+        results = map_shared(compare_pair, shared_ranks, tasks, workers)
+
+    comparison = pd.DataFrame(results)
+    comparison.insert(0, "ranking_a", [names[i] for i, _, _, _ in tasks])
+    comparison.insert(1, "ranking_b", [names[j] for _, j, _, _ in tasks])
+    return comparison
+
+
+def comparison_matrix(comparison, metric):
+    """
+    Pivot pairwise comparison results into a symmetric matrix of one metric.
+    """
+    names = list(dict.fromkeys(list(comparison["ranking_a"]) + list(comparison["ranking_b"])))
+    matrix = pd.DataFrame(np.eye(len(names)), index=names, columns=names)
+    for _, pair in comparison.iterrows():
+        matrix.loc[pair["ranking_a"], pair["ranking_b"]] = pair[metric]
+        matrix.loc[pair["ranking_b"], pair["ranking_a"]] = pair[metric]
+    return matrix
+
+
+def load_rankings(file_paths):
+    """
+    Load ranking results saved by the application (ranking_*.csv files or
+    ranking Parquet datasets, results/ranking/run=*).
+    Locations are identified by the saved "site_index" column or, for older
+    files, by their community name and distance from shore.
+    """
+    rankings = {}
+    for file_path in file_paths:
+        file_path = os.path.normpath(file_path)
+        ranking, _ = load_result(file_path)
+        if "site_index" in ranking.columns:
+            ranking = ranking.set_index("site_index")
+        else:
+            ranking = ranking.set_index(["community_name", "distance_from_offshore_wind_farm"])
+            ranking = ranking[~ranking.index.duplicated(keep="first")]
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        if not file_path.endswith(".csv"):
+            name = f"{os.path.basename(os.path.dirname(file_path))}_{name}"
+        rankings[name] = ranking["Ranking"]
+    return rankings
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+from contextlib import contextmanager
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# =============================================================================
+# Memory Measurement
+# =============================================================================
+def available_memory():
+    """
+    Memory available to new allocations (in bytes), or None if unknown.
+    """
+    try:
+        with open("/proc/meminfo") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident set size of the process (Linux only), so that
+    the peak of every stage can be measured. Returns whether it was reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def process_status(field):
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss():
+    """
+    Resident set size of the process (in bytes), or None if unknown (Linux
+    only).
+    """
+    return process_status("VmRSS")
+
+
+def peak_rss():
+    """
+    Peak resident set size of the process (in bytes), or None if unknown.
+    """
+    peak = process_status("VmHWM")
+    if peak is not None:
+        return peak
+    if resource is None:
+        return None
+    # Maximum resident set size is in kilobytes, except on macOS (in bytes)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def format_bytes(size):
+    if size is None:
+        return "unknown"
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+# =============================================================================
+# Stage Footprints
+# =============================================================================
+def TOPSIS_footprint(alternative_num, criteria_num, itemsize=8, batch_num=1):
+    """
+    Memory of TOPSIS ranking of batch_num decision matrices (or weight
+    vectors): the normalized matrices and intermediate results take about four
+    times the memory of the decision matrices.
+    """
+    return 4 * batch_num * alternative_num * criteria_num * itemsize
+
+
+def fuzzy_TOPSIS_footprint(stakeholder_num, alternative_num, criteria_num):
+    """
+    Memory of Fuzzy TOPSIS: the fuzzified decision matrices of stakeholders
+    (three values per criterion value, with an integer copy), and the
+    aggregated fuzzy decision matrix of Python tuples (about 100 bytes per
+    criterion value).
+    """
+    return (stakeholder_num * 32 + 100) * alternative_num * criteria_num
+
+
+def simulation_footprint(stakeholder_num, alternative_num, criteria_num):
+    """
+    Memory of simulated decision matrices of stakeholders (one byte per
+    criterion value), with temporary scores of a batch of 5 stakeholders.
+    """
+    return (stakeholder_num + 5 * 16) * alternative_num * criteria_num
+
+
+def uncertainty_footprint(alternative_num, criteria_num, realization_num=1, itemsize=8, bin_num=100):
+    """
+    Memory of Monte Carlo data uncertainty analysis: rank statistics and rank
+    histograms of all alternatives, and realizations of the decision matrix.
+    """
+    return alternative_num * 8 * (bin_num + 8) + TOPSIS_footprint(alternative_num, criteria_num, itemsize, realization_num)
+
+
+def summary_footprint(chunk_rows, criteria_num, area_num=0, alternative_num=0, bins=128):
+    """
+    Memory of grouped scenario analysis: area codes of all alternatives,
+    histograms and statistics of every area and criterion, and gains of a
+    chunk of chunk_rows alternatives (with temporary copies).
+    """
+    return alternative_num * 16 + area_num * criteria_num * (bins + 6) * 8 + chunk_rows * criteria_num * 8 * 4
+
+
+def consensus_footprint(group_num, alternative_num, criteria_num):
+    """
+    Memory of consensus analysis: TOPSIS ranking of the decision matrix with
+    the weights of every group at once, and scores and ranks of every group.
+    """
+    return TOPSIS_footprint(alternative_num, criteria_num, batch_num=group_num) + group_num * alternative_num * 16
+
+
+def preview_footprint(alternative_num, criteria_num):
+    """
+    Memory of preview ranking: a copy of the decision matrix, and stratum
+    codes, key criterion bins and random numbers of all alternatives (the
+    sample is small).
+    """
+    return alternative_num * (criteria_num + 4) * 8
+
+
+def comparison_footprint(alternative_num, criteria_num):
+    """
+    Memory of comparing locations to the average: the selected data and
+    deviations, with a temporary copy.
+    """
+    return 3 * alternative_num * criteria_num * 8
+
+# =============================================================================
+# Memory Governor
+# =============================================================================
+class MemoryGovernor:
+    """
+    Memory budget of analysis stages. Stage footprints are estimated from the
+    data shape, and chunk sizes (rows, realizations or stakeholders per chunk)
+    and worker counts are chosen to fit the budget; a stage whose whole
+    computation does not fit falls back to streaming over chunks. By default,
+    the budget is half of the available memory (1 GB if unknown), and all
+    CPUs can be used. Peak resident set size is measured and reported for
+    every stage (per stage on Linux, the peak of the process so far
+    elsewhere).
+    """
+
+    def __init__(self, budget=None, max_workers=None):
+        if budget is None:
+            available = available_memory()
+            budget = available // 2 if available is not None else 2**30
+        self.budget = int(budget)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.stages = []
+
+    def fits(self, footprint):
+        return footprint <= self.budget
+
+    def chunk_size(self, item_bytes, item_num, fixed_bytes=0):
+        """
+        Number of items (of item_bytes each) per chunk that fit the budget
+        next to fixed_bytes, at least one and at most item_num.
+        """
+        return int(max(1, min(item_num, (self.budget - fixed_bytes) // max(item_bytes, 1))))
+
+    def workers(self, worker_bytes, task_num=None, shared_bytes=0):
+        """
+        Number of worker processes of worker_bytes each that fit the budget
+        next to shared_bytes, at least one and at most the number of CPUs and
+        tasks.
+        """
+        workers = min(self.max_workers, (self.budget - shared_bytes) // max(worker_bytes, 1))
+        if task_num is not None:
+            workers = min(workers, task_num)
+        return int(max(1, workers))
+
+    @contextmanager
+    def stage(self, name, footprint=None):
+        """
+        Measure a stage: its run time and peak resident set size, compared to
+        its estimated footprint. Yields the stage record, to which the stage
+        can add how it was run (e.g. its chunk size).
+        """
+        reset = reset_peak_rss()
+        start_rss = current_rss()
+        start_time = time.perf_counter()
+        record = {"stage": name, "estimated_memory": footprint, "budget": self.budget}
+        try:
+            yield record
+        finally:
+            record["peak_rss"] = peak_rss()
+            record["peak_increase"] = record["peak_rss"] - start_rss if reset and None not in (record["peak_rss"], start_rss) else None
+            record["time"] = time.perf_counter() - start_time
+            self.stages.append(record)
+            plan = ", ".join(f"{key.replace('_', ' ')} {value}" for key, value in record.items()
+                             if key not in ["stage", "estimated_memory", "budget", "peak_rss", "peak_increase", "time"])
+            increase = f" (+{format_bytes(record['peak_increase'])} in the stage)" if record["peak_increase"] is not None else " (of the process)"
+            print(f"\n{name}: peak memory {format_bytes(record['peak_rss'])}{increase}, "
+                  f"estimated {format_bytes(footprint)} of {format_bytes(self.budget)} budget"
+                  f"{', ' + plan if plan else ''}, {record['time']:.2f} s.")
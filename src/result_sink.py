@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+import atexit
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from urllib.parse import quote
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# =============================================================================
+# Result Sink
+# =============================================================================
+class ResultSink:
+    """
+    Save results in a background thread, so that the session does not wait
+    while large results are written. Results are written as compressed Parquet
+    datasets, one directory per result name and run
+    (directory/name/run=<run>/), partitioned by community_name when results
+    have it (.../community_name=<name>/part-0.parquet), or exported as CSV
+    files (directory/name_<run>.csv). Results are written in chunks of rows,
+    so the writer never holds more than one chunk of converted data, and at
+    most max_pending results wait in the queue before saving blocks. Every
+    chunk of a partition is written to its own file (part-<chunk>.parquet),
+    so only one file is open at a time, however many partitions a result
+    has. A result is written to a temporary path and moved to its path only
+    when it is complete, and partial output of a failed result is deleted.
+    Written and failed results are reported by report().
+    Row labels are kept as the site_index column (or the name of the index),
+    except for an unnamed default range index. Run parameters are stored in
+    the Parquet schema metadata (run_parameters, as JSON).
+    """
+
+    def __init__(self, directory="results", file_format="parquet", chunk_size=1000000, max_pending=8, compression="zstd"):
+        if file_format == "parquet" and pq is None:
+            print("\nWriting .parquet files requires pyarrow. Results will be exported as .csv files.")
+            file_format = "csv"
+        self.directory = directory
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.errors = []
+        self.written = []
+        self.saved = set()
+        self.run_num = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._write_loop, name="result-sink", daemon=True)
+        self.thread.start()
+        # Queued results are written before the interpreter exits
+        atexit.register(self.close)
+
+    def save(self, name, result, parameters=None, index_label="site_index"):
+        """
+        Queue a result (data frame) for writing. The result should not be
+        modified afterwards. Returns the path the dataset or file will be
+        written to, which exists once the result is written.
+        """
+        self.report()
+        self.run_num += 1
+        run = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.run_num}"
+        if self.file_format == "parquet":
+            path = os.path.join(self.directory, name, f"run={run}")
+        else:
+            path = os.path.join(self.directory, f"{name}_{run}.csv")
+        parameters = dict(parameters or {}, result=name, run=run, rows=len(result))
+        self.queue.put((path, result, parameters, index_label))
+        return path
+
+    def close(self):
+        """
+        Wait until all queued results are written and stop the writer.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        pending = self.queue.qsize()
+        if pending:
+            print(f"\nWaiting for {pending} results to be written...")
+        self.queue.put(None)
+        self.thread.join()
+        self.report()
+
+    def report(self):
+        """
+        Report results written and failed since the last report. Returns the
+        paths of written results.
+        """
+        written = []
+        while self.written:
+            path = self.written.pop(0)
+            print(f"\nResults are saved to {path}.")
+            written.append(path)
+        while self.errors:
+            path, error = self.errors.pop(0)
+            print(f"\nAn error occurred while writing {path}: {error}")
+        return written
+
+    def _write_loop(self):
+        while(True):
+            job = self.queue.get()
+            if job is None:
+                break
+            path = job[0]
+            # Results are written next to their path (hidden from dataset
+            # readers) and moved when they are complete
+            temporary_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+            try:
+                if self.file_format == "parquet":
+                    self._write_parquet(temporary_path, *job[1:])
+                else:
+                    self._write_csv(temporary_path, *job[1:])
+                os.replace(temporary_path, path)
+                self.written.append(path)
+                self.saved.add(path)
+            except Exception as e:
+                if os.path.isdir(temporary_path):
+                    shutil.rmtree(temporary_path, ignore_errors=True)
+                elif os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+                self.errors.append((path, str(e)))
+
+    def _chunks(self, result, index_label):
+        keep_index = not (isinstance(result.index, pd.RangeIndex) and result.index.name is None and result.index.start == 0)
+        for start in range(0, max(len(result), 1), self.chunk_size):
+            chunk = result.iloc[start:start+self.chunk_size]
+            if keep_index:
+                chunk = chunk.rename_axis(result.index.name or index_label).reset_index()
+            else:
+                chunk = chunk.reset_index(drop=True)
+            yield chunk
+
+    def _write_csv(self, path, result, parameters, index_label):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        for i, chunk in enumerate(self._chunks(result, index_label)):
+            chunk.to_csv(path, mode="w" if i == 0 else "a", header=(i == 0), index=False)
+
+    def _write_parquet(self, path, result, parameters, index_label):
+        partitioned = "community_name" in result.columns
+        schema = None
+        os.makedirs(path, exist_ok=True)
+        for i, chunk in enumerate(self._chunks(result, index_label)):
+            if partitioned:
+                partitions = chunk.groupby(chunk["community_name"].astype(str), sort=False).indices
+                chunk = chunk.drop(columns="community_name")
+            else:
+                partitions = {None: slice(None)}
+            if schema is None:
+                schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                metadata = dict(schema.metadata or {})
+                metadata[b"run_parameters"] = json.dumps(parameters, default=str).encode()
+                schema = schema.with_metadata(metadata)
+            for partition, rows in partitions.items():
+                directory = path if partition is None else os.path.join(path, f"community_name={quote(partition, safe='')}")
+                os.makedirs(directory, exist_ok=True)
+                table = pa.Table.from_pandas(chunk.iloc[rows], schema=schema, preserve_index=False)
+                pq.write_table(table, os.path.join(directory, f"part-{i}.parquet"), compression=self.compression)
+
+
+def load_result(path):
+    """
+    Load a saved result (a Parquet dataset or a CSV file) and its run
+    parameters (None for CSV files).
+    """
+    if path.endswith(".csv"):
+        return pd.read_csv(path), None
+    result = pd.read_parquet(path)
+    parameters = None
+    for root, _, files in os.walk(path):
+        if files:
+            metadata = pq.read_schema(os.path.join(root, files[0])).metadata or {}
+            parameters = json.loads(metadata[b"run_parameters"]) if b"run_parameters" in metadata else None
+            break
+    return result, parameters
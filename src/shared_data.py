@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import os
+import pandas as pd
+import weakref
+
+# =============================================================================
+# Shared Decision Matrix
+# =============================================================================
+class SharedDecisionMatrix:
+    """
+    Decision matrix stored in shared memory, together with its criteria names,
+    criteria types (cost or benefit) and row index. Worker processes attach to
+    the matrix by its description and get NumPy views of the same memory, so
+    the data is never copied or pickled per worker.
+
+    The process that creates the matrix owns it and unlinks the shared memory
+    when the matrix is closed (or garbage collected). Attached processes only
+    close their views.
+    """
+
+    def __init__(self, matrix_block, index_block, description, owner):
+        self._matrix_block = matrix_block
+        self._index_block = index_block
+        self.description = description
+        self.owner = owner
+
+        rows, criteria_num = description["shape"]
+        self.matrix = np.ndarray((rows, criteria_num), dtype=np.dtype(description["dtype"]), buffer=matrix_block.buf)
+        if index_block is not None:
+            self.index = np.ndarray((rows,), dtype=np.dtype(description["index_dtype"]), buffer=index_block.buf)
+        else:
+            self.index = np.asarray(description["index_labels"], dtype=object)
+        self.criteria = list(description["criteria"])
+        self.types = list(description["types"])
+
+        blocks = [block for block in (matrix_block, index_block) if block is not None]
+        self._finalizer = weakref.finalize(self, _release_blocks, blocks, owner)
+
+    @classmethod
+    def create(cls, selected_data, types, dtype=np.float64):
+        """
+        Copy selected data (a data frame of criteria values) into shared memory.
+        """
+        matrix = selected_data.to_numpy(dtype=dtype)
+        matrix_block = shared_memory.SharedMemory(create=True, size=max(matrix.nbytes, 1))
+        np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=matrix_block.buf)[:] = matrix
+
+        description = {"matrix_name": matrix_block.name, "shape": matrix.shape, "dtype": matrix.dtype.str,
+                       "criteria": list(selected_data.columns), "types": list(types)}
+
+        # Numeric row labels are shared as well, other labels are sent along
+        # with the description
+        index = selected_data.index.to_numpy()
+        index_block = None
+        if np.issubdtype(index.dtype, np.number):
+            index_block = shared_memory.SharedMemory(create=True, size=max(index.nbytes, 1))
+            np.ndarray(index.shape, dtype=index.dtype, buffer=index_block.buf)[:] = index
+            description["index_name"] = index_block.name
+            description["index_dtype"] = index.dtype.str
+        else:
+            description["index_labels"] = index.tolist()
+
+        return cls(matrix_block, index_block, description, owner=True)
+
+    @classmethod
+    def attach(cls, description):
+        """
+        Attach to a decision matrix created by another process.
+        """
+        matrix_block = shared_memory.SharedMemory(name=description["matrix_name"])
+        index_block = None
+        if "index_name" in description:
+            index_block = shared_memory.SharedMemory(name=description["index_name"])
+        return cls(matrix_block, index_block, description, owner=False)
+
+    def to_frame(self):
+        """
+        Data frame view of the decision matrix, indexed by the row labels.
+        """
+        return pd.DataFrame(self.matrix, index=pd.Index(self.index), columns=self.criteria, copy=False)
+
+    def close(self):
+        """
+        Release the views of this process (and the shared memory, if owned).
+        """
+        self.matrix = None
+        self.index = None
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __reduce__(self):
+        # Pickling sends only the description; unpickling attaches to the
+        # same shared memory
+        return (SharedDecisionMatrix.attach, (self.description,))
+
+
+def _release_blocks(blocks, owner):
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:
+            # Views of the block are still in use and keep the memory mapped
+            pass
+        if owner:
+            block.unlink()
+
+# =============================================================================
+# Parallel Processing
+# =============================================================================
+_worker_matrix = None
+
+def _init_worker(description):
+    global _worker_matrix
+    _worker_matrix = SharedDecisionMatrix.attach(description)
+
+
+def _run_task(arguments):
+    function, task = arguments
+    return function(_worker_matrix, task)
+
+
+def map_shared(function, shared_matrix, tasks, workers=None):
+    """
+    Apply function(shared_matrix, task) to every task in a pool of processes.
+    Every worker attaches to the shared decision matrix once, so only the tasks
+    and their results are sent between processes. The function must be
+    defined at the top level of a module.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    tasks = list(tasks)
+    if workers <= 1 or len(tasks) <= 1:
+        return [function(shared_matrix, task) for task in tasks]
+
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared_matrix.description,)) as executor:
+        return list(executor.map(_run_task, [(function, task) for task in tasks], chunksize=chunksize))
@@ -6,37 +6,198 @@
 from matplotlib import pyplot as plt
 import numpy as np
 import pandas as pd
+import time
 
 from data_selection import select_criteria, select_stakeholders
-from decision_making import PCM, DM, TOPSIS
+from decision_making import PCM, batch_DM, batch_TOPSIS, batch_fuzzy_TOPSIS, TOPSIS_top_k
+from decision_making import AHP_weights, hierarchical_AHP_weights, compute_dtype
+from decision_making import TOPSIS_statistics, TOPSIS_statistics_parameters, TOPSIS_closeness
 from messages import invalid_input_message, simulate_data_message
+from pairwise_comparison import consistent_PCM
 
 # =============================================================================
 # Simulating Decision Making 
 # =============================================================================
-def simulate_decision_making(data, stakeholder_groups, criteria):
+def simulate_decision_making(data, stakeholder_groups, criteria, PCM_sampling="uniform", num_stakeholders_per_group=5):
+    """
+    Simulate pairwise comparison matrices and decision matrices of stakeholders.
+    Pairwise comparison matrices are sampled either judgement by judgement
+    from a uniform distribution ("uniform", the default), or from latent
+    priority vectors, which makes them near-consistent by construction
+    ("latent").
+    Returns the lists of pairwise comparison matrices and decision matrices,
+    and the stakeholder group of every simulated stakeholder.
+    """
     
     criteria_num = len(criteria)    
     evaluated_data = evaluate_dataset(data)
 
     # Simulate decision makings for a selected number of stakeholders from different
     # stakeholder groups
-    num_stakeholders_per_group = 5
     PCM_list = []
     DM_list = []
+    labels = []
 
     for stakeholder, preferable_criteria in stakeholder_groups.items():
         preferable_criteria_range = [index for index, element in enumerate(criteria) if element in preferable_criteria]
-        for p in range(num_stakeholders_per_group):
-            PCM_list.append(PCM(criteria_num, preferable_criteria_range))
-            DM_list.append(DM(evaluated_data, preferable_criteria_range))
+        if PCM_sampling == "latent":
+            PCM_list.extend(consistent_PCM(criteria_num, preferable_criteria_range, num_stakeholders_per_group))
+        elif PCM_sampling == "uniform":
+            for p in range(num_stakeholders_per_group):
+                PCM_list.append(PCM(criteria_num, preferable_criteria_range))
+        DMs = batch_DM(evaluated_data, preferable_criteria_range, num_stakeholders_per_group)
+        DM_list.extend(DMs)
+        labels.extend([stakeholder] * len(DMs))
+    
+    return PCM_list, DM_list, labels
+
+
+def simulate_hierarchical_decision_making(data, stakeholder_groups, criteria_groups, criteria, num_stakeholders_per_group=5):
+    """
+    Simulate pairwise comparison matrices of stakeholders over a two-level
+    hierarchy of criteria: a matrix comparing criteria groups, and a matrix
+    comparing criteria within each group. Stakeholders prefer the criteria
+    group they belong to. Decision matrices are simulated as without the
+    hierarchy.
+    Returns a dictionary with criteria groups (lists of criteria indices),
+    group pairwise comparison matrices of shape (stakeholders, groups, groups)
+    and local pairwise comparison matrices of each group, a list of decision
+    matrices, and the stakeholder group of every simulated stakeholder.
+    """
+    
+    evaluated_data = evaluate_dataset(data)
+    group_names = list(criteria_groups.keys())
+    groups = [[criteria.index(criterion) for criterion in criteria_groups[name]] for name in group_names]
+
+    group_PCM_list = []
+    local_PCM_lists = [[] for group in groups]
+    DM_list = []
+    labels = []
+
+    for stakeholder, preferable_criteria in stakeholder_groups.items():
+        preferable_criteria_range = [index for index, element in enumerate(criteria) if element in preferable_criteria]
+        preferable_group_range = [index for index, name in enumerate(group_names) if name == stakeholder]
+        group_PCM_list.extend(consistent_PCM(len(groups), preferable_group_range, num_stakeholders_per_group))
+        for k, group in enumerate(groups):
+            preferable_local_range = [index for index, element in enumerate(group) if element in preferable_criteria_range]
+            local_PCM_lists[k].extend(consistent_PCM(len(group), preferable_local_range, num_stakeholders_per_group))
+        DMs = batch_DM(evaluated_data, preferable_criteria_range, num_stakeholders_per_group)
+        DM_list.extend(DMs)
+        labels.extend([stakeholder] * len(DMs))
+    
+    hierarchical_PCMs = {"groups": groups,
+                         "group_PCMs": np.array(group_PCM_list),
+                         "local_PCMs": [np.array(local_PCM_list) for local_PCM_list in local_PCM_lists]}
+    return hierarchical_PCMs, DM_list, labels
+
+
+def adaptive_decision_making(data, stakeholder_groups, criteria, types, criteria_groups=None,
+                             tolerance=0.005, k=10, batch_size=5, max_stakeholders=10000, time_budget=60., PCM_sampling="uniform"):
+    """
+    Simulate stakeholders in batches (batch_size stakeholders per group) until
+    the aggregated criteria weights and the top-k TOPSIS ranking converge:
+    the 95% confidence interval of the mean weight of every criterion is
+    narrower than +-tolerance, and the k best alternatives did not change with
+    the last batch. Simulation stops earlier when max_stakeholders are
+    simulated or time_budget (in seconds) runs out. Criteria weights are
+    calculated over criteria_groups with hierarchical AHP, if given, and
+    pairwise comparison matrices are sampled with PCM_sampling otherwise
+    (see simulate_decision_making).
+    Returns pairwise comparison matrices, decision matrices and stakeholder
+    groups of all simulated stakeholders, and the convergence trace.
+    """
+    start_time = time.perf_counter()
+    X = data.to_numpy(dtype=float)
+    k = min(k, len(X))
     
-    return PCM_list, DM_list
+    PCM_batches = []
+    DM_list = []
+    labels = []
+    trace = []
+    weight_num = 0
+    weight_mean = np.zeros(len(criteria))
+    weight_M2 = np.zeros(len(criteria))
+    previous_top_k = None
+    
+    while(True):
+        if criteria_groups is None:
+            PCMs, DMs, batch_labels = simulate_decision_making(data, stakeholder_groups, criteria, PCM_sampling, num_stakeholders_per_group=batch_size)
+            PCMs = np.array(PCMs)
+            _, weights, _, consistent, repaired = AHP_weights(PCMs)
+            weights = weights[consistent | repaired]
+        else:
+            PCMs, DMs, batch_labels = simulate_hierarchical_decision_making(data, stakeholder_groups, criteria_groups, criteria, num_stakeholders_per_group=batch_size)
+            weights, _, accepted = hierarchical_AHP_weights(PCMs)
+            weights = weights[accepted]
+        PCM_batches.append(PCMs)
+        DM_list.extend(DMs)
+        labels.extend(batch_labels)
+        
+        # Merge running mean and sum of squared deviations of weights with
+        # those of the batch
+        if len(weights):
+            batch_mean = weights.mean(axis=0)
+            delta = batch_mean - weight_mean
+            total = weight_num + len(weights)
+            weight_mean = weight_mean + delta * len(weights) / total
+            weight_M2 = weight_M2 + ((weights - batch_mean) ** 2).sum(axis=0) + delta ** 2 * weight_num * len(weights) / total
+            weight_num = total
+        half_width = 1.96 * np.sqrt(weight_M2 / (weight_num - 1) / weight_num) if weight_num > 1 else np.full(len(criteria), np.inf)
+        
+        # Stability of the k best alternatives
+        top_k_positions, _ = TOPSIS_top_k(X, weight_mean, types, k) if weight_num else (None, None)
+        if previous_top_k is None or top_k_positions is None:
+            top_k_overlap = 0.
+        else:
+            top_k_overlap = len(np.intersect1d(top_k_positions, previous_top_k)) / k
+        previous_top_k = top_k_positions
+        
+        elapsed_time = time.perf_counter() - start_time
+        trace.append({"stakeholders": len(DM_list), "accepted_stakeholders": weight_num,
+                      "max_weight_CI_half_width": half_width.max(), "top_k_overlap": top_k_overlap,
+                      "elapsed_time": elapsed_time})
+        
+        if half_width.max() <= tolerance and top_k_overlap == 1:
+            print(f"\nWeights and ranking converged after {len(DM_list)} simulated stakeholders.")
+            break
+        if len(DM_list) >= max_stakeholders or elapsed_time >= time_budget:
+            print(f"\nSimulation budget ran out after {len(DM_list)} simulated stakeholders, before weights and ranking converged.")
+            break
+    
+    if criteria_groups is None:
+        PCM_list = list(np.concatenate(PCM_batches))
+    else:
+        PCM_list = {"groups": PCM_batches[0]["groups"],
+                    "group_PCMs": np.concatenate([batch["group_PCMs"] for batch in PCM_batches]),
+                    "local_PCMs": [np.concatenate([batch["local_PCMs"][k] for batch in PCM_batches]) for k in range(len(PCM_batches[0]["groups"]))]}
+    return PCM_list, DM_list, labels, pd.DataFrame(trace)
+
+
+def criteria_hierarchy(stakeholder_groups, criteria):
+    """
+    Group criteria by stakeholder groups they are preferred by. Criteria that
+    do not belong to any stakeholder group form a separate group.
+    """
+    criteria_groups = {}
+    for group, group_criteria in stakeholder_groups.items():
+        criteria_tmp = [criterion for criterion in group_criteria if criterion in criteria]
+        if criteria_tmp:
+            criteria_groups[group] = criteria_tmp
+    grouped_criteria = [criterion for group_criteria in criteria_groups.values() for criterion in group_criteria]
+    other_criteria = [criterion for criterion in criteria if criterion not in grouped_criteria]
+    if other_criteria:
+        criteria_groups["other"] = other_criteria
+    return criteria_groups
 
 # =============================================================================
 # Simulating Stakeholder Evaluation
 # =============================================================================
-def simulate_data(data):
+def select_simulation(data, types=None):
+    """
+    Select stakeholder groups or criteria of the simulation. Returns all
+    stakeholder groups, the selected groups with their criteria, the
+    selected criteria and their types (None if the selection is cancelled).
+    """
     print(simulate_data_message())
     default_stakeholder_groups = {"socio-economic": ["average_income", "fishing_dependency", "unemployment_rate", "tourism_revenue"],
                           "fisheries": ["fish_stock_health", "potential_habitat_restoration"],
@@ -67,7 +228,7 @@ def simulate_data(data):
             if stakeholder_selection is not None:
                 break
         elif subsub_choice == "2":
-            criteria_selection, types = select_criteria(list(data.columns), return_types=True)
+            criteria_selection, selection_types = select_criteria(list(data.columns), return_types=True)
             if criteria_selection is not None:
                 break
         elif subsub_choice == "3":
@@ -77,8 +238,8 @@ def simulate_data(data):
             
     if stakeholder_selection is not None:
         criteria_selection = list(data.columns)
+        selection_types = types
         stakeholder_selection = {key: stakeholder_groups[key] for key in stakeholder_selection}
-        return simulate_decision_making(data, stakeholder_selection, criteria_selection)
     elif criteria_selection is not None:
         stakeholder_selection = dict(stakeholder_groups)
         for group, criteria in stakeholder_selection.items():
@@ -87,7 +248,34 @@ def simulate_data(data):
                 if criterion in criteria_selection:
                     criteria_tmp.append(criterion)
             stakeholder_selection[group] = criteria_tmp
-        return simulate_decision_making(data, stakeholder_selection, criteria_selection)
+    else:
+        return None
+    return stakeholder_groups, stakeholder_selection, criteria_selection, selection_types
+
+
+def simulate_data(data, selection, sink, hierarchical=False, adaptive=False, max_stakeholders=10000, PCM_sampling="uniform"):
+    """
+    Simulate pairwise comparison matrices and decision matrices of
+    stakeholders of the selection (see select_simulation), with PCM_sampling
+    of pairwise comparison matrices without hierarchy. Returns them with
+    the group label of every stakeholder. The convergence trace of adaptive
+    simulation is saved to the result sink.
+    """
+    stakeholder_groups, stakeholder_selection, criteria_selection, selection_types = selection
+    criteria_groups = criteria_hierarchy(stakeholder_groups, criteria_selection) if hierarchical else None
+    if adaptive:
+        PCM_list, DM_list, labels, trace = adaptive_decision_making(data[criteria_selection], stakeholder_selection, criteria_selection,
+                                                            selection_types, criteria_groups, max_stakeholders=max_stakeholders,
+                                                            PCM_sampling=PCM_sampling)
+        print(f"Convergence trace:\n{trace.tail()}")
+        path = sink.save("convergence", trace, {"stakeholder_groups": list(stakeholder_selection), "criteria": criteria_selection})
+        print(f"Convergence trace is being saved to {path}.")
+        return PCM_list, DM_list, np.array(labels)
+    if hierarchical:
+        PCM_list, DM_list, labels = simulate_hierarchical_decision_making(data, stakeholder_selection, criteria_groups, criteria_selection)
+    else:
+        PCM_list, DM_list, labels = simulate_decision_making(data, stakeholder_selection, criteria_selection, PCM_sampling)
+    return PCM_list, DM_list, np.array(labels)
 
 
 # =============================================================================
@@ -126,50 +314,72 @@ def evaluate_dataset(dataset):
 # =============================================================================
 # Sensitivity Analysis
 # =============================================================================
-def sensitivity_analysis(data, selected_data, criteria, types, selection_index):
-    # Begin with equal weights and calculate the baseline ranking -------------
+def perturbed_weights(weights, weight_changes):
+    """
+    Weight vectors with the weight of each criterion changed by each relative
+    change, and the other weights renormalized proportionally, so that they
+    keep their ratios and all weights sum to one.
+    Returns an array of shape (criteria, changes, criteria).
+    """
+    weights = np.asarray(weights, dtype=float)
+    changed = np.clip(weights[:, None] * (1 + np.asarray(weight_changes, dtype=float)), 0, 1)
+    other = 1 - weights[:, None]
+    scale = np.divide(1 - changed, other, out=np.zeros_like(changed), where=other > 0)
+    perturbed = weights * scale[:, :, None]
+    criteria_range = np.arange(len(weights))
+    perturbed[criteria_range, :, criteria_range] = changed
+    return perturbed
+
+
+def sensitivity_analysis(data, selected_data, criteria, types, selection_index, weights=None, fuzzy_model=None,
+                         chunk_size=None, weight_changes=(-0.5, -0.25, -0.1, 0.1, 0.25, 0.5)):
+    """
+    Analyze how the score of the selected alternative changes with the weight
+    of each criterion, around the weights of the ranking (equal weights if not
+    given). The weight of each criterion is changed by each relative change,
+    and the other weights are renormalized proportionally. The baseline and
+    all perturbed weights are scored in one vectorized computation: TOPSIS
+    with column statistics of the decision matrix (streamed over chunks of
+    chunk_size alternatives, if given), or, for a Fuzzy TOPSIS ranking
+    (fuzzy_model of aggregated fuzzy weights and the aggregated fuzzy decision
+    matrix), Fuzzy TOPSIS with triangular fuzzy weights scaled as the
+    perturbed weights.
+    """
     criteria_num = len(criteria)
-    baseline_weights = np.zeros(criteria_num) + (1. / criteria_num)
-    
-    ranking = TOPSIS(selected_data, baseline_weights, types)
-    result = selected_data.copy()
-    result["Ranking"] = ranking
-    result.sort_values("Ranking", ascending=False, inplace=True)
-    result["community_name"] = data.loc[result.index]["community_name"]
-    baseline_ranking = result
-    
-    ranking_analysis = baseline_ranking[["Ranking"]].copy()
-    ranking_analysis.rename(columns={"Ranking": "baseline_ranking"}, inplace=True)
-    
-    # Simulate weight changes and calculate ranking ---------------------------
-    weight_range = [0.1, 0.15, 0.2, 0.25, 0.3]
-    for i in range(criteria_num):
-        for weight in weight_range:
-            weights = np.zeros(criteria_num) + ((1.-weight) / (criteria_num-1))
-            weights[i] = weight
-            ranking = TOPSIS(selected_data, weights, types)
-            result = selected_data.copy()
-            result["Ranking"] = ranking
-            result.sort_values("Ranking", ascending=False, inplace=True)
-            result["community_name"] = data.loc[result.index]["community_name"]
-            ranking = result
-            ranking_analysis = pd.merge(ranking_analysis, ranking[["Ranking"]], left_index=True, right_index=True)
-            ranking_analysis.rename(columns={"Ranking": f"{criteria[i]}_{weight}"}, inplace=True)
+    selection_position = selected_data.index.get_loc(selection_index)
+    if fuzzy_model is not None:
+        # Crisp weights are the normalized modal values of the fuzzy weights
+        fuzzy_weights, fuzzy_DM = fuzzy_model
+        fuzzy_weights = np.asarray(fuzzy_weights, dtype=float)
+        baseline_weights = fuzzy_weights[:, 1] / np.sum(fuzzy_weights[:, 1])
+    elif weights is None:
+        baseline_weights = np.zeros(criteria_num) + (1. / criteria_num)
+    else:
+        baseline_weights = np.asarray(weights, dtype=float)
+    weights_array = np.vstack([baseline_weights, perturbed_weights(baseline_weights, weight_changes).reshape(-1, criteria_num)])
+    
+    # Only the scores of the selected alternative are needed, so the rankings
+    # are neither sorted nor joined with the rest of the data
+    if fuzzy_model is not None:
+        scale = np.divide(weights_array, baseline_weights, out=np.zeros_like(weights_array), where=baseline_weights > 0)
+        scores = batch_fuzzy_TOPSIS(fuzzy_DM, fuzzy_weights * scale[:, :, None], types, [selection_position])[:, 0]
+    else:
+        if chunk_size is None:
+            chunk_size = len(selected_data)
+        statistics = TOPSIS_statistics((selected_data.iloc[start:start+chunk_size].to_numpy(dtype=float)
+                                        for start in range(0, len(selected_data), chunk_size)), criteria_num)
+        selection = selected_data.iloc[[selection_position]].to_numpy(dtype=float)
+        scores = TOPSIS_closeness(selection, weights_array, *TOPSIS_statistics_parameters(statistics, weights_array, types))
+    selection_baseline_ranking = scores[0]
+    criterion_scores = scores[1:].reshape(criteria_num, len(weight_changes))
 
     # Analyze how each criteria influences the selected alternative -----------
-    selection_analysis = ranking_analysis.loc[selection_index]
-    selection_baseline_ranking = selection_analysis["baseline_ranking"]
     selection_community = data.loc[selection_index]["community_name"]
     selection_distance_from_shore = data.loc[selection_index]["distance_from_offshore_wind_farm"]
-    selection_sensitivity = {}
-    impact_range = {}
-    for criterion in criteria:
-        criterion_analysis = selection_analysis.filter(like=criterion, axis=0).tolist()
-        selection_sensitivity[criterion] = {"min": np.min(criterion_analysis), "baseline": selection_baseline_ranking, "max": np.max(criterion_analysis)}
-        impact_range[criterion] = np.max(criterion_analysis) - np.min(criterion_analysis)
-        
-    selection_sensitivity = pd.DataFrame.from_dict(selection_sensitivity).transpose()
-    impact_range = pd.DataFrame.from_dict(impact_range, orient="index", columns=["impact"]).sort_values("impact", ascending=False)
+    selection_sensitivity = pd.DataFrame({"min": np.minimum(criterion_scores.min(axis=1), selection_baseline_ranking),
+                                          "baseline": selection_baseline_ranking,
+                                          "max": np.maximum(criterion_scores.max(axis=1), selection_baseline_ranking)}, index=criteria)
+    impact_range = (selection_sensitivity["max"] - selection_sensitivity["min"]).sort_values(ascending=False, kind="stable")
     selection_sensitivity = selection_sensitivity.reindex(impact_range.index)
 
     sorted_criteria = list(selection_sensitivity.index)
@@ -194,4 +404,101 @@ def sensitivity_analysis(data, selected_data, criteria, types, selection_index):
     plt.savefig(f"Sensitivity Analysis ({selection_community}, distance from shore {selection_distance_from_shore} km).png")
     plt.close()
     
-    return selection_sensitivity
+    selection_sensitivity["weight"] = pd.Series(baseline_weights, index=criteria)
+    return selection_sensitivity.rename_axis("criterion")
+
+
+# =============================================================================
+# Data Uncertainty Analysis
+# =============================================================================
+def perturb_data(values, criteria, error_model, realization_num, rng):
+    """
+    Generate realizations of the decision matrix (realizations x alternatives
+    x criteria) by adding errors to the criteria values. The error model defines
+    the error of each criterion: "relative" (normally distributed, with standard
+    deviation given as a fraction of the value), "absolute" (normally
+    distributed, with standard deviation in the criterion units) or "bounds"
+    (uniformly distributed between the lower and upper bound).
+    """
+    realizations = np.repeat(values[None, :, :], realization_num, axis=0)
+    for j, criterion in enumerate(criteria):
+        if criterion not in error_model:
+            continue
+        error = error_model[criterion]
+        shape = (realization_num, len(values))
+        if error["type"] == "relative":
+            realizations[:, :, j] *= 1 + error["value"] * rng.standard_normal(shape)
+        elif error["type"] == "absolute":
+            realizations[:, :, j] += error["value"] * rng.standard_normal(shape)
+        elif error["type"] == "bounds":
+            realizations[:, :, j] += rng.uniform(error["lower"], error["upper"], shape)
+    return realizations
+
+
+def data_uncertainty_analysis(selected_data, weights, types, error_model, realization_num=1000, k=10, memory_limit=2**28, seed=None):
+    """
+    Propagate uncertainty of the criteria values (e.g. noisy survey data)
+    through TOPSIS ranking with Monte Carlo simulation. Realizations of the
+    decision matrix are ranked in batches with one vectorized computation per
+    batch, with the batch size chosen to fit the memory limit (in bytes).
+    Single precision data is perturbed and ranked in single precision, which
+    doubles the batch size.
+    Returns rank statistics of every alternative and its probability of being
+    among the k best ranked alternatives.
+    """
+    rng = np.random.default_rng(seed)
+    values = selected_data.to_numpy(dtype=compute_dtype(selected_data))
+    alternative_num, criteria_num = values.shape
+    criteria = list(selected_data.columns)
+    weights = np.asarray(weights, dtype=float)
+    
+    # Perturbed matrices and TOPSIS intermediate results take about four times
+    # the memory of one realization of the decision matrix
+    batch_size = int(max(1, min(realization_num, memory_limit // (4 * values.itemsize * alternative_num * criteria_num))))
+    # Rank histograms use logarithmically spaced bins, which keep exact ranks
+    # for the best ranked alternatives
+    bin_edges = np.unique(np.rint(np.geomspace(1, alternative_num + 1, 101)).astype(np.int64))
+    bin_num = len(bin_edges) - 1
+    
+    rank_sum = np.zeros(alternative_num)
+    rank_square_sum = np.zeros(alternative_num)
+    rank_min = np.full(alternative_num, alternative_num)
+    rank_max = np.zeros(alternative_num, dtype=np.int64)
+    top_k_count = np.zeros(alternative_num)
+    rank_histogram = np.zeros(alternative_num * bin_num, dtype=np.int64)
+    
+    for start in range(0, realization_num, batch_size):
+        batch_num = min(batch_size, realization_num - start)
+        realizations = perturb_data(values, criteria, error_model, batch_num, rng)
+        scores = batch_TOPSIS(realizations, weights, types)
+        
+        order = np.argsort(-scores, axis=1, kind="stable")
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, np.arange(1, alternative_num + 1)[None, :], axis=1)
+        
+        rank_sum += ranks.sum(axis=0)
+        rank_square_sum += (ranks.astype(float) ** 2).sum(axis=0)
+        rank_min = np.minimum(rank_min, ranks.min(axis=0))
+        rank_max = np.maximum(rank_max, ranks.max(axis=0))
+        top_k_count += (ranks <= k).sum(axis=0)
+        rank_bins = np.searchsorted(bin_edges, ranks, side="right") - 1
+        rank_histogram += np.bincount((np.arange(alternative_num)[None, :] * bin_num + rank_bins).ravel(), minlength=alternative_num * bin_num)
+    
+    # Rank percentiles are estimated from the rank histogram of each alternative
+    cumulative_histogram = np.cumsum(rank_histogram.reshape(alternative_num, bin_num), axis=1)
+    def rank_percentile(q):
+        percentile_bin = np.argmax(cumulative_histogram >= q * realization_num, axis=1)
+        return np.clip(bin_edges[percentile_bin + 1] - 1, rank_min, rank_max)
+    
+    rank_mean = rank_sum / realization_num
+    result = pd.DataFrame({"rank_mean": rank_mean,
+                           "rank_std": np.sqrt(np.maximum(rank_square_sum / realization_num - rank_mean ** 2, 0)),
+                           "rank_min": rank_min,
+                           "rank_p05": rank_percentile(0.05),
+                           "rank_median": rank_percentile(0.5),
+                           "rank_p95": rank_percentile(0.95),
+                           "rank_max": rank_max,
+                           f"probability_top_{k}": top_k_count / realization_num},
+                          index=selected_data.index)
+    result.sort_values(["rank_mean"], inplace=True)
+    return result
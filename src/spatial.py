@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+earth_radius = 6371.0088    # Mean Earth radius in km
+
+# =============================================================================
+# Coordinates
+# =============================================================================
+def coordinate_columns(data):
+    """
+    Names of latitude and longitude columns of the data, or None if the data
+    has no coordinates.
+    """
+    for latitude, longitude in [("latitude", "longitude"), ("lat", "lon")]:
+        if latitude in data.columns and longitude in data.columns:
+            return latitude, longitude
+    return None
+
+
+def unit_vectors(latitudes, longitudes):
+    """
+    Convert latitudes and longitudes (in degrees) to 3D points on the unit
+    sphere, where the straight-line (chord) distance is monotonic in the
+    great-circle distance, so a KD-tree finds the nearest points on Earth.
+    """
+    latitudes = np.radians(np.asarray(latitudes, dtype=float))
+    longitudes = np.radians(np.asarray(longitudes, dtype=float))
+    cos_latitudes = np.cos(latitudes)
+    return np.stack([cos_latitudes * np.cos(longitudes), cos_latitudes * np.sin(longitudes), np.sin(latitudes)], axis=-1)
+
+
+def chord_to_km(chord):
+    return 2 * earth_radius * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def km_to_chord(distance):
+    return 2 * np.sin(np.minimum(np.asarray(distance) / earth_radius, np.pi) / 2)
+
+# =============================================================================
+# Spatial Index
+# =============================================================================
+class SpatialIndex:
+    """
+    KD-tree over points on the unit sphere that accepts new points. New points
+    are kept in a buffer that is searched by brute force, and the tree is
+    rebuilt once the buffer grows beyond rebuild_size points.
+    """
+
+    def __init__(self, points, rebuild_size=1024):
+        if cKDTree is None:
+            raise ImportError("Spatial index requires scipy.")
+        self.points = np.asarray(points, dtype=float).reshape(-1, 3)
+        self.rebuild_size = rebuild_size
+        self.tree = cKDTree(self.points)
+        self.tree_size = len(self.points)
+
+    def add(self, points):
+        self.points = np.concatenate([self.points, np.asarray(points, dtype=float).reshape(-1, 3)])
+        if len(self.points) - self.tree_size > self.rebuild_size:
+            self.tree = cKDTree(self.points)
+            self.tree_size = len(self.points)
+
+    def nearest(self, sites, chunk_size=4096):
+        """
+        Chord distances to the nearest points and their positions.
+        """
+        distances = np.full(len(sites), np.inf)
+        positions = np.zeros(len(sites), dtype=np.int64)
+        if self.tree_size:
+            distances, positions = self.tree.query(sites, workers=-1)
+        buffer = self.points[self.tree_size:]
+        for start in range(0, len(sites), chunk_size):
+            if not len(buffer):
+                break
+            chunk = sites[start:start+chunk_size]
+            buffer_distances = np.linalg.norm(chunk[:, None, :] - buffer[None, :, :], axis=-1)
+            closest = np.argmin(buffer_distances, axis=1)
+            closest_distances = buffer_distances[np.arange(len(chunk)), closest]
+            closer = closest_distances < distances[start:start+chunk_size]
+            distances[start:start+chunk_size][closer] = closest_distances[closer]
+            positions[start:start+chunk_size][closer] = closest[closer] + self.tree_size
+        return distances, positions
+
+    def count_within(self, sites, chord_radius, chunk_size=4096):
+        """
+        Number of points within the chord radius of every site.
+        """
+        counts = np.zeros(len(sites), dtype=np.int64)
+        if self.tree_size:
+            counts = self.tree.query_ball_point(sites, chord_radius, return_length=True, workers=-1).astype(np.int64)
+        buffer = self.points[self.tree_size:]
+        for start in range(0, len(sites), chunk_size):
+            if not len(buffer):
+                break
+            chunk = sites[start:start+chunk_size]
+            counts[start:start+chunk_size] += np.count_nonzero(np.linalg.norm(chunk[:, None, :] - buffer[None, :, :], axis=-1) <= chord_radius, axis=1)
+        return counts
+
+# =============================================================================
+# Proximity Criteria
+# =============================================================================
+class ProximityCriteria:
+    """
+    Proximity criteria of candidate sites derived from coordinates: distance
+    to the nearest offshore wind farm, number of offshore wind farms within a
+    radius, and the nearest community with its distance. Criteria are updated
+    incrementally: new farms or communities are compared with all sites, but
+    only against the new features, and new sites are queried against the
+    spatial indexes of all features. Sites are kept in the row order of the
+    data, so the criteria of an updated data follow its rows.
+    """
+
+    def __init__(self, latitudes, longitudes, radius=50.):
+        self.sites = unit_vectors(latitudes, longitudes)
+        self.chord_radius = km_to_chord(radius)
+        self.farms = None
+        self.communities = None
+        self.community_names = np.zeros(0, dtype=object)
+        self.farm_distances = np.full(len(self.sites), np.inf)
+        self.farm_counts = np.zeros(len(self.sites), dtype=np.int64)
+        self.community_distances = np.full(len(self.sites), np.inf)
+        self.nearest_communities = np.full(len(self.sites), -1, dtype=np.int64)
+
+    def add_farms(self, latitudes, longitudes):
+        points = unit_vectors(latitudes, longitudes)
+        if not len(points):
+            return
+        new_farms = SpatialIndex(points)
+        distances, _ = new_farms.nearest(self.sites)
+        self.farm_distances = np.minimum(self.farm_distances, distances)
+        self.farm_counts += new_farms.count_within(self.sites, self.chord_radius)
+        if self.farms is None:
+            self.farms = new_farms
+        else:
+            self.farms.add(points)
+
+    def add_communities(self, latitudes, longitudes, names):
+        points = unit_vectors(latitudes, longitudes)
+        if not len(points):
+            return
+        distances, positions = SpatialIndex(points).nearest(self.sites)
+        closer = distances < self.community_distances
+        self.community_distances[closer] = distances[closer]
+        self.nearest_communities[closer] = positions[closer] + len(self.community_names)
+        self.community_names = np.concatenate([self.community_names, np.asarray(names, dtype=object)])
+        if self.communities is None:
+            self.communities = SpatialIndex(points)
+        else:
+            self.communities.add(points)
+
+    def _query_sites(self, sites):
+        farm_distances = np.full(len(sites), np.inf)
+        farm_counts = np.zeros(len(sites), dtype=np.int64)
+        community_distances = np.full(len(sites), np.inf)
+        nearest_communities = np.full(len(sites), -1, dtype=np.int64)
+        if self.farms is not None:
+            farm_distances, _ = self.farms.nearest(sites)
+            farm_counts = self.farms.count_within(sites, self.chord_radius)
+        if self.communities is not None:
+            community_distances, nearest_communities = self.communities.nearest(sites)
+        return farm_distances, farm_counts, community_distances, nearest_communities
+
+    def add_sites(self, latitudes, longitudes):
+        sites = unit_vectors(latitudes, longitudes)
+        farm_distances, farm_counts, community_distances, nearest_communities = self._query_sites(sites)
+        self.sites = np.concatenate([self.sites, sites])
+        self.farm_distances = np.concatenate([self.farm_distances, farm_distances])
+        self.farm_counts = np.concatenate([self.farm_counts, farm_counts])
+        self.community_distances = np.concatenate([self.community_distances, community_distances])
+        self.nearest_communities = np.concatenate([self.nearest_communities, nearest_communities])
+
+    def move_sites(self, positions, latitudes, longitudes):
+        """
+        Query sites at the given positions again after their coordinates
+        changed.
+        """
+        sites = unit_vectors(latitudes, longitudes)
+        self.sites[positions] = sites
+        (self.farm_distances[positions], self.farm_counts[positions],
+         self.community_distances[positions], self.nearest_communities[positions]) = self._query_sites(sites)
+
+    def keep_sites(self, kept):
+        """
+        Drop sites of deleted locations (kept is a boolean mask of all sites).
+        """
+        self.sites = self.sites[kept]
+        self.farm_distances = self.farm_distances[kept]
+        self.farm_counts = self.farm_counts[kept]
+        self.community_distances = self.community_distances[kept]
+        self.nearest_communities = self.nearest_communities[kept]
+
+    def criteria(self, index=None):
+        """
+        Data frame of the derived criteria (distances in km).
+        """
+        criteria = pd.DataFrame(index=index)
+        if self.farms is not None:
+            criteria["distance_from_offshore_wind_farm"] = chord_to_km(self.farm_distances)
+            criteria["current_offshore_wind_farms"] = self.farm_counts
+        if self.communities is not None:
+            criteria["community_name"] = self.community_names[self.nearest_communities]
+            criteria["distance_from_community"] = chord_to_km(self.community_distances)
+        return criteria
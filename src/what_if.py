@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+@author: Aneta Kartali
+"""
+
+import numpy as np
+import pandas as pd
+
+from decision_making import top_k
+
+# =============================================================================
+# What-If Ranking
+# =============================================================================
+class WhatIfRanking:
+    """
+    TOPSIS ranking of a decision matrix that can be re-ranked quickly after
+    edits of its values. With vector normalization, the squared distance of
+    an alternative to an ideal solution is a sum of per-criterion terms
+    (w_j / norm_j)^2 * (x_ij - ideal_j)^2. Distances of all alternatives are
+    kept, so an edit only recomputes the norm and the ideal values of edited
+    criteria and replaces their terms, instead of scoring the whole matrix
+    again. Edited criteria are re-scored for all alternatives, since their
+    norm (and possibly their ideal values) change with any edited value.
+    Ranks of alternatives of interest are counted from the number of higher
+    scores, and scores are sorted only when edits are committed.
+    """
+
+    def __init__(self, selected_data, weights, types):
+        self.index = selected_data.index
+        self.criteria = list(selected_data.columns)
+        self.X = selected_data.to_numpy(dtype=float, copy=True)
+        self.weights = np.asarray(weights, dtype=float)
+        self.maximize = np.array([typ == "max" for typ in types])
+        self.rescore()
+
+    def rescore(self):
+        """
+        Score the whole decision matrix from scratch.
+        """
+        self.sum_squares = np.sum(self.X * self.X, axis=0)
+        self.max_values = self.X.max(axis=0)
+        self.min_values = self.X.min(axis=0)
+        scale, p_ideal, n_ideal = self._column_parameters(self.sum_squares, self.max_values, self.min_values)
+        self.p_distances = np.sum(scale * (self.X - p_ideal) ** 2, axis=1)
+        self.n_distances = np.sum(scale * (self.X - n_ideal) ** 2, axis=1)
+        self.scores = self._closeness(self.p_distances, self.n_distances)
+        self.sorted_scores = sorted_scores(self.scores)
+
+    def _column_parameters(self, sum_squares, max_values, min_values, columns=slice(None)):
+        # Weight of squared differences of raw values, and ideal solutions in
+        # raw values
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = (self.weights[columns] / sum_squares ** (1/2)) ** 2
+        maximize = self.maximize[columns]
+        p_ideal = np.where(maximize, max_values, min_values)
+        n_ideal = np.where(maximize, min_values, max_values)
+        return scale, p_ideal, n_ideal
+
+    @staticmethod
+    def _closeness(p_distances, n_distances):
+        p_distances = np.sqrt(np.maximum(p_distances, 0))
+        n_distances = np.sqrt(np.maximum(n_distances, 0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return n_distances / (p_distances + n_distances)
+
+    def edit(self, edits):
+        """
+        Apply edits to a copy of the edited columns. Every edit is a dictionary
+        with a criterion, an operation ("scale", "add" or "set"), a value, and
+        rows (labels of the edited alternatives, all alternatives if None).
+        Edits are applied in order. Returns the edited criteria positions, their
+        new columns, and positions of individually edited alternatives.
+        """
+        columns = {}
+        edited_rows = [np.zeros(0, dtype=np.int64)]
+        for edit in edits:
+            j = self.criteria.index(edit["criterion"])
+            column = columns.setdefault(j, self.X[:, j].copy())
+            if edit.get("rows") is None:
+                rows = slice(None)
+            else:
+                rows = self.index.get_indexer(list(edit["rows"]))
+                if np.any(rows < 0):
+                    raise KeyError(f"Locations {list(np.asarray(edit['rows'])[rows < 0])} not found.")
+                edited_rows.append(rows)
+            if edit["operation"] == "scale":
+                column[rows] *= edit["value"]
+            elif edit["operation"] == "add":
+                column[rows] += edit["value"]
+            elif edit["operation"] == "set":
+                column[rows] = edit["value"]
+            else:
+                raise ValueError(f"Invalid operation: {edit['operation']}")
+        positions = np.array(sorted(columns), dtype=np.int64)
+        new_columns = np.stack([columns[j] for j in positions], axis=1) if len(positions) else np.empty((len(self.X), 0))
+        return positions, new_columns, np.unique(np.concatenate(edited_rows))
+
+    def what_if(self, edits, k=10, commit=False):
+        """
+        Re-rank alternatives after the edits, by replacing distance terms of
+        the edited criteria only. The ranking is kept unless commit is True.
+        Returns scores and ranks before and after the edits of individually
+        edited alternatives and of the k best alternatives (before or after).
+        """
+        positions, new_columns, edited_rows = self.edit(edits)
+        old_columns = self.X[:, positions]
+
+        # Norms and ideal values of edited criteria
+        new_sum_squares = np.sum(new_columns * new_columns, axis=0)
+        new_max_values = new_columns.max(axis=0)
+        new_min_values = new_columns.min(axis=0)
+        old_scale, old_p_ideal, old_n_ideal = self._column_parameters(self.sum_squares[positions], self.max_values[positions], self.min_values[positions], positions)
+        new_scale, new_p_ideal, new_n_ideal = self._column_parameters(new_sum_squares, new_max_values, new_min_values, positions)
+
+        # Replace the distance terms of edited criteria
+        p_distances = self.p_distances - (old_columns - old_p_ideal) ** 2 @ old_scale + (new_columns - new_p_ideal) ** 2 @ new_scale
+        n_distances = self.n_distances - (old_columns - old_n_ideal) ** 2 @ old_scale + (new_columns - new_n_ideal) ** 2 @ new_scale
+        scores = self._closeness(p_distances, n_distances)
+
+        k = min(k, len(scores))
+        changed = np.unique(np.concatenate([edited_rows, top_k(self.scores, k)[0], top_k(scores, k)[0]]))
+        previous_ranks = score_ranks(self.sorted_scores, self.scores[changed])
+        new_ranks = count_ranks(scores, scores[changed])
+        changes = pd.DataFrame({"previous_Ranking": self.scores[changed],
+                                "Ranking": scores[changed],
+                                "previous_rank": previous_ranks,
+                                "rank": new_ranks,
+                                "rank_change": previous_ranks - new_ranks},
+                               index=self.index[changed])
+        changes = changes.sort_values("rank", kind="stable")
+
+        if commit:
+            self.X[:, positions] = new_columns
+            self.sum_squares[positions] = new_sum_squares
+            self.max_values[positions] = new_max_values
+            self.min_values[positions] = new_min_values
+            self.p_distances = p_distances
+            self.n_distances = n_distances
+            self.scores = scores
+            self.sorted_scores = sorted_scores(scores)
+        return changes
+
+    def best(self, k):
+        """
+        The k best ranked alternatives with their scores.
+        """
+        positions, scores = top_k(self.scores, k)
+        return pd.DataFrame({"Ranking": scores, "rank": score_ranks(self.sorted_scores, scores)}, index=self.index[positions])
+
+
+def sorted_scores(scores):
+    """
+    Scores sorted in ascending order, with undefined scores as the worst.
+    """
+    return np.sort(np.nan_to_num(scores, nan=-np.inf))
+
+
+def score_ranks(sorted_scores, scores):
+    """
+    Ranks of scores (1 is the best) among all sorted scores. Equal scores
+    share the best of their ranks.
+    """
+    scores = np.nan_to_num(scores, nan=-np.inf)
+    return len(sorted_scores) - np.searchsorted(sorted_scores, scores, side="right") + 1
+
+
+def count_ranks(all_scores, scores):
+    """
+    Ranks of scores (1 is the best) among all scores, from the number of
+    higher scores, counted in one pass over all scores without sorting them
+    (only the scores of interest are sorted). Equal scores share the best of
+    their ranks.
+    """
+    all_scores = np.nan_to_num(all_scores, nan=-np.inf)
+    scores = np.nan_to_num(scores, nan=-np.inf)
+    order = np.argsort(scores, kind="stable")
+    # Number of scores of interest below every score, and the number of all
+    # scores above every score of interest
+    below = np.searchsorted(scores[order], all_scores, side="left")
+    above = np.cumsum(np.bincount(below, minlength=len(scores) + 1)[::-1])[::-1]
+    ranks = np.empty(len(scores), dtype=np.int64)
+    ranks[order] = above[1:] + 1
+    return ranks
+